@@ -0,0 +1,416 @@
+"""Measure the latency, throughput and memory usage of rank card rendering.
+
+Run this from the repository root with `python -m benchmarks.render`. Pass `--help` for the available options.
+
+Each render goes through the same path that the bot's `rank` command does (`common.get_guild_member_card`, then
+`common.render_card` at interactive priority), including the card cache and render queue, for a set of synthetic members. The database is replaced by a stand-in that answers
+from memory, and avatars and static assets are served from a local web server, so that neither skews the results. The
+browser backend needs Firefox and geckodriver to be installed; it's skipped (with a warning) if drivers can't be spawned.
+
+Every backend is measured at each of the `--drivers` sizes (standing in for `limits.webdrivers`), starting with an empty
+card cache each time:
+
+- The cold pass renders a card for every member, and is where latency, throughput and memory growth are measured.
+- The warm pass asks for the same cards again, so every one of them is served from the card cache.
+
+Memory is reported as the resident set size of this process and every process it has spawned (i.e the web drivers),
+as read from `/proc`, so this is only supported on Linux. Pass `--json` to write the results somewhere in a
+machine-readable form, so that they can be compared between runs.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from types import SimpleNamespace
+from typing import AsyncIterator
+
+from aiohttp import ClientSession, web
+from PIL import Image
+from selenium.webdriver import FirefoxOptions
+from yarl import URL
+
+from tabby.rendering import (
+    AvatarCache,
+    BrowserBackend,
+    CachedBackend,
+    DocumentServer,
+    NativeBackend,
+    RenderBackend,
+    RenderBundle,
+    RenderPriority,
+    RenderQueue,
+    SvgBackend,
+    TieredCache,
+    render_source,
+)
+from tabby.resources import STATIC_DIRECTORY
+from tabby.util import DriverPool, process_tree_memory
+from tabby.web import common
+
+
+LOGGER = logging.getLogger("benchmarks.render")
+HOST = "127.0.0.1"
+AVATAR_COUNT = 16
+GUILD_ID = 1
+CARD_CACHE_MEMORY = 256 * 2**20
+
+
+class StandInConnection:
+    """Answers the rank card query with synthetic values, standing in for a database connection."""
+
+    async def fetchrow(self, query: str, guild_id: int, member_id: int, *args) -> dict:
+        # Values vary between members, so that every member's card is different.
+        return {
+            "guild_id": guild_id,
+            "user_id": member_id,
+            "total_xp": 1000 + member_id * 37,
+            "leaderboard_position": member_id,
+            "previous_position": member_id + (member_id % 7) - 3,
+        }
+
+
+class StandInBot:
+    """Has just enough of `Tabby` for `common.get_guild_member_card` and `common.render_card`, with members and a
+    database held in memory.
+    """
+
+    renderer: CachedBackend
+    vector_renderer: CachedBackend
+
+    _users: dict[int, SimpleNamespace]
+
+    def __init__(self, backend: RenderBackend, *, concurrency: int, base_url: URL, members: int) -> None:
+        queue = RenderQueue(backend, concurrency=concurrency, max_waiting=members, deadline=3600)
+        self.renderer = CachedBackend(queue, TieredCache(memory_budget=CARD_CACHE_MEMORY))
+        self.vector_renderer = CachedBackend(backend, TieredCache(memory_budget=CARD_CACHE_MEMORY))
+        # Avatars repeat, since there are far fewer of them than members. That's fine, since the card cache doesn't
+        # care, and it keeps the asset server from becoming the bottleneck.
+        self._users = {
+            member_id: SimpleNamespace(
+                display_avatar=SimpleNamespace(url=str(base_url / "avatars" / f"{member_id % AVATAR_COUNT}.png")),
+                display_name=f"Benchmark member {member_id}",
+                discriminator=member_id % 10_000,
+            )
+            for member_id in range(1, members + 1)
+        }
+
+    def get_user(self, user_id: int) -> SimpleNamespace | None:
+        return self._users.get(user_id)
+
+    async def fetch_user(self, user_id: int) -> SimpleNamespace:
+        raise LookupError(f"unknown member {user_id}")
+
+    @contextlib.asynccontextmanager
+    async def db(self) -> AsyncIterator[StandInConnection]:
+        yield StandInConnection()
+
+
+@dataclasses.dataclass(slots=True)
+class Latencies:
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+    @classmethod
+    def of(cls, samples: list[float]) -> "Latencies":
+        percentiles = statistics.quantiles(samples, n=100, method="inclusive")
+
+        return cls(p50_ms=percentiles[49] * 1000, p95_ms=percentiles[94] * 1000, p99_ms=percentiles[98] * 1000)
+
+
+@dataclasses.dataclass(slots=True)
+class Result:
+    backend: str
+    drivers: int
+    renders: int
+    cold: Latencies
+    warm: Latencies
+    # In cold renders per second.
+    throughput: float
+    rss_before_mb: float
+    rss_after_mb: float
+
+    @property
+    def rss_per_render_kb(self) -> float:
+        return (self.rss_after_mb - self.rss_before_mb) * 1024 / self.renders
+
+
+async def start_asset_server(port: int) -> web.AppRunner:
+    """Serve placeholder avatars and the contents of the static directory, standing in for Discord's CDN."""
+
+    avatar = BytesIO()
+    Image.new("RGB", (256, 256), (0xE8, 0xB4, 0x8E)).save(avatar, format="PNG")
+    avatar_bytes = avatar.getvalue()
+
+    async def get_avatar(_: web.Request) -> web.Response:
+        return web.Response(body=avatar_bytes, content_type="image/png")
+
+    app = web.Application()
+    app.router.add_get("/avatars/{name}", get_avatar)
+    app.router.add_static("/", STATIC_DIRECTORY)
+
+    # Logging every avatar download would drown out the results.
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, HOST, port).start()
+
+    return runner
+
+
+async def measure(bot: StandInBot, backend: RenderBackend, *, drivers: int, args: argparse.Namespace) -> Result:
+    vector = isinstance(backend, SvgBackend)
+
+    async def _render(member_id: int):
+        card = await common.get_guild_member_card(GUILD_ID, member_id, bot)  # type: ignore
+
+        # SVGs aren't rendered for Discord, so they're fetched the way the web application fetches them instead.
+        if vector:
+            await bot.vector_renderer.render(card)
+        else:
+            with render_source(guild_id=GUILD_ID, priority=RenderPriority.interactive):
+                await common.render_card(card, bot)  # type: ignore
+
+    async def _run(member_ids: range) -> tuple[list[float], float]:
+        latencies: list[float] = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def _timed(member_id: int):
+            async with semaphore:
+                started = time.perf_counter()
+                await _render(member_id)
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(_timed(member_id) for member_id in member_ids))
+
+        return latencies, time.perf_counter() - started
+
+    # Warmup renders use members of their own, so that they don't warm the card cache for the cold pass.
+    for member_id in range(args.renders + 1, args.renders + args.warmup + 1):
+        await _render(member_id)
+
+    gc.collect()
+    rss_before = process_tree_memory(os.getpid())
+    cold, elapsed = await _run(range(1, args.renders + 1))
+    rss_after = process_tree_memory(os.getpid())
+    warm, _ = await _run(range(1, args.renders + 1))
+
+    return Result(
+        backend=backend.name,
+        drivers=drivers,
+        renders=args.renders,
+        cold=Latencies.of(cold),
+        warm=Latencies.of(warm),
+        throughput=args.renders / elapsed,
+        rss_before_mb=rss_before / 2**20,
+        rss_after_mb=rss_after / 2**20,
+    )
+
+
+async def build_browser_backend(
+    drivers: DriverPool,
+    avatars: AvatarCache,
+    bundle: RenderBundle,
+    *,
+    persistent: bool,
+    documents: DocumentServer | None,
+    executor: ThreadPoolExecutor,
+    spawn_timeout: float,
+) -> BrowserBackend | None:
+    options = FirefoxOptions()
+    options.add_argument("-headless")
+
+    # The pool keeps retrying failed spawns in the background, so we need to give up on it ourselves.
+    try:
+        await asyncio.wait_for(drivers.setup(options=options), timeout=spawn_timeout)
+    except asyncio.TimeoutError:
+        LOGGER.warning("web drivers didn't spawn within %d seconds; skipping the browser backend", spawn_timeout)
+        return None
+
+    return BrowserBackend(drivers, avatars, bundle, persistent=persistent, documents=documents, executor=executor)
+
+
+def build_avatar_cache(session: ClientSession, args: argparse.Namespace) -> AvatarCache:
+    # With `--no-avatar-cache`, every render downloads its avatar, which is how things used to work.
+    memory_budget = 16 * 2**20 if args.avatar_cache else 0
+
+    return AvatarCache(session, TieredCache(memory_budget=memory_budget))
+
+
+async def run_backend(
+    name: str,
+    size: int,
+    session: ClientSession,
+    base_url: URL,
+    args: argparse.Namespace,
+) -> Result | None:
+    # Everything is built from scratch for each run, so that no run inherits a warm cache (or driver) from another.
+    avatars = build_avatar_cache(session, args)
+    executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="benchmark-render")
+
+    async with contextlib.AsyncExitStack() as stack:
+        stack.callback(executor.shutdown)
+        backend: RenderBackend | None
+
+        if name == "native":
+            backend = NativeBackend(avatars, executor=executor)
+        elif name == "svg":
+            backend = SvgBackend(avatars)
+        else:
+            # Every driver is spawned up front, so that spawning doesn't count towards render times.
+            drivers = DriverPool(min_size=size, max_size=size)
+            stack.push_async_callback(drivers.close)
+            # Without a self-contained bundle, the page loads its stylesheet and assets from the local asset server,
+            # which is how things used to work.
+            bundle = RenderBundle.load() if args.bundle else RenderBundle.linked(base_url)
+            # Without a document server, pages are loaded from `data:` URLs, which is how things used to work.
+            documents = DocumentServer() if args.documents else None
+
+            if documents is not None:
+                stack.push_async_callback(documents.close)
+
+            backend = await build_browser_backend(
+                drivers,
+                avatars,
+                bundle,
+                persistent=args.persistent,
+                documents=documents,
+                executor=executor,
+                spawn_timeout=args.spawn_timeout,
+            )
+
+        if backend is None:
+            return None
+
+        bot = StandInBot(backend, concurrency=size, base_url=base_url, members=args.renders + args.warmup)
+        result = await measure(bot, backend, drivers=size, args=args)
+
+        if name == "browser":
+            state = drivers.state()
+            LOGGER.info("driver pool: %d recycled, %d found dead", state.recycled, state.dead)
+
+        return result
+
+
+def print_results(results: list[Result]):
+    header = (
+        f"{'backend':<10}{'drivers':>8}{'renders':>9}{'cold p50/p95/p99 (ms)':>24}{'warm p50/p95/p99 (ms)':>24}"
+        f"{'renders/s':>11}{'RSS (MB)':>18}{'KB/render':>11}"
+    )
+    print(header)
+
+    for result in results:
+        cold = f"{result.cold.p50_ms:.1f}/{result.cold.p95_ms:.1f}/{result.cold.p99_ms:.1f}"
+        warm = f"{result.warm.p50_ms:.2f}/{result.warm.p95_ms:.2f}/{result.warm.p99_ms:.2f}"
+        rss = f"{result.rss_before_mb:.1f} -> {result.rss_after_mb:.1f}"
+        print(
+            f"{result.backend:<10}{result.drivers:>8}{result.renders:>9}{cold:>24}{warm:>24}"
+            f"{result.throughput:>11.1f}{rss:>18}{result.rss_per_render_kb:>11.1f}"
+        )
+
+
+def write_results(path: Path, results: list[Result], args: argparse.Namespace):
+    report = {
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "options": {key: value for key, value in vars(args).items() if key != "json"},
+        "results": [
+            {**dataclasses.asdict(result), "rss_per_render_kb": result.rss_per_render_kb} for result in results
+        ],
+    }
+
+    path.write_text(json.dumps(report, indent=2))
+
+
+async def main(args: argparse.Namespace):
+    runner = await start_asset_server(args.port)
+    base_url = URL.build(scheme="http", host=HOST, port=args.port)
+    results: list[Result] = []
+
+    async with ClientSession() as session:
+        for name in args.backends:
+            # SVGs are never queued for a driver, so there's nothing to vary.
+            sizes = [1] if name == "svg" else args.drivers
+
+            for size in sizes:
+                LOGGER.info("measuring the %s backend with %d drivers", name, size)
+                result = await run_backend(name, size, session, base_url, args)
+
+                if result is None:
+                    break
+
+                results.append(result)
+
+    await runner.cleanup()
+    print_results(results)
+
+    if args.json is not None:
+        write_results(args.json, results, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=["native", "browser", "svg"],
+        default=["native", "browser", "svg"],
+    )
+    parser.add_argument("--renders", type=int, default=200, help="the number of members to render a card for")
+    parser.add_argument("--concurrency", type=int, default=16, help="the number of requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=10, help="the number of untimed renders to run first")
+    parser.add_argument(
+        "--drivers",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4],
+        help="the number of web drivers (or, for the native backend, render threads) to measure with",
+    )
+    parser.add_argument("--json", type=Path, help="a file to write the results to, as JSON")
+    parser.add_argument(
+        "--avatar-cache",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="whether avatars are cached between renders",
+    )
+    parser.add_argument(
+        "--bundle",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="whether the browser backend inlines its stylesheet, fonts and assets",
+    )
+    parser.add_argument(
+        "--persistent",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="whether the browser backend updates a warm page in place, rather than navigating for every render",
+    )
+    parser.add_argument(
+        "--documents",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="whether the browser backend serves pages from memory, rather than loading them from data: URLs",
+    )
+    parser.add_argument(
+        "--spawn-timeout",
+        type=float,
+        default=60,
+        help="how long to wait for web drivers to spawn before skipping the browser backend",
+    )
+    parser.add_argument("--port", type=int, default=8765, help="the port used by the local asset server")
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(parser.parse_args()))
@@ -6,6 +6,7 @@ from . import (
     config as config,
     ext as ext,
     level as level,
+    rendering as rendering,
     resources as resources,
     routing as routing,
     util as util,
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import ClassVar
 
 import asyncpg
@@ -17,7 +18,21 @@ from discord.ext.commands import Bot, Cog, Context
 from selenium.webdriver import FirefoxOptions
 from yarl import URL
 
-from .config import Config
+from .config import Config, RenderBackendKind
+from .rendering import (
+    AvatarCache,
+    BrowserBackend,
+    CachedBackend,
+    DocumentServer,
+    NativeBackend,
+    RenderBackend,
+    RenderBundle,
+    RenderQueue,
+    SvgBackend,
+    TieredCache,
+    WorkerOptions,
+    WorkerPool,
+)
 from .routing import Application
 from .util import DriverPool, TTLCache
 
@@ -33,6 +48,13 @@ class Tabby(Bot):
     pool: Pool
     session: ClientSession
     webdrivers: DriverPool
+    render_executor: ThreadPoolExecutor
+    avatars: AvatarCache
+    render_workers: WorkerPool | None
+    render_documents: DocumentServer
+    render_queue: RenderQueue
+    renderer: CachedBackend
+    vector_renderer: CachedBackend
     cached_users: TTLCache[int, User]
 
     def __init__(self, *, config: Config, **kwargs) -> None:
@@ -55,9 +77,83 @@ class Tabby(Bot):
         self.config = config
         self.pool = asyncpg.create_pool(**vars(self.config.database))  # type: ignore
         self.session = ClientSession()
-        self.webdrivers = DriverPool()
+
+        # Rendering gets its own threads, so that a burst of rank cards can't starve everything else that uses the
+        # default executor (and vice versa).
+        self.render_executor = ThreadPoolExecutor(
+            max_workers=config.limits.webdrivers,
+            thread_name_prefix="tabby-render",
+        )
+
+        self.webdrivers = DriverPool(
+            min_size=config.limits.webdrivers_min,
+            max_size=config.limits.webdrivers,
+            idle_timeout=config.limits.webdriver_idle_timeout,
+            max_renders=config.limits.webdriver_max_renders,
+            max_memory=config.limits.webdriver_max_memory * 2**20,
+            executor=self.render_executor,
+        )
         self.cached_users = TTLCache(expiry=60 * 120)
 
+        avatar_cache = TieredCache(
+            memory_budget=config.render.avatar_cache_memory,
+            directory=config.render.cache_directory / "avatars",
+            disk_budget=config.render.avatar_cache_disk,
+        )
+
+        self.avatars = AvatarCache(self.session, avatar_cache)
+
+        backend: RenderBackend
+        self.render_workers = None
+        self.render_documents = DocumentServer()
+
+        if config.render.worker_processes > 0:
+            options = WorkerOptions(
+                backend=config.render.backend,
+                avatar_cache_memory=config.render.avatar_cache_memory,
+                avatar_cache_directory=config.render.cache_directory / "avatars",
+                # Workers share the on-disk cache, but each of them keeps their own index of it.
+                avatar_cache_disk=config.render.avatar_cache_disk // config.render.worker_processes,
+                # Each worker has a single driver, so it's either kept around or it isn't.
+                webdriver_min=min(config.limits.webdrivers_min, 1),
+                webdriver_idle_timeout=config.limits.webdriver_idle_timeout,
+                webdriver_max_renders=config.limits.webdriver_max_renders,
+                webdriver_max_memory=config.limits.webdriver_max_memory * 2**20,
+            )
+
+            backend = self.render_workers = WorkerPool(options, size=config.render.worker_processes)
+        elif config.render.backend is RenderBackendKind.browser:
+            backend = BrowserBackend(
+                self.webdrivers,
+                self.avatars,
+                RenderBundle.load(),
+                documents=self.render_documents,
+                executor=self.render_executor,
+            )
+        else:
+            backend = NativeBackend(self.avatars, executor=self.render_executor)
+
+        self.render_queue = RenderQueue(
+            backend,
+            concurrency=config.render.worker_processes or config.limits.webdrivers,
+            max_waiting=config.limits.render_queue_size,
+            deadline=config.limits.render_deadline,
+            guild_rate=config.limits.guild_render_rate,
+            guild_burst=config.limits.guild_render_burst,
+        )
+
+        card_cache = TieredCache(
+            memory_budget=config.render.cache_memory,
+            directory=config.render.cache_directory / "cards",
+            disk_budget=config.render.cache_disk,
+        )
+
+        # Cached cards don't need a render slot, so the cache sits in front of the queue.
+        self.renderer = CachedBackend(self.render_queue, card_cache)
+
+        # Drawing an SVG is just filling in a template, so there's no need for it to wait for a render slot.
+        self.vector_renderer = CachedBackend(SvgBackend(self.avatars), card_cache)
+
     @property
     def web(self) -> Application:
         """The bot's corresponding web application."""
@@ -95,16 +191,25 @@ class Tabby(Bot):
             options = FirefoxOptions()
             options.add_argument("-headless")
 
-            LOGGER.info("spawning %d drivers concurrently", self.config.limits.webdrivers)
+            LOGGER.info("spawning %d drivers concurrently", self.config.limits.webdrivers_min)
 
-            await self.webdrivers.setup(
-                driver_count=self.config.limits.webdrivers,
-                options=options,
-            )
+            await self.webdrivers.setup(options=options)
 
             LOGGER.info("all drivers spawned successfully")
 
-        asyncio.create_task(_build_drivers())
+        async def _start_render_workers(workers: WorkerPool):
+            LOGGER.info("starting %d render workers concurrently", self.config.render.worker_processes)
+
+            await workers.start()
+
+            LOGGER.info("all render workers started successfully")
+
+        # Drivers are expensive, so there's no point spawning any unless they're actually going to be used. Render
+        # workers spawn their own.
+        if self.render_workers is not None:
+            asyncio.create_task(_start_render_workers(self.render_workers))
+        elif self.config.render.backend is RenderBackendKind.browser:
+            asyncio.create_task(_build_drivers())
 
     async def close(self) -> None:
         await super().close()
@@ -114,6 +219,13 @@ class Tabby(Bot):
 
         await self.pool.close()
         await self.session.close()
+        await self.webdrivers.close()
+        await self.render_documents.close()
+
+        if self.render_workers is not None:
+            await self.render_workers.close()
+
+        self.render_executor.shutdown(wait=False, cancel_futures=True)
 
     async def fetch_user(self, user_id: int, /, *, force: bool = False) -> User:
         """Fetch a `User` instance from the API.
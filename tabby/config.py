@@ -1,12 +1,15 @@
 from __future__ import annotations
 
+import enum
 import logging
 import os
 import re
+import tempfile
+from datetime import time
 from re import Match
 from pathlib import Path
 
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel, Field, ValidationError
 
 from .util import FernetSecret
 
@@ -21,10 +24,131 @@ class Config(BaseModel):
     level: LevelConfig
     web: WebConfig
     limits: LimitsConfig
+    render: RenderConfig = Field(default_factory=lambda: RenderConfig())
 
 
 class LimitsConfig(BaseModel):
     webdrivers: int
+    """The maximum number of web drivers to spawn, which is also the number of rank cards that can be rendered at once.
+
+    Rendering happens on a dedicated thread pool of this size, regardless of which rendering backend is in use. Drivers
+    are only spawned when they're needed, so this many drivers only exist while rank cards are in high demand.
+    """
+
+    webdrivers_min: int = 0
+    """The number of web drivers that are kept around while idle.
+
+    The default of 0 means that no drivers (and no browsers) are running at all while nobody is asking for rank cards,
+    at the cost of the first card after a quiet period taking a few extra seconds to render.
+    """
+
+    webdriver_idle_timeout: float = 300
+    """The number of seconds a web driver may sit idle before it's torn down."""
+
+    render_queue_size: int = 32
+    """The number of rank cards that can be waiting to render before new requests are turned away.
+
+    Requests that are turned away receive a "busy" response immediately, rather than waiting behind everybody else.
+    """
+
+    render_deadline: float = 10
+    """The number of seconds a rank card may wait to start rendering before giving up."""
+
+    guild_render_rate: float = 1
+    """The number of rank cards per second each guild may have rendered, on average.
+
+    Cards that were already cached don't count. Guilds that exceed this are told to try again later, and rendering slots
+    are shared out between guilds in turn, so that one busy guild can't keep everybody else waiting. Set this to 0 to
+    disable the limit (slots are still shared out fairly).
+    """
+
+    guild_render_burst: int = 10
+    """The number of rank cards each guild may have rendered in a burst, before `guild_render_rate` applies."""
+
+    webdriver_max_renders: int = 1000
+    """The number of rank cards a web driver may render before it's replaced with a fresh one."""
+
+    webdriver_max_memory: int = 1024
+    """The amount of memory (in megabytes) a web driver may use before it's replaced with a fresh one.
+
+    This includes the memory used by the browser process that the driver controls.
+    """
+
+
+class RenderBackendKind(str, enum.Enum):
+    native = "native"
+    browser = "browser"
+
+
+class RenderConfig(BaseModel):
+    backend: RenderBackendKind = RenderBackendKind.native
+    """The backend used to draw rank cards.
+
+    The default, "native", draws cards directly using Pillow. This is fast and lightweight, but depends on the Noto Sans
+    Display font being installed to look its best.
+
+    Setting this to "browser" renders cards by screenshotting a page in headless Firefox instead, which requires Firefox
+    and geckodriver to be installed. Web drivers are only spawned when this backend is in use.
+    """
+
+    worker_processes: int = 0
+    """The number of worker processes that rank cards are rendered in.
+
+    By default, cards are rendered in the bot's own process. Setting this above 0 moves rendering into a pool of worker
+    processes instead, which keeps a misbehaving browser (or render) from affecting the rest of the bot. Each worker
+    renders one card at a time (with its own web driver, if the browser backend is in use), so this replaces
+    `limits.webdrivers` as the number of cards that can be rendered at once. Workers that crash are restarted
+    automatically.
+    """
+
+    prerender_top: int = 10
+    """The number of members at the top of each guild's leaderboard whose rank cards are rendered ahead of time.
+
+    Cards are only pre-rendered once something visible on them has changed, and only while there's render capacity to
+    spare, so that asking for one is usually answered straight from the cache. Set this to 0 to disable.
+    """
+
+    prerender_active_window: float = 1800
+    """How long (in seconds) after earning XP a member's rank card is kept pre-rendered for.
+
+    Members who are chatting are the ones most likely to ask for their rank. Set this to 0 to disable.
+    """
+
+    prerender_interval: float = 30
+    """How often (in seconds) rank cards are pre-rendered.
+
+    Only guilds where somebody has earned XP since the last time around are looked at.
+    """
+
+    cache_memory: int = 32 * 2**20
+    """The maximum amount of memory (in bytes) used to cache rendered rank cards.
+
+    Cards are cached by their contents, so a member's card is only rendered again once something visible on it changes.
+    """
+
+    cache_disk: int = 256 * 2**20
+    """The maximum amount of disk space (in bytes) used to cache rendered rank cards.
+
+    Set this to 0 to disable the on-disk cache entirely.
+    """
+
+    avatar_cache_memory: int = 16 * 2**20
+    """The maximum amount of memory (in bytes) used to cache avatars for rank cards.
+
+    Avatars are downloaded once, resized, and reused until the member changes their avatar.
+    """
+
+    avatar_cache_disk: int = 64 * 2**20
+    """The maximum amount of disk space (in bytes) used to cache avatars for rank cards.
+
+    Set this to 0 to disable the on-disk cache entirely.
+    """
+
+    cache_directory: Path = Path(tempfile.gettempdir()) / "tabby"
+    """The directory that rendered rank cards and avatars are cached in.
+
+    Each cache uses its own subdirectory.
+    """
 
 
 class BotConfig(BaseModel):
@@ -90,6 +214,22 @@ class LevelConfig(BaseModel):
     This value should usually be set to 60 to match the behaviour of Mee6.
     """
 
+    daily_xp_retention: int = Field(62, ge=7)
+    """The number of days that daily XP buckets are kept for, before being compacted into monthly buckets.
+
+    Daily buckets are used for weekly and monthly leaderboards. Once compacted, a day's XP still counts towards its
+    month, but can no longer be attributed to a specific week - so this value must be at least 7.
+    """
+
+    rank_snapshot_time: time = time(0, 0)
+    """The time of day (in UTC) at which each guild's leaderboard ordering is snapshotted.
+
+    Snapshots are used to show how far members have moved on the leaderboard since the most recent one was taken.
+    """
+
+    rank_snapshot_retention: int = 30
+    """The number of days that leaderboard snapshots are kept for."""
+
 
 class WebConfig(BaseModel):
     host: str
@@ -121,6 +261,13 @@ class WebConfig(BaseModel):
     portal, as long as the URL you configure here matches one of them.
     """
 
+    live_updates_per_second: float = Field(2.0, gt=0)
+    """The maximum number of times per second that live leaderboard updates are pushed to each guild's watchers.
+
+    XP changes that happen between pushes are batched together, so lowering this value reduces traffic during busy
+    periods at the cost of a less "live" leaderboard.
+    """
+
     serve_static_files: bool = True
     """Whether the web application should serve static files.
 
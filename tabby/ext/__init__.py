@@ -7,8 +7,10 @@ from ..bot import Tabby, TabbyCog
 LOGGER = logging.getLogger(__name__)
 EXTENSIONS = [
     "tabby.ext.autoroles",
+    "tabby.ext.groups",
     "tabby.ext.levels",
     "tabby.ext.meta",
+    "tabby.ext.prerender",
     "tabby.ext.silly",
 ]
 
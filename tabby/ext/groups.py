@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import logging
+
+from discord.ext import commands
+from discord.ext.commands import Context
+
+from . import register_handlers
+from ..bot import TabbyCog
+from ..web import common
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Groups(TabbyCog):
+    @commands.guild_only()
+    @commands.group(invoke_without_command=True)
+    async def group(self, ctx: Context):
+        """Show, create, join and leave guild groups
+
+        Guild groups combine the leaderboards of several servers into one. Members' XP from every server in a group is
+        added together on the group leaderboard.
+
+        If no subcommand is used, this command displays the group that this server belongs to.
+        """
+
+        assert ctx.guild is not None
+
+        group = await common.get_guild_group(ctx.guild.id, self.bot)
+
+        if group is None:
+            await ctx.send("This server isn't part of a group.")
+            return
+
+        def _format_guild(guild_id: int) -> str:
+            guild = self.bot.get_guild(guild_id)
+
+            return guild.name if guild else f"unknown server #{guild_id}"
+
+        guilds = ", ".join(_format_guild(int(guild_id)) for guild_id in group.guild_ids)
+
+        await ctx.send(f"This server is part of \"{group.name}\" (group #{group.id}). Servers in this group: {guilds}")
+
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    @group.command()
+    async def create(self, ctx: Context, *, name: str):
+        """Create a new group containing this server
+
+        You must have the "manage server" permission to use this command.
+
+        name:
+            The name of the new group.
+        """
+
+        assert ctx.guild is not None
+
+        if await common.get_guild_group(ctx.guild.id, self.bot):
+            await ctx.send("This server is already part of a group. Leave it first if you want to create a new one.")
+            return
+
+        group_id = await common.create_guild_group(ctx.guild.id, name, self.bot)
+
+        await ctx.send(
+            f"Created \"{name}\" (group #{group_id}). Other servers can join it with the \"group join {group_id}\" "
+            "command."
+        )
+
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    @group.command()
+    async def join(self, ctx: Context, group_id: int):
+        """Add this server to an existing group
+
+        You must have the "manage server" permission both in this server and in at least one server that's already part
+        of the group.
+
+        group_id:
+            The ID of the group to join. This is displayed when the group is created, and by the "group" command.
+        """
+
+        assert ctx.guild is not None
+
+        if await common.get_guild_group(ctx.guild.id, self.bot):
+            await ctx.send("This server is already part of a group. Leave it first if you want to join another one.")
+            return
+
+        group = await common.get_group(group_id, self.bot)
+
+        if group is None:
+            await ctx.send(f"Group #{group_id} doesn't exist.")
+            return
+
+        # Without this check, anybody could attach their server to somebody else's group.
+        def _can_manage(guild_id: int) -> bool:
+            guild = self.bot.get_guild(guild_id)
+            member = guild.get_member(ctx.author.id) if guild else None
+
+            return bool(member and member.guild_permissions.manage_guild)
+
+        if not any(_can_manage(int(guild_id)) for guild_id in group.guild_ids):
+            await ctx.send("You need the \"manage server\" permission in one of the group's servers to join it.")
+            return
+
+        await common.join_guild_group(ctx.guild.id, group.id, self.bot)
+
+        await ctx.send(f"This server is now part of \"{group.name}\"")
+
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    @group.command()
+    async def leave(self, ctx: Context):
+        """Remove this server from its group
+
+        You must have the "manage server" permission to use this command. If this server is the last one in its group,
+        the group is deleted.
+        """
+
+        assert ctx.guild is not None
+
+        group = await common.get_guild_group(ctx.guild.id, self.bot)
+
+        if group is None:
+            await ctx.send("This server isn't part of a group.")
+            return
+
+        await common.leave_guild_group(ctx.guild.id, self.bot)
+
+        await ctx.send(f"This server is no longer part of \"{group.name}\"")
+
+
+register_handlers()
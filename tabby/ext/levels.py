@@ -3,11 +3,13 @@ import base64
 from io import BytesIO
 import logging
 import random
-from datetime import timedelta
+from collections import OrderedDict
+from datetime import datetime, time, timedelta, timezone
 
 import discord.utils
-from discord import File, Guild, Member, Message
-from discord.ext import commands
+from aiohttp.web import HTTPNotFound, HTTPServiceUnavailable
+from discord import Embed, File, Guild, Member, Message
+from discord.ext import commands, tasks
 from discord.ext.commands import BucketType, Context, CooldownMapping, Cooldown
 from pydantic import BaseModel
 from yarl import URL
@@ -15,12 +17,18 @@ from yarl import URL
 from . import register_handlers
 from ..bot import Tabby, TabbyCog
 from ..level import LEVELS
+from ..rendering import RenderPriority, render_source
 from ..web import common
-from ..web.template import Templates
 
 
 LOGGER = logging.getLogger(__name__)
 
+# The number of sent rank cards whose attachment URLs are remembered.
+MAX_SENT_CARDS = 1000
+
+# Attachment URLs that are about to expire aren't reused, since they might expire before the embed is even displayed.
+ATTACHMENT_EXPIRY_MARGIN = timedelta(minutes=10)
+
 
 class ImportedLevel(BaseModel):
     guild_id: int
@@ -30,6 +38,8 @@ class ImportedLevel(BaseModel):
 
 class Levels(TabbyCog):
     cooldowns: CooldownMapping
+    # Card cache key -> the URL of the attachment it was last sent as, least recently used first.
+    sent_cards: OrderedDict[str, str]
 
     def __init__(self, bot: Tabby) -> None:
         super().__init__(bot)
@@ -42,6 +52,78 @@ class Levels(TabbyCog):
             BucketType.member,
         )
 
+        self.sent_cards = OrderedDict()
+
+    async def cog_load(self) -> None:
+        self.snapshot_ranks.change_interval(time=self.config.level.rank_snapshot_time)
+        self.snapshot_ranks.start()
+        self.compact_xp_buckets.start()
+
+    async def cog_unload(self) -> None:
+        self.snapshot_ranks.cancel()
+        self.compact_xp_buckets.cancel()
+
+    # The real time of day is taken from the config when the cog is loaded.
+    @tasks.loop(time=time(0, 0))
+    async def snapshot_ranks(self):
+        """Record each guild's current leaderboard ordering, and discard snapshots past the retention period."""
+
+        query = """
+            INSERT INTO tabby.rank_snapshots(guild_id, taken_on, user_ids)
+            SELECT guild_id, $1, array_agg(user_id ORDER BY total_xp DESC, user_id DESC)
+            FROM tabby.levels
+            GROUP BY guild_id
+            ON CONFLICT ON CONSTRAINT rank_snapshots_pkey
+            DO UPDATE SET user_ids = EXCLUDED.user_ids
+        """
+
+        cleanup_query = """
+            DELETE FROM tabby.rank_snapshots
+            WHERE taken_on < $1
+        """
+
+        today = discord.utils.utcnow().date()
+        cutoff = today - timedelta(days=self.config.level.rank_snapshot_retention)
+
+        async with self.db() as connection:
+            async with connection.transaction():
+                status = await connection.execute(query, today)
+                await connection.execute(cleanup_query, cutoff)
+
+        LOGGER.info("took leaderboard snapshots for %s (%s)", today, status)
+
+    @snapshot_ranks.before_loop
+    async def before_snapshot_ranks(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(hours=6)
+    async def compact_xp_buckets(self):
+        """Fold daily XP buckets older than the configured retention period into monthly buckets."""
+
+        query = """
+            WITH compacted AS
+               (DELETE FROM tabby.daily_xp
+                WHERE day < $1
+                RETURNING guild_id, day, user_id, xp)
+            INSERT INTO tabby.monthly_xp(guild_id, month, user_id, xp)
+            SELECT guild_id, date_trunc('month', day)::DATE, user_id, sum(xp)
+            FROM compacted
+            GROUP BY 1, 2, 3
+            ON CONFLICT ON CONSTRAINT monthly_xp_pkey
+            DO UPDATE SET xp = tabby.monthly_xp.xp + EXCLUDED.xp
+        """
+
+        cutoff = discord.utils.utcnow().date() - timedelta(days=self.config.level.daily_xp_retention)
+
+        async with self.db() as connection:
+            status = await connection.execute(query, cutoff)
+
+        LOGGER.info("compacted daily XP buckets from before %s (%s)", cutoff, status)
+
+    @compact_xp_buckets.before_loop
+    async def before_compact_xp_buckets(self):
+        await self.bot.wait_until_ready()
+
     @commands.guild_only()
     @commands.command()
     async def rank(self, ctx: Context[Tabby], who: Member | None = None):
@@ -57,18 +139,62 @@ class Levels(TabbyCog):
             assert isinstance(ctx.author, Member)
             who = ctx.author
 
-        templates = discord.utils.find(
-            lambda middleware: isinstance(middleware, Templates),
-            ctx.bot.web.middlewares,
-        )
+        card = await common.get_guild_member_card(ctx.guild.id, who.id, ctx.bot)
+        key = ctx.bot.renderer.key(card)
 
-        assert isinstance(templates, Templates)
+        # If this exact card was sent before, Discord already has a copy of it - so there's no need to upload it again.
+        if (url := self.sent_cards.get(key)) is not None and not _attachment_expired(url):
+            self.sent_cards.move_to_end(key)
+            await ctx.send(embed=Embed().set_image(url=url))
+            return
+
+        self.sent_cards.pop(key, None)
+
+        try:
+            with render_source(guild_id=ctx.guild.id, priority=RenderPriority.interactive):
+                image = await common.render_card(card, ctx.bot)
+        except HTTPServiceUnavailable as error:
+            await ctx.send(error.text or "I'm a little busy right now. Try again in a few seconds!")
+            return
 
-        image = await common.get_guild_member_profile(ctx.guild.id, who.id, templates, ctx.bot)
         buffer = BytesIO(image)
         buffer.seek(0)
 
-        await ctx.send(file=File(buffer, filename="rank.png"))
+        message = await ctx.send(file=File(buffer, filename="rank.png"))
+
+        if message.attachments:
+            self.sent_cards[key] = message.attachments[0].url
+
+            while len(self.sent_cards) > MAX_SENT_CARDS:
+                self.sent_cards.popitem(last=False)
+
+    @commands.guild_only()
+    @commands.command()
+    async def top(self, ctx: Context[Tabby], count: int = 10):
+        """Display the rank cards of the guild's top members
+
+        count:
+            The number of members to display, up to 25. Defaults to 10.
+        """
+
+        assert ctx.guild is not None
+
+        params = common.LeaderboardImageParams(limit=count)
+
+        try:
+            with render_source(guild_id=ctx.guild.id, priority=RenderPriority.interactive):
+                image = await common.get_guild_leaderboard_image(ctx.guild.id, params, ctx.bot)
+        except HTTPNotFound:
+            await ctx.send("Nobody has earned any XP here yet!")
+            return
+        except HTTPServiceUnavailable as error:
+            await ctx.send(error.text or "I'm a little busy right now. Try again in a few seconds!")
+            return
+
+        buffer = BytesIO(image)
+        buffer.seek(0)
+
+        await ctx.send(file=File(buffer, filename="leaderboard.png"))
 
     @commands.has_guild_permissions(manage_guild=True)
     @commands.command(name="import")
@@ -151,6 +277,9 @@ class Levels(TabbyCog):
                     schema_name="tabby",
                 )
 
+                # Replacing the guild's levels wholesale bypasses the incremental group totals, so they need rebuilding.
+                await common.rebuild_guild_group(connection, ctx.guild.id)
+
         # The last page will have been empty, so we don't want to include it when calculating a total
         extra = f"All levels imported successfully! I recorded the levels of {page * 100:,} members in total"
         await progress.edit(content=f"{base_message}\n\n{extra}")
@@ -170,7 +299,22 @@ class Levels(TabbyCog):
         if self.cooldowns.update_rate_limit(message):
             return
 
+        # The award is also added to today's XP bucket (which is what windowed leaderboards are built from) and to the
+        # totals of the guild's group, if it's part of one. Every write happens in the same statement, so none of them
+        # can drift apart.
         query = """
+            WITH bucket AS
+               (INSERT INTO tabby.daily_xp(guild_id, day, user_id, xp)
+                VALUES ($1, $4, $2, $3)
+                ON CONFLICT ON CONSTRAINT daily_xp_pkey
+                DO UPDATE SET xp = tabby.daily_xp.xp + $3),
+            group_total AS
+               (INSERT INTO tabby.group_levels(group_id, user_id, total_xp)
+                SELECT group_id, $2, $3
+                FROM tabby.guild_group_members
+                WHERE guild_id = $1
+                ON CONFLICT ON CONSTRAINT group_levels_pkey
+                DO UPDATE SET total_xp = tabby.group_levels.total_xp + $3)
             INSERT INTO tabby.levels(guild_id, user_id, total_xp)
             VALUES ($1, $2, $3)
             ON CONFLICT ON CONSTRAINT levels_pkey
@@ -179,14 +323,17 @@ class Levels(TabbyCog):
         """
 
         awarded_xp = random.randint(15, 25)
+        today = message.created_at.date()
 
         LOGGER.info("awarding %d XP to %s in guild %s", awarded_xp, message.author.name, message.guild.id)
 
         async with self.db() as connection:
-            new_xp = await connection.fetchval(query, message.guild.id, message.author.id, awarded_xp)
+            new_xp = await connection.fetchval(query, message.guild.id, message.author.id, awarded_xp, today)
 
         assert new_xp is not None
 
+        self.bot.dispatch("xp_update", message.guild.id, message.author.id, new_xp)
+
         # We need to check if the member crossed a level boundary, and trigger an auto-role event if so.
         before = LEVELS.get(new_xp - awarded_xp)
         after = LEVELS.get(new_xp)
@@ -197,4 +344,19 @@ class Levels(TabbyCog):
             self.bot.dispatch("level", message.author, after.level)
 
 
+def _attachment_expired(url: str) -> bool:
+    # Attachment URLs are signed, and the signature expires at the (hex-encoded) timestamp given by `ex`.
+    expires_at = URL(url).query.get("ex")
+
+    if expires_at is None:
+        return False
+
+    try:
+        expiry = datetime.fromtimestamp(int(expires_at, 16), tz=timezone.utc)
+    except ValueError:
+        return True
+
+    return expiry - ATTACHMENT_EXPIRY_MARGIN <= discord.utils.utcnow()
+
+
 register_handlers()
@@ -152,6 +152,85 @@ class Meta(TabbyCog):
 
         await ctx.send(Codeblock(table.get_string()).markup())
 
+    @commands.is_owner()
+    @commands.command()
+    async def renderstats(self, ctx: Context):
+        """Display statistics about rank card rendering and caching"""
+
+        table = PrettyTable(["cache", "lookups", "hit ratio", "hits (memory/disk)", "evictions (memory/disk)", "size"])
+        caches = {"cards": self.bot.renderer.cache, "avatars": self.bot.avatars.cache}
+
+        for name, cache in caches.items():
+            stats = cache.stats
+            table.add_row([
+                name,
+                stats.lookups,
+                f"{stats.hit_ratio:.1%}",
+                f"{stats.memory_hits}/{stats.disk_hits}",
+                f"{stats.memory_evictions}/{stats.disk_evictions}",
+                f"{util.humanize(cache.memory_size)}B/{util.humanize(cache.disk_size)}B",
+            ])
+
+        queue = self.bot.render_queue.stats
+        queue_summary = (
+            f"queue: {queue.waiting} waiting (peak {queue.peak_waiting}), {queue.admitted} admitted, "
+            f"{queue.rejected} rejected, {queue.expired} expired, {queue.throttled} throttled, "
+            f"{self.bot.renderer.in_flight.coalesced} coalesced\n"
+            f"wait p50/p99: {queue.wait_percentile(50) * 1000:.0f}/{queue.wait_percentile(99) * 1000:.0f}ms, "
+            f"render p50/p99: {queue.render_percentile(50) * 1000:.0f}/{queue.render_percentile(99) * 1000:.0f}ms"
+        )
+
+        message = Codeblock(f"{table.get_string()}\n{queue_summary}").markup()
+        pool = self.bot.webdrivers.state()
+
+        # Drivers are only spawned when the browser backend is in use (and only while it's busy) so there's usually
+        # nothing to show here.
+        if pool.drivers or pool.spawning:
+            summary = (
+                f"drivers: {pool.idle} idle, {pool.busy} busy, {pool.spawning} spawning, {pool.waiting} waiting "
+                f"({pool.dead} found dead, {pool.recycled} recycled, {pool.reaped} torn down while idle)"
+            )
+
+            drivers = PrettyTable(["session", "renders", "busy"])
+            drivers.add_rows((driver.session_id, driver.renders, driver.busy) for driver in pool.drivers)
+
+            message += Codeblock(f"{summary}\n{drivers.get_string()}").markup()
+
+        if self.bot.render_workers is not None:
+            workers = self.bot.render_workers.state()
+            summary = (
+                f"workers: {workers.idle} idle, {workers.busy} busy, {workers.starting} starting "
+                f"({workers.restarted} restarted)"
+            )
+
+            table = PrettyTable(["pid", "renders", "busy"])
+            table.add_rows((worker.pid, worker.renders, worker.busy) for worker in workers.workers)
+
+            message += Codeblock(f"{summary}\n{table.get_string()}").markup()
+
+        await ctx.send(message)
+
+    @commands.is_owner()
+    @commands.command()
+    async def restartworker(self, ctx: Context, pid: int):
+        """Restart a render worker process
+
+        pid:
+            The process ID of the worker to restart, as shown by the `renderstats` command.
+        """
+
+        if self.bot.render_workers is None:
+            await ctx.send("Rank cards aren't being rendered in worker processes.")
+            return
+
+        try:
+            self.bot.render_workers.restart(pid)
+        except KeyError:
+            await ctx.send(f"There's no render worker with the process ID {pid}.")
+            return
+
+        await ctx.send(f"Restarting render worker {pid}.")
+
     @commands.is_owner()
     @commands.command()
     async def sudo(self, ctx: Context, *, to_run: str):
@@ -0,0 +1,137 @@
+import logging
+import time
+from collections import OrderedDict
+
+from aiohttp.web import HTTPNotFound
+from discord.ext import tasks
+
+from . import register_handlers
+from ..bot import Tabby, TabbyCog
+from ..config import RenderBackendKind
+from ..rendering import RankCard, RenderBusy, RenderPriority, render_source
+from ..web import common
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Prerender(TabbyCog):
+    """Renders the rank cards that are most likely to be asked for ahead of time, so that asking for them is usually
+    answered straight from the cache.
+
+    That's the cards at the top of each leaderboard, and those of members who've earned XP recently. Only guilds where
+    somebody has earned XP since the last pass are looked at, and cards are only rendered while the renderer has capacity
+    to spare - interactive renders always come first.
+    """
+
+    # (guild ID, user ID) -> when that member last earned XP, oldest first.
+    _active: OrderedDict[tuple[int, int], float]
+    _changed_guilds: set[int]
+
+    def __init__(self, bot: Tabby) -> None:
+        super().__init__(bot)
+
+        self._active = OrderedDict()
+        self._changed_guilds = set()
+
+    async def cog_load(self) -> None:
+        if self.config.render.prerender_top > 0 or self.config.render.prerender_active_window > 0:
+            self.prerender_cards.change_interval(seconds=self.config.render.prerender_interval)
+            self.prerender_cards.start()
+
+    async def cog_unload(self) -> None:
+        self.prerender_cards.cancel()
+
+    @TabbyCog.listener()
+    async def on_xp_update(self, guild_id: int, user_id: int, total_xp: int):
+        self._changed_guilds.add(guild_id)
+
+        if self.config.render.prerender_active_window > 0:
+            self._active[guild_id, user_id] = time.monotonic()
+            self._active.move_to_end((guild_id, user_id))
+
+    # The real interval is taken from the config when the cog is loaded.
+    @tasks.loop(seconds=30)
+    async def prerender_cards(self):
+        """Render the cards of active and top members in each guild where somebody earned XP since the last pass."""
+
+        self._expire_active_members()
+
+        pending = list(self._changed_guilds)
+        self._changed_guilds.clear()
+        rendered = 0
+
+        for index, guild_id in enumerate(pending):
+            try:
+                rendered += await self._prerender_guild(guild_id)
+            except _OutOfCapacity:
+                # Whatever's left gets another go next time around.
+                self._changed_guilds.update(pending[index:])
+                break
+
+        if rendered:
+            LOGGER.debug("pre-rendered %d rank cards", rendered)
+
+    @prerender_cards.before_loop
+    async def before_prerender_cards(self):
+        await self.bot.wait_until_ready()
+
+    async def _prerender_guild(self, guild_id: int) -> int:
+        # Active members go first, since they're the ones most likely to ask for their rank.
+        member_ids = [user_id for (active_guild_id, user_id) in self._active if active_guild_id == guild_id]
+
+        try:
+            cards = await common.get_guild_member_cards(guild_id, member_ids, self.bot) if member_ids else []
+
+            if self.config.render.prerender_top > 0:
+                cards += await common.get_guild_leaderboard_cards(guild_id, self.config.render.prerender_top, self.bot)
+        except HTTPNotFound:
+            return 0
+
+        rendered = 0
+
+        for card in cards:
+            rendered += await self._prerender(guild_id, card)
+
+        return rendered
+
+    async def _prerender(self, guild_id: int, card: RankCard) -> bool:
+        if not self._has_spare_capacity():
+            raise _OutOfCapacity()
+
+        try:
+            with render_source(guild_id=guild_id, priority=RenderPriority.background):
+                return await self.bot.renderer.prerender(card)
+        except RenderBusy:
+            raise _OutOfCapacity() from None
+        except Exception as error:
+            LOGGER.warning("couldn't pre-render a rank card", exc_info=error)
+            return False
+
+    def _has_spare_capacity(self) -> bool:
+        if not self.bot.render_queue.idle:
+            return False
+
+        # Pre-rendering should never be the reason that a driver is spawned, or kept from being torn down for long.
+        if self.bot.render_workers is None and self.config.render.backend is RenderBackendKind.browser:
+            return self.bot.webdrivers.state().idle > 0
+
+        return True
+
+    def _expire_active_members(self):
+        cutoff = time.monotonic() - self.config.render.prerender_active_window
+
+        while self._active:
+            key, last_active = next(iter(self._active.items()))
+
+            if last_active >= cutoff:
+                break
+
+            del self._active[key]
+
+
+class _OutOfCapacity(Exception):
+    pass
+
+
+register_handlers()
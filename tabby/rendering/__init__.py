@@ -0,0 +1,31 @@
+from .admission import (
+    RenderBusy as RenderBusy,
+    RenderPriority as RenderPriority,
+    RenderQueue as RenderQueue,
+    RenderQueueStats as RenderQueueStats,
+    RenderSource as RenderSource,
+    render_source as render_source,
+)
+from .avatars import AvatarCache as AvatarCache
+from .browser import BrowserBackend as BrowserBackend
+from .bundle import RenderBundle as RenderBundle
+from .cache import (
+    CacheStats as CacheStats,
+    CachedBackend as CachedBackend,
+    TieredCache as TieredCache,
+)
+from .card import (
+    RankCard as RankCard,
+    RankCardGrid as RankCardGrid,
+    RenderBackend as RenderBackend,
+)
+from .documents import DocumentServer as DocumentServer
+from .formats import ImageFormat as ImageFormat
+from .native import NativeBackend as NativeBackend
+from .vector import SvgBackend as SvgBackend
+from .worker import (
+    WorkerError as WorkerError,
+    WorkerOptions as WorkerOptions,
+    WorkerPool as WorkerPool,
+    WorkerPoolState as WorkerPoolState,
+)
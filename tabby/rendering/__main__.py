@@ -0,0 +1,5 @@
+from .worker import main
+
+
+# This is the entry point for render worker processes; see `worker.py`.
+main()
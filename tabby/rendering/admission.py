@@ -0,0 +1,364 @@
+import asyncio
+import collections
+import contextlib
+import dataclasses
+import enum
+import math
+import statistics
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Iterator
+from contextvars import ContextVar
+
+from .card import RankCard, RankCardGrid, RenderBackend
+
+
+# The number of recent renders that wait and render times are tracked for.
+SAMPLE_SIZE = 1000
+
+
+class RenderBusy(Exception):
+    """Raised when a render can't be started, either because too many renders are queued, its deadline passed or its
+    guild used up its share of renders.
+    """
+
+    retry_after: float
+    """A rough estimate of how long (in seconds) it'll be before the queue has room again."""
+
+    def __init__(self, message: str, *, retry_after: float) -> None:
+        super().__init__(message)
+
+        self.retry_after = retry_after
+
+
+class RenderPriority(enum.IntEnum):
+    """How urgently a render is needed. Lower values are more urgent."""
+
+    interactive = 0
+    """Somebody used a command, and is waiting for the result in Discord."""
+
+    web = 1
+    """Somebody is looking at a card (or a preview of one) on the web."""
+
+    background = 2
+    """Nobody is waiting; the card is being rendered ahead of time. These only ever run when nothing else is waiting,
+    and don't count towards their guild's quota.
+    """
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class RenderSource:
+    guild_id: int | None = None
+    """The guild that the render is for, if any. Renders that aren't for a guild share a quota."""
+
+    priority: RenderPriority = RenderPriority.web
+    """How urgently the render is needed."""
+
+
+_SOURCE: ContextVar[RenderSource] = ContextVar("render_source", default=RenderSource())
+
+# How many renders of each priority are started for every render of the others, while both are waiting. Interactive
+# renders are favoured, but web renders still get a turn under sustained load.
+PRIORITY_WEIGHTS = {
+    RenderPriority.interactive: 3,
+    RenderPriority.web: 1,
+}
+
+
+@contextlib.contextmanager
+def render_source(*, guild_id: int | None, priority: RenderPriority | None = None) -> Iterator[None]:
+    """Attribute any renders started within the `with` block to `guild_id`, at `priority`.
+
+    If `priority` isn't given, it's inherited from the enclosing block (if any), so that helpers that know which guild a
+    render is for don't need to know who's waiting for it too.
+    """
+
+    token = _SOURCE.set(RenderSource(guild_id, priority if priority is not None else _SOURCE.get().priority))
+
+    try:
+        yield
+    finally:
+        _SOURCE.reset(token)
+
+
+@dataclasses.dataclass(slots=True)
+class TokenBucket:
+    rate: float
+    """The number of tokens added to the bucket every second."""
+
+    capacity: float
+    """The most tokens the bucket can hold."""
+
+    tokens: float = dataclasses.field(init=False)
+    updated_at: float = dataclasses.field(init=False, default_factory=time.monotonic)
+
+    def __post_init__(self):
+        self.tokens = self.capacity
+
+    def take(self) -> float:
+        """Take a token from the bucket, returning 0. If the bucket is empty, return how long (in seconds) it'll be until
+        there's a token to take instead.
+        """
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+    @property
+    def full(self) -> bool:
+        return self.tokens + (time.monotonic() - self.updated_at) * self.rate >= self.capacity
+
+
+@dataclasses.dataclass(slots=True)
+class RenderQueueStats:
+    admitted: int = 0
+    """The number of renders that were started."""
+
+    rejected: int = 0
+    """The number of renders turned away immediately, because the queue was full."""
+
+    expired: int = 0
+    """The number of renders that gave up waiting, because their deadline passed."""
+
+    throttled: int = 0
+    """The number of renders turned away immediately, because their guild used up its share of renders."""
+
+    waiting: int = 0
+    """The number of renders currently waiting to start."""
+
+    running: int = 0
+    """The number of renders currently running."""
+
+    peak_waiting: int = 0
+    """The largest number of renders that have been waiting at once."""
+
+    wait_times: collections.deque[float] = dataclasses.field(
+        default_factory=lambda: collections.deque(maxlen=SAMPLE_SIZE),
+    )
+    """How long (in seconds) recent renders waited before starting."""
+
+    render_times: collections.deque[float] = dataclasses.field(
+        default_factory=lambda: collections.deque(maxlen=SAMPLE_SIZE),
+    )
+    """How long (in seconds) recent renders took once started."""
+
+    def wait_percentile(self, percentile: int) -> float:
+        """Return the `percentile`-th percentile of recent wait times, in seconds."""
+
+        return _percentile(self.wait_times, percentile)
+
+    def render_percentile(self, percentile: int) -> float:
+        """Return the `percentile`-th percentile of recent render times, in seconds."""
+
+        return _percentile(self.render_times, percentile)
+
+
+class RenderQueue:
+    """Wraps another backend, limiting how many renders run at once and how many can wait for their turn.
+
+    At most `concurrency` renders run at a time. Up to `max_waiting` more can wait for a slot, for up to `deadline`
+    seconds each. Anything beyond that raises `RenderBusy` straight away, so that a burst of requests gets a quick "try
+    again later" rather than piling up behind each other indefinitely.
+
+    Renders are attributed to a guild and a priority with `render_source`. Slots are shared out fairly, so that one busy
+    guild can't keep everybody else waiting:
+
+    - Each guild has a token bucket, refilled at `guild_rate` renders per second up to `guild_burst`. A guild with an
+      empty bucket has its renders turned away until it refills. A `guild_rate` of 0 disables this.
+    - Waiting renders are taken in turn from each guild that has some waiting, rather than first come, first served.
+    - Interactive renders are favoured over web renders (see `PRIORITY_WEIGHTS`), and background renders only start
+      once nothing else is waiting.
+    """
+
+    stats: RenderQueueStats
+
+    _backend: RenderBackend
+    _concurrency: int
+    _max_waiting: int
+    _deadline: float
+    _guild_rate: float
+    _guild_burst: int
+    _buckets: dict[int | None, TokenBucket]
+    # Priority -> guild ID -> the renders from that guild waiting for a slot. Guilds are kept in the order they're due a
+    # turn in.
+    _waiting: dict[RenderPriority, OrderedDict[int | None, collections.deque[asyncio.Future[None]]]]
+    # The "current weight" of each priority, for smooth weighted round-robin between them.
+    _credits: dict[RenderPriority, int]
+
+    def __init__(
+        self,
+        backend: RenderBackend,
+        *,
+        concurrency: int,
+        max_waiting: int,
+        deadline: float,
+        guild_rate: float = 0,
+        guild_burst: int = 1,
+    ) -> None:
+        self.stats = RenderQueueStats()
+        self._backend = backend
+        self._concurrency = concurrency
+        self._max_waiting = max_waiting
+        self._deadline = deadline
+        self._guild_rate = guild_rate
+        self._guild_burst = guild_burst
+        self._buckets = {}
+        self._waiting = {priority: OrderedDict() for priority in RenderPriority}
+        self._credits = {priority: 0 for priority in RenderPriority}
+
+    @property
+    def name(self) -> str:
+        return self._backend.name
+
+    @property
+    def idle(self) -> bool:
+        """Whether a render could start right now without getting in anybody's way.
+
+        That is, nothing is waiting for a slot and at least half of the slots are free - so that anything that arrives in
+        the meantime still has room.
+        """
+
+        free = self._concurrency - self.stats.running
+
+        return self.stats.waiting == 0 and free >= math.ceil(self._concurrency / 2)
+
+    async def render(self, card: RankCard) -> bytes:
+        return await self._admit(lambda: self._backend.render(card))
+
+    async def render_grid(self, grid: RankCardGrid) -> bytes:
+        # A grid is drawn in one go, so it only needs a single slot no matter how many cards it holds.
+        return await self._admit(lambda: self._backend.render_grid(grid))
+
+    async def _admit(self, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        source = _SOURCE.get()
+        started_waiting = time.perf_counter()
+
+        self._take_token(source)
+
+        # A free slot is taken straight away. Only once every slot is taken do renders start to queue up.
+        if self.stats.running < self._concurrency and not self.stats.waiting:
+            self.stats.running += 1
+        else:
+            await self._wait_for_slot(source)
+
+        self.stats.admitted += 1
+        started_rendering = time.perf_counter()
+        self.stats.wait_times.append(started_rendering - started_waiting)
+
+        try:
+            return await render()
+        finally:
+            self._release()
+            self.stats.render_times.append(time.perf_counter() - started_rendering)
+
+    def _take_token(self, source: RenderSource):
+        if self._guild_rate <= 0 or source.priority is RenderPriority.background:
+            return
+
+        bucket = self._buckets.get(source.guild_id)
+
+        if bucket is None:
+            # Buckets are only kept around while they're refilling; a full one is the same as a new one.
+            for guild_id in [guild_id for guild_id, bucket in self._buckets.items() if bucket.full]:
+                del self._buckets[guild_id]
+
+            bucket = self._buckets[source.guild_id] = TokenBucket(self._guild_rate, self._guild_burst)
+
+        if retry_after := bucket.take():
+            self.stats.throttled += 1
+            raise RenderBusy("this guild has used up its share of renders", retry_after=max(1.0, retry_after))
+
+    async def _wait_for_slot(self, source: RenderSource):
+        if self.stats.waiting >= self._max_waiting:
+            self.stats.rejected += 1
+            raise RenderBusy("too many renders are queued", retry_after=self._retry_after())
+
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._waiting[source.priority].setdefault(source.guild_id, collections.deque()).append(waiter)
+        self.stats.waiting += 1
+        self.stats.peak_waiting = max(self.stats.peak_waiting, self.stats.waiting)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self._deadline)
+        except BaseException as error:
+            if waiter.done():
+                # We were handed a slot just as we gave up, so it needs handing on to somebody else.
+                self._release()
+            else:
+                waiter.cancel()
+                self._forget(source, waiter)
+
+            if isinstance(error, asyncio.TimeoutError):
+                self.stats.expired += 1
+                raise RenderBusy("timed out waiting for a render slot", retry_after=self._retry_after()) from None
+
+            raise
+
+    def _release(self):
+        # Rather than freeing the slot for whoever gets to it first, it's handed straight to whoever is due it next.
+        waiter = self._next_waiter()
+
+        if waiter is None:
+            self.stats.running -= 1
+        else:
+            waiter.set_result(None)
+
+    def _next_waiter(self) -> asyncio.Future[None] | None:
+        due = [priority for priority, guilds in self._waiting.items() if guilds and priority in PRIORITY_WEIGHTS]
+
+        if due:
+            # Smooth weighted round-robin: every priority that's due earns its weight, the richest one goes, and pays for
+            # it with everybody's weight. This interleaves priorities rather than serving them in runs.
+            for priority in self._credits:
+                self._credits[priority] = self._credits[priority] + PRIORITY_WEIGHTS[priority] if priority in due else 0
+
+            priority = max(due, key=lambda priority: (self._credits[priority], -priority))
+            self._credits[priority] -= sum(PRIORITY_WEIGHTS[priority] for priority in due)
+        elif self._waiting[RenderPriority.background]:
+            priority = RenderPriority.background
+        else:
+            return None
+
+        guilds = self._waiting[priority]
+        guild_id, waiters = guilds.popitem(last=False)
+        waiter = waiters.popleft()
+
+        # The guild goes to the back of the line, so that everybody else gets a turn first.
+        if waiters:
+            guilds[guild_id] = waiters
+
+        self.stats.waiting -= 1
+
+        return waiter
+
+    def _forget(self, source: RenderSource, waiter: asyncio.Future[None]):
+        guilds = self._waiting[source.priority]
+        waiters = guilds.get(source.guild_id)
+
+        if waiters is None or waiter not in waiters:
+            return
+
+        waiters.remove(waiter)
+        self.stats.waiting -= 1
+
+        if not waiters:
+            del guilds[source.guild_id]
+
+    def _retry_after(self) -> float:
+        # Everybody that's already waiting needs to go first, `concurrency` renders at a time.
+        batches = math.ceil((self.stats.waiting + 1) / self._concurrency)
+
+        return max(1.0, batches * self.stats.render_percentile(50))
+
+
+def _percentile(samples: collections.deque[float], percentile: int) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+
+    return statistics.quantiles(samples, n=100, method="inclusive")[percentile - 1]
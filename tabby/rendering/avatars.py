@@ -0,0 +1,124 @@
+import asyncio
+import base64
+import hashlib
+import logging
+from io import BytesIO
+
+from aiohttp import ClientSession
+from PIL import Image
+from yarl import URL
+
+from .cache import TieredCache
+from ..util import SingleFlight, TTLCache
+
+
+LOGGER = logging.getLogger(__name__)
+
+# This is the size that the native backend draws avatars at (200px, supersampled). The browser backend displays them at
+# 200px, so it's plenty there too.
+AVATAR_SIZE = 400
+# How long (in seconds) to wait before trying to download an avatar again after failing to.
+FAILURE_TTL = 60
+
+
+class AvatarCache:
+    """Downloads avatars on behalf of renderers, and keeps resized copies of them around.
+
+    Avatars are keyed by their URL, which includes the avatar's hash - so a member changing their avatar naturally
+    results in a new entry rather than a stale one. Concurrent requests for the same avatar share a single download, and
+    avatars that couldn't be downloaded aren't tried again for `FAILURE_TTL` seconds.
+    """
+
+    cache: TieredCache
+
+    _session: ClientSession
+    _size: int
+    _in_flight: SingleFlight[str, bytes | None]
+    _failed: TTLCache[str, bool]
+
+    def __init__(self, session: ClientSession, cache: TieredCache, *, size: int = AVATAR_SIZE) -> None:
+        """Create a new avatar cache.
+
+        `session` is used to download avatars. Its connection pool is shared with the rest of the bot.
+        `cache` is where resized avatars are stored.
+        `size` is the width and height that avatars are resized to before they're stored.
+        """
+
+        self.cache = cache
+        self._session = session
+        self._size = size
+        self._in_flight = SingleFlight()
+        self._failed = TTLCache(expiry=FAILURE_TTL)
+
+    async def get(self, url: str) -> bytes | None:
+        """Return the avatar at `url` as a PNG-encoded square image, or `None` if it couldn't be downloaded."""
+
+        key = avatar_key(url)
+        avatar = await self.cache.get(key)
+
+        if avatar is not None:
+            return avatar
+
+        if key in self._failed:
+            return None
+
+        return await self._in_flight.run(key, lambda: self._fetch(key, url))
+
+    async def get_data_url(self, url: str) -> str:
+        """Return the avatar at `url` as a `data:` URL, falling back to `url` itself if it couldn't be downloaded."""
+
+        avatar = await self.get(url)
+
+        if avatar is None:
+            return url
+
+        return f"data:image/png;base64,{base64.b64encode(avatar).decode()}"
+
+    async def _fetch(self, key: str, url: str) -> bytes | None:
+        # The CDN serves whatever size we ask for, and there's no point downloading anything bigger than we store.
+        sized_url = URL(url).update_query(size=str(_request_size(self._size)))
+
+        try:
+            async with self._session.get(sized_url) as response:
+                response.raise_for_status()
+                raw = await response.read()
+
+            avatar = await asyncio.to_thread(_resize, raw, self._size)
+        except Exception as error:
+            LOGGER.warning("couldn't download avatar %s (%s: %s)", url, type(error).__name__, error)
+            self._failed[key] = True
+            return None
+
+        await self.cache.put(key, avatar)
+
+        return avatar
+
+
+def avatar_key(url: str) -> str:
+    """Return the cache key for the avatar at `url`."""
+
+    # Query parameters only ever affect the size of the avatar, which we normalize anyway.
+    path = URL(url).with_query(None).human_repr()
+
+    return hashlib.sha256(path.encode()).hexdigest()
+
+
+def _resize(raw: bytes, size: int) -> bytes:
+    # Animated avatars are stored as their first frame, which is all a rank card can show anyway.
+    with Image.open(BytesIO(raw)) as image:
+        resized = image.convert("RGBA").resize((size, size), Image.Resampling.LANCZOS)
+
+    buffer = BytesIO()
+    resized.save(buffer, format="PNG")
+
+    return buffer.getvalue()
+
+
+def _request_size(size: int) -> int:
+    # Discord only serves power-of-two sizes.
+    request_size = 16
+
+    while request_size < size:
+        request_size *= 2
+
+    return request_size
@@ -0,0 +1,225 @@
+import asyncio
+import base64
+import contextlib
+import functools
+import logging
+import weakref
+from concurrent.futures import Executor
+from typing import Any, AsyncContextManager, Callable
+
+from jinja2 import Environment, FileSystemLoader
+from selenium.webdriver import Firefox
+from selenium.webdriver.common.by import By
+from yarl import URL
+
+from .avatars import AvatarCache
+from .bundle import RenderBundle
+from .card import RankCard, RankCardGrid
+from .documents import DocumentServer
+from ..resources import TEMPLATE_DIRECTORY
+from ..util import DriverPool
+
+
+LOGGER = logging.getLogger(__name__)
+
+# A transparent 1x1 GIF, used as the avatar on the warm page until the first real card is drawn.
+BLANK_IMAGE = "data:image/gif;base64,R0lGODlhAQABAAAAACH5BAEKAAEALAAAAAABAAEAAAICTAEAOw=="
+
+# Fills in a warm rank page with the values of a new card, in the same way that `rank.html` would have. The callback is
+# only called once the avatar has been decoded and fonts are ready, so that the screenshot never catches a half-drawn
+# card. If the page isn't a rank page anymore (i.e the driver navigated elsewhere) the callback receives `false`, and the
+# page needs to be loaded again.
+UPDATE_SCRIPT = """
+const [values, done] = arguments;
+const content = document.querySelector('.container > .content');
+
+if (!content) {
+  done(false);
+  return;
+}
+
+const avatar = content.querySelector('img');
+avatar.src = values.avatar;
+
+content.querySelector('.user .name').textContent = values.name;
+content.querySelector('.user .tag').textContent = values.tag;
+content.querySelector('.bar').style.setProperty('--completion', values.progress);
+content.querySelector('.bar .current').textContent = values.current_xp;
+content.querySelector('.bar .required').textContent = values.required_xp;
+content.querySelector('.leaderboard .level').textContent = values.level;
+content.querySelector('.leaderboard .rank').textContent = values.rank;
+
+content.querySelector('.leaderboard .change')?.remove();
+
+if (values.rank_change) {
+  const change = document.createElement('span');
+  change.className = `change ${values.rank_change > 0 ? 'up' : 'down'}`;
+  change.textContent = Math.abs(values.rank_change);
+  content.querySelector('.leaderboard').append(change);
+}
+
+Promise.all([avatar.decode().catch(() => null), document.fonts.ready]).then(() => done(true));
+"""
+
+
+class BrowserBackend:
+    """Renders rank cards by screenshotting the `rank.html` template in a pooled headless Firefox instance.
+
+    By default, each driver loads the rank page once and keeps it around. Rendering a card then only needs to update the
+    page's contents in place (see `UPDATE_SCRIPT`) before taking a screenshot, rather than parsing, styling and laying out
+    a brand new document every time.
+    """
+
+    name = "browser"
+
+    _drivers: DriverPool
+    _avatars: AvatarCache
+    _bundle: RenderBundle
+    _persistent: bool
+    _documents: DocumentServer | None
+    _executor: Executor | None
+    _environment: Environment
+    _warm_page: str | None
+    _warm_drivers: weakref.WeakSet[Firefox]
+
+    def __init__(
+        self,
+        drivers: DriverPool,
+        avatars: AvatarCache,
+        bundle: RenderBundle,
+        *,
+        persistent: bool = True,
+        documents: DocumentServer | None = None,
+        executor: Executor | None = None,
+    ) -> None:
+        """Create a new backend.
+
+        `drivers` is the pool that drivers are checked out from for each render.
+        `avatars` is used to download avatars, which are inlined into the page so that the browser doesn't have to.
+        `bundle` provides the page's styles. A self-contained bundle means that rendering makes no HTTP requests at all.
+        `persistent` controls whether drivers keep a warm rank page around. If false, each render navigates to a freshly
+        rendered page instead.
+        `documents` serves pages to drivers from memory. If `None`, pages are loaded from `data:` URLs instead.
+        `executor` is where drivers are driven from. If `None`, the event loop's default executor is used.
+        """
+
+        self._drivers = drivers
+        self._avatars = avatars
+        self._bundle = bundle
+        self._persistent = persistent
+        self._documents = documents
+        self._executor = executor
+        self._environment = Environment(
+            enable_async=True,
+            loader=FileSystemLoader(TEMPLATE_DIRECTORY),
+            autoescape=True,
+            trim_blocks=True,
+            lstrip_blocks=True,
+        )
+        self._warm_page = None
+        self._warm_drivers = weakref.WeakSet()
+
+    async def render(self, card: RankCard) -> bytes:
+        context = card.template_context()
+        context["avatar"] = await self._avatars.get_data_url(card.avatar_url)
+
+        if self._persistent:
+            warm_page = await self._get_warm_page()
+            render = functools.partial(self._update_rank_card, warm_page=warm_page, context=context)
+
+            return await self._run(render)
+
+        async with self._serve_page(await self._render_page(context)) as url:
+            return await self._run(functools.partial(_render_rank_card, url=url))
+
+    async def render_grid(self, grid: RankCardGrid) -> bytes:
+        contexts = [card.template_context() for card in grid.cards]
+        avatars = await asyncio.gather(*(self._avatars.get_data_url(card.avatar_url) for card in grid.cards))
+
+        for context, avatar in zip(contexts, avatars):
+            context["avatar"] = avatar
+
+        # Every card goes into one document, so the whole grid costs a single navigation and a single screenshot.
+        grid_template = self._environment.get_template("rank_grid.html")
+        page = await grid_template.render_async(**self._bundle.template_context(), cards=contexts, columns=grid.columns)
+
+        async with self._serve_page(page) as url:
+            return await self._run(functools.partial(self._render_grid, url=url))
+
+    async def _run(self, render: Callable[[Firefox], bytes]) -> bytes:
+        async with self._drivers.get() as driver:
+            loop = asyncio.get_running_loop()
+            image = await loop.run_in_executor(self._executor, render, driver)
+
+        return image
+
+    def _serve_page(self, page: str) -> AsyncContextManager[URL | str]:
+        if self._documents is None:
+            return contextlib.nullcontext(_data_url(page, content_type="text/html"))
+
+        return self._documents.serve(page)
+
+    async def _render_page(self, context: dict[str, Any]) -> str:
+        rank_template = self._environment.get_template("rank.html")
+
+        return await rank_template.render_async(**self._bundle.template_context(), card=context)
+
+    async def _get_warm_page(self) -> str:
+        if self._warm_page is None:
+            placeholder = RankCard(
+                avatar_url=BLANK_IMAGE,
+                name="",
+                tag="",
+                progress=0,
+                current_xp="",
+                required_xp="",
+                level=0,
+                rank=0,
+            )
+
+            page = await self._render_page(placeholder.template_context())
+
+            # The warm page is loaded whenever a new driver comes along, so it's served for as long as the backend lives.
+            if self._documents is None:
+                self._warm_page = _data_url(page, content_type="text/html")
+            else:
+                self._warm_page = str(await self._documents.publish(page))
+
+        return self._warm_page
+
+    def _update_rank_card(self, driver: Firefox, warm_page: str, context: dict[str, Any]) -> bytes:
+        # Drivers are replaced rather than restarted, so a new driver always gets a fresh page.
+        if driver not in self._warm_drivers:
+            driver.get(warm_page)
+            self._warm_drivers.add(driver)
+
+        if not driver.execute_async_script(UPDATE_SCRIPT, context):
+            LOGGER.warning("warm rank page in session %s went missing; reloading it", driver.session_id)
+
+            driver.get(warm_page)
+            driver.execute_async_script(UPDATE_SCRIPT, context)
+
+        element = driver.find_element(By.CLASS_NAME, value="container")
+
+        return element.screenshot_as_png
+
+    def _render_grid(self, driver: Firefox, url: URL | str) -> bytes:
+        # Navigating away throws out this driver's warm page, so it'll need to be loaded again next time.
+        self._warm_drivers.discard(driver)
+        driver.get(str(url))
+        element = driver.find_element(By.CLASS_NAME, value="grid")
+
+        return element.screenshot_as_png
+
+
+def _render_rank_card(driver: Firefox, url: URL | str) -> bytes:
+    driver.get(str(url))
+    element = driver.find_element(By.CLASS_NAME, value="container")
+
+    return element.screenshot_as_png
+
+
+def _data_url(content: str, *, content_type: str) -> str:
+    content = base64.b64encode(content.encode()).decode()
+
+    return f"data:{content_type};base64,{content}"
@@ -0,0 +1,141 @@
+import base64
+import dataclasses
+import logging
+import re
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageFont
+from yarl import URL
+
+from ..resources import STATIC_DIRECTORY
+
+
+LOGGER = logging.getLogger(__name__)
+_ASSET_PATTERN = re.compile(r"""url\(["']?/assets/(?P<name>[^"')]+)["']?\)""")
+_IMPORT_PATTERN = re.compile(r"""@import url\(["']?(?P<url>[^"')]+)["']?\);?\n?""")
+
+# The widths that each asset is displayed at on the rank card, per `rank.css`. Shipping the full-size images would mean
+# the browser decoding (and then throwing away) millions of pixels on every render.
+ASSET_WIDTHS = {
+    "background.webp": 440,
+    "level_background.png": 210,
+}
+
+# The faces that `rank.css` imports from Google Fonts, if they're installed locally. The italic faces are imported too,
+# but nothing on the card is italic, so there's no point paying to inline them.
+FONT_FACES = {
+    400: "NotoSansDisplay-Regular.ttf",
+    700: "NotoSansDisplay-Bold.ttf",
+}
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class RenderBundle:
+    """Everything that the `rank.html` template needs to style itself.
+
+    A bundle is either self-contained, in which case `stylesheet` holds `rank.css` with every asset and font inlined, or
+    linked, in which case the page loads its stylesheet (and everything it references) from `stylesheet_url`.
+    """
+
+    stylesheet: str | None = None
+    """The inlined stylesheet, if this bundle is self-contained."""
+
+    stylesheet_url: URL | None = None
+    """The URL of the stylesheet, if this bundle is linked."""
+
+    @classmethod
+    def load(cls, *, fonts: bool = True) -> "RenderBundle":
+        """Build a self-contained bundle from the static directory and the fonts installed on this system.
+
+        If `fonts` is false, fonts are left for the page to load from Google Fonts rather than inlined.
+
+        This reads and re-encodes a few images, so it should be done once (i.e at startup) rather than per render.
+        """
+
+        stylesheet = (STATIC_DIRECTORY / "styles" / "rank.css").read_text()
+        stylesheet = _ASSET_PATTERN.sub(lambda match: f'url("{_inline_asset(match["name"])}")', stylesheet)
+
+        if not fonts:
+            return cls(stylesheet=stylesheet)
+
+        font_faces = _inline_font_faces()
+
+        if font_faces:
+            stylesheet = _IMPORT_PATTERN.sub("", stylesheet)
+            stylesheet = f"{font_faces}\n{stylesheet}"
+        else:
+            LOGGER.warning(
+                "Noto Sans Display isn't installed, so rank cards will load it from Google Fonts on every render. "
+                "Install it (i.e from the fonts-noto-core package) to avoid this"
+            )
+
+        return cls(stylesheet=stylesheet)
+
+    @classmethod
+    def linked(cls, base_url: URL) -> "RenderBundle":
+        """Build a bundle that loads its stylesheet from the web application running at `base_url`."""
+
+        return cls(stylesheet_url=base_url / "styles" / "rank.css")
+
+    def template_context(self) -> dict[str, str | URL | None]:
+        """Return the values used to style the `rank.html` template."""
+
+        return {"stylesheet": self.stylesheet, "stylesheet_url": self.stylesheet_url}
+
+
+def _inline_asset(name: str) -> str:
+    path = STATIC_DIRECTORY / "assets" / name
+    width = ASSET_WIDTHS.get(name)
+
+    if width is None:
+        return _data_url(path.read_bytes(), content_type=_content_type(path))
+
+    with Image.open(path) as image:
+        height = round(image.height * width / image.width)
+        resized = image.convert("RGB").resize((width, height), Image.Resampling.LANCZOS)
+
+    buffer = BytesIO()
+    resized.save(buffer, format="WEBP", quality=90)
+
+    return _data_url(buffer.getvalue(), content_type="image/webp")
+
+
+def _inline_font_faces() -> str | None:
+    faces = []
+
+    for weight, name in FONT_FACES.items():
+        path = _find_font(name)
+
+        if path is None:
+            return None
+
+        source = _data_url(path.read_bytes(), content_type="font/ttf")
+        faces.append(
+            "@font-face {\n"
+            '  font-family: "Noto Sans Display";\n'
+            "  font-style: normal;\n"
+            f"  font-weight: {weight};\n"
+            f'  src: url("{source}") format("truetype");\n'
+            "}\n"
+        )
+
+    return "".join(faces)
+
+
+def _find_font(name: str) -> Path | None:
+    # Pillow already knows how to search the system's font directories, so we may as well let it do the work.
+    try:
+        font = ImageFont.truetype(name, 1)
+    except OSError:
+        return None
+
+    return Path(font.path)
+
+
+def _content_type(path: Path) -> str:
+    return {".png": "image/png", ".webp": "image/webp"}.get(path.suffix, "application/octet-stream")
+
+
+def _data_url(content: bytes, *, content_type: str) -> str:
+    return f"data:{content_type};base64,{base64.b64encode(content).decode()}"
@@ -0,0 +1,387 @@
+import asyncio
+import dataclasses
+import hashlib
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+
+from .card import RankCard, RankCardGrid, RenderBackend
+from .formats import ImageFormat, encode
+from ..util import SingleFlight
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(slots=True)
+class CacheStats:
+    memory_hits: int = 0
+    """The number of lookups served from memory."""
+
+    disk_hits: int = 0
+    """The number of lookups served from disk."""
+
+    misses: int = 0
+    """The number of lookups that weren't cached at all."""
+
+    memory_evictions: int = 0
+    """The number of entries evicted from memory to stay within the memory budget."""
+
+    disk_evictions: int = 0
+    """The number of entries deleted from disk to stay within the disk budget."""
+
+    @property
+    def lookups(self) -> int:
+        return self.memory_hits + self.disk_hits + self.misses
+
+    @property
+    def hit_ratio(self) -> float:
+        """The proportion of lookups that were served from either tier, between 0 and 1."""
+
+        return (self.memory_hits + self.disk_hits) / self.lookups if self.lookups else 0.0
+
+
+class TieredCache:
+    """A least-recently-used cache of bytes, split into an in-memory tier and an (optional) on-disk tier.
+
+    Both tiers have a budget in bytes. Entries evicted from memory stay on disk, and entries read from disk are promoted
+    back into memory. Disk I/O happens in the default executor, so lookups never block the event loop.
+
+    Keys must be safe to use as file names; hex digests are a good choice.
+    """
+
+    stats: CacheStats
+
+    _memory: OrderedDict[str, bytes]
+    _memory_size: int
+    _memory_budget: int
+    _directory: Path | None
+    _disk: OrderedDict[str, int]
+    _disk_size: int
+    _disk_budget: int
+    _disk_loaded: bool
+    _disk_lock: asyncio.Lock
+
+    def __init__(self, *, memory_budget: int, directory: Path | None = None, disk_budget: int = 0) -> None:
+        """Create a new cache.
+
+        `memory_budget` is the maximum total size of the entries held in memory, in bytes.
+        `directory` is where on-disk entries are stored. If `None`, the on-disk tier is disabled.
+        `disk_budget` is the maximum total size of the entries held on disk, in bytes.
+        """
+
+        self.stats = CacheStats()
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._memory_budget = memory_budget
+        self._directory = directory if disk_budget > 0 else None
+        self._disk = OrderedDict()
+        self._disk_size = 0
+        self._disk_budget = disk_budget
+        self._disk_loaded = False
+        self._disk_lock = asyncio.Lock()
+
+    @property
+    def memory_size(self) -> int:
+        """The total size of the entries held in memory, in bytes."""
+
+        return self._memory_size
+
+    @property
+    def disk_size(self) -> int:
+        """The total size of the entries held on disk, in bytes."""
+
+        return self._disk_size
+
+    async def get(self, key: str) -> bytes | None:
+        """Return the value stored under `key`, or `None` if it isn't cached."""
+
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.stats.memory_hits += 1
+
+            return self._memory[key]
+
+        value = await self._disk_get(key)
+
+        if value is None:
+            self.stats.misses += 1
+            return None
+
+        self.stats.disk_hits += 1
+        self._memory_put(key, value)
+
+        return value
+
+    async def contains(self, key: str) -> bool:
+        """Return whether `key` is cached in either tier.
+
+        Unlike `get`, this isn't counted as a lookup and doesn't affect the order that entries are evicted in.
+        """
+
+        if key in self._memory:
+            return True
+
+        await self._load_disk_index()
+
+        return self._directory is not None and key in self._disk
+
+    async def put(self, key: str, value: bytes) -> None:
+        """Store `value` under `key` in both tiers."""
+
+        self._memory_put(key, value)
+        await self._disk_put(key, value)
+
+    def _memory_put(self, key: str, value: bytes):
+        if len(value) > self._memory_budget:
+            return
+
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+
+        self._memory[key] = value
+        self._memory_size += len(value)
+
+        while self._memory_size > self._memory_budget:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self.stats.memory_evictions += 1
+
+    async def _disk_get(self, key: str) -> bytes | None:
+        if self._directory is None:
+            return None
+
+        await self._load_disk_index()
+
+        if self._directory is None or key not in self._disk:
+            return None
+
+        path = self._directory / key
+
+        try:
+            value = await asyncio.to_thread(path.read_bytes)
+        except FileNotFoundError:
+            # Somebody cleaned up the cache directory from under us (or the entry was evicted while it was being read).
+            # That's fine.
+            self._disk_size -= self._disk.pop(key, 0)
+            return None
+
+        # The entry might have been evicted while it was being read, in which case its file is about to disappear.
+        if key not in self._disk:
+            return None
+
+        self._disk.move_to_end(key)
+
+        # Access times aren't reliable (plenty of file systems are mounted with `noatime`), so we bump the modification
+        # time instead. This keeps the LRU ordering intact across restarts.
+        await asyncio.to_thread(_touch, path)
+
+        return value
+
+    async def _disk_put(self, key: str, value: bytes):
+        if self._directory is None or len(value) > self._disk_budget:
+            return
+
+        await self._load_disk_index()
+
+        if self._directory is None:
+            return
+
+        directory = self._directory
+        evicted: list[str] = []
+
+        if key in self._disk:
+            self._disk_size -= self._disk.pop(key)
+
+        self._disk[key] = len(value)
+        self._disk_size += len(value)
+
+        while self._disk_size > self._disk_budget:
+            evicted_key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            self.stats.disk_evictions += 1
+            evicted.append(evicted_key)
+
+        def _write():
+            _write_atomically(directory / key, value)
+
+            for evicted_key in evicted:
+                (directory / evicted_key).unlink(missing_ok=True)
+
+        try:
+            await asyncio.to_thread(_write)
+        except OSError as error:
+            LOGGER.warning("couldn't write cache entry %s to disk", key, exc_info=error)
+            self._disk_size -= self._disk.pop(key, 0)
+
+    async def _load_disk_index(self):
+        if self._disk_loaded or self._directory is None:
+            return
+
+        # Anything that arrives while the index is loading needs to wait for it, or it'll see an empty index.
+        async with self._disk_lock:
+            if not self._disk_loaded:
+                await self._scan_disk()
+                self._disk_loaded = True
+
+    async def _scan_disk(self):
+        if self._directory is None:
+            return
+
+        directory = self._directory
+
+        def _scan() -> list[tuple[str, int]]:
+            directory.mkdir(parents=True, exist_ok=True)
+            entries = [entry for entry in os.scandir(directory) if entry.is_file() and not entry.name.startswith(".")]
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+
+            return [(entry.name, entry.stat().st_size) for entry in entries]
+
+        try:
+            entries = await asyncio.to_thread(_scan)
+        except OSError as error:
+            LOGGER.warning("couldn't use cache directory %s; disabling on-disk cache", directory, exc_info=error)
+            self._directory = None
+            return
+
+        for key, size in entries:
+            self._disk[key] = size
+            self._disk_size += size
+
+        LOGGER.info("loaded %d cached entries (%d bytes) from %s", len(entries), self._disk_size, directory)
+
+
+class CachedBackend:
+    """Wraps another backend, so that identical cards are only ever rendered once - even if they're requested at the same
+    time.
+
+    Cards are keyed by a hash of every value that's visible on them (see `card_key`), so any change to a card - a new
+    avatar, some more XP, a different rank - produces a new key, and stale entries simply age out of the cache.
+    """
+
+    cache: TieredCache
+    in_flight: SingleFlight[str, bytes]
+
+    _backend: RenderBackend
+
+    def __init__(self, backend: RenderBackend, cache: TieredCache) -> None:
+        self.cache = cache
+        self.in_flight = SingleFlight()
+        self._backend = backend
+
+    @property
+    def name(self) -> str:
+        return self._backend.name
+
+    async def render(self, card: RankCard) -> bytes:
+        key = card_key(card, backend=self._backend.name)
+        image = await self.cache.get(key)
+
+        # Identical cards tend to be requested in bursts (i.e when somebody posts a link to their card) so there's a good
+        # chance that somebody else is already rendering this one. If so, we just wait for them.
+        if image is None:
+            image = await self.in_flight.run(key, lambda: self._render(key, card))
+
+        return image
+
+    async def render_as(self, card: RankCard, format: ImageFormat) -> bytes:
+        """Render `card`, returning the image encoded in `format` rather than as the backend's PNG.
+
+        Each format is cached separately, so a card is only ever re-encoded once.
+        """
+
+        key = self.key(card, format)
+        image = await self.cache.get(key)
+
+        if image is None:
+            image = await self.in_flight.run(key, lambda: self._render_as(key, card, format))
+
+        return image
+
+    async def prerender(self, card: RankCard) -> bool:
+        """Render `card` ahead of time (so that it's cached when it's asked for) unless it's already cached.
+
+        Returns whether the card needed rendering. Checking the cache this way doesn't count towards its hit ratio, which
+        would otherwise look much better than it really is.
+        """
+
+        key = self.key(card)
+
+        if await self.cache.contains(key):
+            return False
+
+        await self.in_flight.run(key, lambda: self._render(key, card))
+
+        return True
+
+    def key(self, card: RankCard, format: ImageFormat | None = None) -> str:
+        """Return the key that `card` is cached under, optionally as encoded in `format`.
+
+        Since the key changes whenever anything visible on the card does, it's also suitable for use as an ETag.
+        """
+
+        key = card_key(card, backend=self._backend.name)
+
+        return key if format is None else f"{key}-{format.value}"
+
+    async def render_grid(self, grid: RankCardGrid) -> bytes:
+        key = card_key(grid, backend=self._backend.name)
+        image = await self.cache.get(key)
+
+        if image is None:
+            image = await self.in_flight.run(key, lambda: self._render_grid(key, grid))
+
+        return image
+
+    async def _render(self, key: str, card: RankCard) -> bytes:
+        image = await self._backend.render(card)
+        await self.cache.put(key, image)
+
+        return image
+
+    async def _render_as(self, key: str, card: RankCard, format: ImageFormat) -> bytes:
+        image = await asyncio.to_thread(encode, await self.render(card), format)
+        await self.cache.put(key, image)
+
+        return image
+
+    async def _render_grid(self, key: str, grid: RankCardGrid) -> bytes:
+        image = await self._backend.render_grid(grid)
+        await self.cache.put(key, image)
+
+        return image
+
+
+def card_key(card: RankCard | RankCardGrid, *, backend: str) -> str:
+    """Return a key that uniquely identifies the image of `card` (or a grid of cards), as drawn by the backend named
+    `backend`.
+    """
+
+    # Different backends don't produce identical images, so they shouldn't share entries.
+    payload = f"{backend}:{card.json(sort_keys=True)}"
+
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _touch(path: Path):
+    # Unlike `Path.touch`, this won't recreate a file that was evicted in the meantime.
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_atomically(path: Path, value: bytes):
+    # Writing to a temporary file first means that readers never see a partially-written entry.
+    fd, temporary = tempfile.mkstemp(dir=path.parent, prefix=".")
+
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(value)
+
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
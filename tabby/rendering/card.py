@@ -0,0 +1,86 @@
+from typing import Any, Protocol
+
+from pydantic import BaseModel
+
+
+class RankCard(BaseModel):
+    """Everything that's visible on a member's rank card.
+
+    Renderers should draw a card using only these values, so that two cards with equal values always look the same.
+    """
+
+    avatar_url: str
+    """The URL of the member's avatar."""
+
+    name: str
+    """The member's display name."""
+
+    tag: str
+    """The member's tag, including the leading "#"."""
+
+    progress: float
+    """The member's progress towards the next level, as a decimal number between 0 and 1."""
+
+    current_xp: str
+    """The (humanized) amount of XP that the member has gained within their current level."""
+
+    required_xp: str
+    """The (humanized) amount of XP required to advance from the member's current level."""
+
+    level: int
+    """The member's current level."""
+
+    rank: int
+    """The member's position on the guild's leaderboard."""
+
+    rank_change: int | None = None
+    """The number of places the member has moved up the leaderboard since the last snapshot, if known."""
+
+    def template_context(self) -> dict[str, Any]:
+        """Return the values used to render this card with the `rank.html` template."""
+
+        return {
+            "avatar": self.avatar_url,
+            "name": self.name,
+            "tag": self.tag,
+            "progress": f"{self.progress * 100:2f}%",
+            "current_xp": self.current_xp,
+            "required_xp": self.required_xp,
+            "level": self.level,
+            "rank": f"#{self.rank:,}",
+            "rank_change": self.rank_change,
+        }
+
+
+class RankCardGrid(BaseModel):
+    """Several rank cards, laid out left-to-right and top-to-bottom in rows of `columns` cards."""
+
+    cards: list[RankCard]
+    """The cards to draw, in order."""
+
+    columns: int
+    """The number of cards in each row."""
+
+    @property
+    def rows(self) -> int:
+        return -(-len(self.cards) // self.columns)
+
+
+class RenderBackend(Protocol):
+    """Something that can turn a `RankCard` into an image."""
+
+    name: str
+    """A short name for this backend, used in logs and benchmarks."""
+
+    async def render(self, card: RankCard) -> bytes:
+        """Render `card`, returning the image as PNG-encoded bytes."""
+
+        ...
+
+    async def render_grid(self, grid: RankCardGrid) -> bytes:
+        """Render every card in `grid` as a single image, returning it as PNG-encoded bytes.
+
+        This should cost roughly as much as a single render, rather than one render per card.
+        """
+
+        ...
@@ -0,0 +1,102 @@
+import asyncio
+import contextlib
+import logging
+import secrets
+from typing import AsyncIterator
+
+from aiohttp import web
+from yarl import URL
+
+
+LOGGER = logging.getLogger(__name__)
+HOST = "127.0.0.1"
+
+
+class DocumentServer:
+    """Serves rendered pages to web drivers straight from memory, so that drivers can load them from a short URL.
+
+    The alternative is a `data:` URL, which base64-encodes the entire page (making it a third bigger) and leaves Firefox
+    to decode a URL that can easily be megabytes long once stylesheets and fonts are inlined.
+
+    Pages are served by a tiny application of their own, bound to the loopback interface on a random port. It has none of
+    the web application's middleware (sessions, templates and so on), since none of it is relevant to a page that only a
+    web driver will ever see. It also means that this works anywhere a `BrowserBackend` does, including render workers.
+    The server is started the first time a page is published.
+    """
+
+    _documents: dict[str, bytes]
+    _runner: web.AppRunner | None
+    _base_url: URL | None
+    _start_lock: asyncio.Lock
+
+    def __init__(self) -> None:
+        self._documents = {}
+        self._runner = None
+        self._base_url = None
+        self._start_lock = asyncio.Lock()
+
+    async def publish(self, content: str) -> URL:
+        """Store `content` as an HTML page, returning the URL it's served from. The page is served until it's removed."""
+
+        base_url = await self._start()
+        # Tokens are unguessable, so nothing else on this machine can read (or even find) a published page.
+        token = secrets.token_urlsafe(16)
+        self._documents[token] = content.encode()
+
+        return base_url / token
+
+    def remove(self, url: URL):
+        """Stop serving the page at `url`."""
+
+        self._documents.pop(url.name, None)
+
+    @contextlib.asynccontextmanager
+    async def serve(self, content: str) -> AsyncIterator[URL]:
+        """Serve `content` as an HTML page for the duration of the `async with` block, yielding its URL."""
+
+        url = await self.publish(content)
+
+        try:
+            yield url
+        finally:
+            self.remove(url)
+
+    async def close(self) -> None:
+        """Stop the server, and forget every page. Publishing a page afterwards starts the server again."""
+
+        self._documents.clear()
+
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+        self._runner = None
+        self._base_url = None
+
+    async def _start(self) -> URL:
+        async with self._start_lock:
+            if self._base_url is not None:
+                return self._base_url
+
+            app = web.Application()
+            app.router.add_get("/{token}", self._get_document)
+
+            # Drivers fetch a page for every render, so logging each fetch would just be noise.
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, HOST, 0).start()
+
+            _, port = runner.addresses[0][:2]
+            self._runner = runner
+            self._base_url = URL.build(scheme="http", host=HOST, port=port)
+
+            LOGGER.info("serving rank card documents on %s", self._base_url)
+
+            return self._base_url
+
+    async def _get_document(self, request: web.Request) -> web.Response:
+        document = self._documents.get(request.match_info["token"])
+
+        if document is None:
+            raise web.HTTPNotFound()
+
+        return web.Response(body=document, content_type="text/html", charset="utf-8")
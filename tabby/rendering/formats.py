@@ -0,0 +1,35 @@
+import enum
+from io import BytesIO
+
+from PIL import Image
+
+
+class ImageFormat(str, enum.Enum):
+    png = "png"
+    webp = "webp"
+
+    @property
+    def content_type(self) -> str:
+        return f"image/{self.value}"
+
+
+def encode(image: bytes, format: ImageFormat) -> bytes:
+    """Re-encode `image` (a PNG, as produced by a backend) in `format`, for sending over the network.
+
+    Backends favour speed over size when encoding, since that's all a card sent to Discord needs. Cards served over HTTP
+    tend to be fetched again and again, so they're worth spending a little more time on.
+    """
+
+    with Image.open(BytesIO(image)) as decoded:
+        decoded.load()
+
+    buffer = BytesIO()
+
+    if format is ImageFormat.webp:
+        # Lossy, but indistinguishable from the original at this quality - and a fifth of the size.
+        decoded.save(buffer, format="WEBP", quality=90)
+    else:
+        # zlib's default level is most of the way to `optimize=True`, at a fraction of the cost.
+        decoded.save(buffer, format="PNG", compress_level=6)
+
+    return buffer.getvalue()
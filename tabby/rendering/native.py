@@ -0,0 +1,416 @@
+import asyncio
+import logging
+from concurrent.futures import Executor
+from io import BytesIO
+from pathlib import Path
+from typing import NamedTuple
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+from PIL.ImageFont import FreeTypeFont
+
+from .avatars import AvatarCache
+from .card import RankCard, RankCardGrid
+from ..resources import STATIC_DIRECTORY
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Everything is drawn at `SCALE` times the size given in `rank.css` and then downsampled, since Pillow doesn't
+# anti-alias shapes on its own.
+SCALE = 2
+
+# All of the measurements below are in CSS pixels, and mirror `rank.css`.
+CARD_SIZE = (880, 330)
+CONTENT_BOX = (40, 40, 840, 290)
+CONTENT_RADIUS = 32
+AVATAR_SIZE = 200
+AVATAR_BORDER = 3
+AVATAR_COLUMN_WIDTH = 250
+COLUMN_LEFT = 290
+COLUMN_RIGHT = 820
+USER_ROW = (40, 127.5)
+BAR_ROW = (127.5, 202.5)
+LEADERBOARD_ROW = (202.5, 290)
+BORDER_WIDTH = 3
+PILL_PADDING = (16, 4)
+PILL_RADIUS = 32
+
+TEXT = (0x40, 0x3F, 0x4C)
+FOREGROUND = (0xF9, 0xF4, 0xF1)
+FOREGROUND_GLASS = (*FOREGROUND, 191)
+SHADOW = (0x3F, 0x3E, 0x4B, 128)
+RANK_UP = (0x3A, 0x8D, 0x5C)
+RANK_DOWN = (0xB5, 0x48, 0x4B)
+
+# Noto Sans Display is what `rank.css` asks for. DejaVu Sans is a reasonable stand-in that's installed almost
+# everywhere. Bare file names are looked up in the system's font directories by Pillow.
+REGULAR_FONTS = ("NotoSansDisplay-Regular.ttf", "DejaVuSans.ttf")
+BOLD_FONTS = ("NotoSansDisplay-Bold.ttf", "DejaVuSans-Bold.ttf")
+
+
+class _Fonts(NamedTuple):
+    name: FreeTypeFont
+    tag: FreeTypeFont
+    regular: FreeTypeFont
+    bold: FreeTypeFont
+    change: FreeTypeFont
+
+
+class NativeBackend:
+    """Renders rank cards with Pillow, reproducing the layout of `rank.html` and `rank.css` without a browser.
+
+    Everything that doesn't depend on the card itself (the background, the content panel and its shadow) is drawn once
+    when the backend is created, so each render only needs to draw the avatar, text and progress bar.
+    """
+
+    name = "native"
+
+    _avatars: AvatarCache
+    _executor: Executor | None
+    _fonts: _Fonts
+    _base: Image.Image
+    _bar_background: Image.Image
+
+    def __init__(
+        self,
+        avatars: AvatarCache,
+        *,
+        executor: Executor | None = None,
+        font_directory: Path | None = None,
+    ) -> None:
+        """Create a new backend.
+
+        `avatars` is used to download avatars.
+        `executor` is where cards are drawn. If `None`, the event loop's default executor is used.
+        `font_directory` is an optional directory to search for fonts before falling back to the system's fonts.
+        """
+
+        self._avatars = avatars
+        self._executor = executor
+        self._fonts = _Fonts(
+            name=_load_font(REGULAR_FONTS, 36, font_directory),
+            tag=_load_font(BOLD_FONTS, 20, font_directory),
+            regular=_load_font(REGULAR_FONTS, 28, font_directory),
+            bold=_load_font(BOLD_FONTS, 28, font_directory),
+            change=_load_font(BOLD_FONTS, 20, font_directory),
+        )
+
+        self._base = _draw_base()
+
+        bar_width = _scaled(COLUMN_RIGHT - COLUMN_LEFT - 2 * BORDER_WIDTH)
+        bar_height = _scaled(BAR_ROW[1] - BAR_ROW[0] - 2 * BORDER_WIDTH)
+
+        with Image.open(STATIC_DIRECTORY / "assets" / "level_background.png") as level_background:
+            # `background-size: 40%` is relative to the bar's padding box.
+            self._bar_background = _tile(level_background.convert("RGB"), bar_width * 0.4, (bar_width, bar_height))
+
+    async def render(self, card: RankCard) -> bytes:
+        avatar = await self._avatars.get(card.avatar_url)
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self._executor, self.draw, card, avatar)
+
+    async def render_grid(self, grid: RankCardGrid) -> bytes:
+        avatars = await asyncio.gather(*(self._avatars.get(card.avatar_url) for card in grid.cards))
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self._executor, self.draw_grid, grid, avatars)
+
+    def draw(self, card: RankCard, avatar: bytes | None) -> bytes:
+        """Draw `card` synchronously, returning the image as PNG-encoded bytes.
+
+        `avatar` is the encoded avatar image, or `None` to leave the avatar blank.
+        """
+
+        return _encode(self._draw_card(card, avatar))
+
+    def draw_grid(self, grid: RankCardGrid, avatars: list[bytes | None]) -> bytes:
+        """Draw every card in `grid` onto a single canvas synchronously, returning the image as PNG-encoded bytes.
+
+        `avatars` holds the encoded avatar image for each card, in the same order as `grid.cards`.
+        """
+
+        width, height = CARD_SIZE
+        canvas = Image.new("RGB", (width * min(grid.columns, len(grid.cards)), height * grid.rows))
+
+        for index, (card, avatar) in enumerate(zip(grid.cards, avatars)):
+            row, column = divmod(index, grid.columns)
+            canvas.paste(self._draw_card(card, avatar), (column * width, row * height))
+
+        # Encoding is most of the cost of a single card, so encoding the grid once is where most of the savings are.
+        return _encode(canvas)
+
+    def _draw_card(self, card: RankCard, avatar: bytes | None) -> Image.Image:
+        image = self._base.copy()
+        draw = ImageDraw.Draw(image)
+
+        self._draw_avatar(image, avatar)
+        self._draw_user(draw, card)
+        self._draw_bar(image, draw, card)
+        self._draw_leaderboard(draw, card)
+
+        return image.convert("RGB").reduce(SCALE)
+
+    def _draw_avatar(self, image: Image.Image, avatar: bytes | None):
+        box_size = AVATAR_SIZE + 2 * AVATAR_BORDER
+        left = CONTENT_BOX[0] + (AVATAR_COLUMN_WIDTH - box_size) / 2
+        top = CONTENT_BOX[1] + (CONTENT_BOX[3] - CONTENT_BOX[1] - box_size) / 2
+
+        draw = ImageDraw.Draw(image)
+
+        # The outline sits outside the border, which sits outside the image itself.
+        outline_box = _box(left - BORDER_WIDTH, top - BORDER_WIDTH, box_size + 2 * BORDER_WIDTH)
+        draw.ellipse(outline_box, fill=TEXT)
+        draw.ellipse(_box(left, top, box_size), fill=FOREGROUND)
+
+        if avatar is None:
+            return
+
+        size = _scaled(AVATAR_SIZE)
+
+        try:
+            with Image.open(BytesIO(avatar)) as raw:
+                picture = raw.convert("RGBA").resize((size, size), Image.Resampling.LANCZOS)
+        except Exception as error:
+            LOGGER.warning("couldn't decode avatar; drawing the card without it", exc_info=error)
+            return
+
+        mask = Image.new("L", (size, size), 0)
+        ImageDraw.Draw(mask).ellipse((0, 0, size - 1, size - 1), fill=255)
+        alpha = Image.composite(picture.getchannel("A"), mask, mask)
+        picture.putalpha(alpha)
+
+        image.alpha_composite(picture, (_scaled(left + AVATAR_BORDER), _scaled(top + AVATAR_BORDER)))
+
+    def _draw_user(self, draw: ImageDraw.ImageDraw, card: RankCard):
+        name_ascent, name_descent = self._fonts.name.getmetrics()
+        tag_ascent, tag_descent = self._fonts.tag.getmetrics()
+
+        # The name and tag are laid out in a row, which is vertically centered. The tag is aligned to the top of the
+        # row, and has a little bit of padding.
+        tag_padding = _scaled(4)
+        height = max(name_ascent + name_descent, tag_ascent + tag_descent + 2 * tag_padding)
+        top = _scaled(USER_ROW[0]) + (_scaled(USER_ROW[1] - USER_ROW[0]) - height) / 2
+        left = _scaled(COLUMN_LEFT)
+
+        # Unlike the browser, we have the luxury of keeping long names from spilling out of the card.
+        tag_width = self._fonts.tag.getlength(card.tag) + 2 * tag_padding
+        name = _truncate(card.name, self._fonts.name, _scaled(COLUMN_RIGHT) - left - tag_width)
+
+        draw.text((left, top + name_ascent), name, font=self._fonts.name, fill=TEXT, anchor="ls")
+
+        name_width = self._fonts.name.getlength(name)
+        tag_position = (left + name_width + tag_padding, top + tag_padding + tag_ascent)
+
+        draw.text(tag_position, card.tag, font=self._fonts.tag, fill=TEXT, anchor="ls")
+
+    def _draw_bar(self, image: Image.Image, draw: ImageDraw.ImageDraw, card: RankCard):
+        left, right = _scaled(COLUMN_LEFT), _scaled(COLUMN_RIGHT)
+        top, bottom = _scaled(BAR_ROW[0]), _scaled(BAR_ROW[1])
+        border = _scaled(BORDER_WIDTH)
+        radius = (bottom - top) // 2
+
+        # The progress bar is a tiled image, with the "unfilled" portion covered up by a translucent layer.
+        fill = self._bar_background.convert("RGBA")
+        filled_width = round(fill.width * min(max(card.progress, 0), 1))
+        cover = Image.new("RGBA", fill.size, (0, 0, 0, 0))
+        ImageDraw.Draw(cover).rectangle((filled_width, 0, fill.width, fill.height), fill=FOREGROUND_GLASS)
+        fill.alpha_composite(cover)
+
+        mask = Image.new("L", fill.size, 0)
+        ImageDraw.Draw(mask).rounded_rectangle((0, 0, fill.width - 1, fill.height - 1), radius - border, fill=255)
+
+        draw.rounded_rectangle((left, top, right - 1, bottom - 1), radius, fill=TEXT)
+        image.paste(fill, (left + border, top + border), mask)
+
+        # Then there's the XP "pills", which sit either side of the bar.
+        inner_top = top + border
+        inner_height = bottom - top - 2 * border
+        margin = _scaled(10)
+
+        current = [("XP ", self._fonts.regular), (card.current_xp, self._fonts.bold)]
+        required = [("NEXT ", self._fonts.regular), (card.required_xp, self._fonts.bold)]
+
+        pill_height = self._pill_height(self._fonts.bold)
+        pill_top = inner_top + (inner_height - pill_height) / 2
+
+        self._draw_pill(draw, current, left=left + border + margin, top=pill_top)
+
+        required_width = self._pill_width(required)
+        self._draw_pill(draw, required, left=right - border - margin - required_width, top=pill_top)
+
+    def _draw_leaderboard(self, draw: ImageDraw.ImageDraw, card: RankCard):
+        runs = [
+            ("LEVEL ", self._fonts.regular),
+            (str(card.level), self._fonts.bold),
+            (" / ", self._fonts.regular),
+            ("RANK ", self._fonts.regular),
+            (f"#{card.rank:,}", self._fonts.bold),
+        ]
+
+        change_width = 0
+        change_gap = _scaled(8)
+
+        if card.rank_change:
+            change_text = str(abs(card.rank_change))
+            change_width = change_gap + self._triangle_size() + self._fonts.change.getlength(change_text)
+
+        pill_width = self._pill_width(runs) + change_width
+        pill_height = self._pill_height(self._fonts.bold)
+        top = _scaled(LEADERBOARD_ROW[0]) + (_scaled(LEADERBOARD_ROW[1] - LEADERBOARD_ROW[0]) - pill_height) / 2
+        left = _scaled(COLUMN_RIGHT) - pill_width
+
+        self._draw_pill(draw, runs, left=left, top=top, extra_width=change_width)
+
+        if not card.rank_change:
+            return
+
+        # `rank.css` uses a triangle glyph here, but not every font has one; drawing the shape avoids tofu.
+        ascent, _ = self._fonts.bold.getmetrics()
+        baseline = top + _scaled(BORDER_WIDTH + PILL_PADDING[1]) + ascent
+        change_left = left + pill_width - _scaled(BORDER_WIDTH + PILL_PADDING[0]) - change_width + change_gap
+        colour = RANK_UP if card.rank_change > 0 else RANK_DOWN
+
+        size = self._triangle_size()
+        triangle_bottom = baseline
+        triangle_top = baseline - size
+
+        if card.rank_change > 0:
+            points = [(change_left, triangle_bottom), (change_left + size, triangle_bottom), (change_left + size / 2, triangle_top)]
+        else:
+            points = [(change_left, triangle_top), (change_left + size, triangle_top), (change_left + size / 2, triangle_bottom)]
+
+        draw.polygon(points, fill=colour)
+        draw.text((change_left + size, baseline), str(abs(card.rank_change)), font=self._fonts.change, fill=colour, anchor="ls")
+
+    def _draw_pill(
+        self,
+        draw: ImageDraw.ImageDraw,
+        runs: list[tuple[str, FreeTypeFont]],
+        *,
+        left: float,
+        top: float,
+        extra_width: float = 0,
+    ):
+        width = self._pill_width(runs) + extra_width
+        height = self._pill_height(self._fonts.bold)
+        border = _scaled(BORDER_WIDTH)
+
+        draw.rounded_rectangle(
+            (left, top, left + width - 1, top + height - 1),
+            radius=min(_scaled(PILL_RADIUS), height / 2),
+            fill=FOREGROUND,
+            outline=TEXT,
+            width=border,
+        )
+
+        ascent, _ = self._fonts.bold.getmetrics()
+        cursor = left + border + _scaled(PILL_PADDING[0])
+        baseline = top + border + _scaled(PILL_PADDING[1]) + ascent
+
+        for text, font in runs:
+            draw.text((cursor, baseline), text, font=font, fill=TEXT, anchor="ls")
+            cursor += font.getlength(text)
+
+    def _pill_width(self, runs: list[tuple[str, FreeTypeFont]]) -> float:
+        text_width = sum(font.getlength(text) for text, font in runs)
+
+        return text_width + 2 * (_scaled(PILL_PADDING[0]) + _scaled(BORDER_WIDTH))
+
+    def _pill_height(self, font: FreeTypeFont) -> float:
+        ascent, descent = font.getmetrics()
+
+        return ascent + descent + 2 * (_scaled(PILL_PADDING[1]) + _scaled(BORDER_WIDTH))
+
+    def _triangle_size(self) -> float:
+        return self._fonts.change.size * 0.7
+
+
+def _draw_base() -> Image.Image:
+    size = (_scaled(CARD_SIZE[0]), _scaled(CARD_SIZE[1]))
+
+    with Image.open(STATIC_DIRECTORY / "assets" / "background.webp") as background:
+        # `background-size: 50%` is relative to the container's padding box, which is the whole card.
+        base = _tile(background.convert("RGB"), size[0] * 0.5, size).convert("RGBA")
+
+    content_box = tuple(map(_scaled, CONTENT_BOX))
+    radius = _scaled(CONTENT_RADIUS)
+
+    mask = Image.new("L", size, 0)
+    ImageDraw.Draw(mask).rounded_rectangle(content_box, radius, fill=255)
+
+    # box-shadow: 2px 2px 10px
+    shadow = Image.new("RGBA", size, (0, 0, 0, 0))
+    offset = _scaled(2)
+    shadow_box = (content_box[0] + offset, content_box[1] + offset, content_box[2] + offset, content_box[3] + offset)
+    ImageDraw.Draw(shadow).rounded_rectangle(shadow_box, radius, fill=SHADOW)
+    shadow = shadow.filter(ImageFilter.GaussianBlur(_scaled(5)))
+    base.alpha_composite(shadow)
+
+    # backdrop-filter: blur(3px), followed by the translucent panel itself
+    blurred = base.filter(ImageFilter.GaussianBlur(_scaled(3)))
+    base.paste(blurred, (0, 0), mask)
+
+    glass = Image.new("RGBA", size, (0, 0, 0, 0))
+    ImageDraw.Draw(glass).rounded_rectangle(content_box, radius, fill=FOREGROUND_GLASS)
+    base.alpha_composite(glass)
+
+    return base
+
+
+def _encode(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    # Cards are sent once and thrown away, so a slightly bigger file beats spending most of the render in zlib.
+    image.save(buffer, format="PNG", compress_level=1)
+
+    return buffer.getvalue()
+
+
+def _tile(source: Image.Image, tile_width: float, size: tuple[int, int]) -> Image.Image:
+    tile_height = round(source.height * tile_width / source.width)
+    tile = source.resize((round(tile_width), tile_height), Image.Resampling.LANCZOS)
+    result = Image.new(source.mode, size)
+
+    for x in range(0, size[0], tile.width):
+        for y in range(0, size[1], tile.height):
+            result.paste(tile, (x, y))
+
+    return result
+
+
+def _truncate(text: str, font: FreeTypeFont, width: float) -> str:
+    if font.getlength(text) <= width:
+        return text
+
+    while text and font.getlength(text + "…") > width:
+        text = text[:-1]
+
+    return text.rstrip() + "…"
+
+
+def _load_font(candidates: tuple[str, ...], size: int, directory: Path | None) -> FreeTypeFont:
+    paths = [str(directory / name) for name in candidates] if directory else []
+    paths.extend(candidates)
+
+    for path in paths:
+        try:
+            return ImageFont.truetype(path, _scaled(size))
+        except OSError:
+            continue
+
+    LOGGER.warning("none of the fonts %s are installed; falling back to Pillow's default font", candidates)
+
+    font = ImageFont.load_default(_scaled(size))
+
+    # `load_default` only hands out a bitmap font when FreeType is missing, and `truetype` would have raised without it.
+    assert isinstance(font, FreeTypeFont)
+
+    return font
+
+
+def _box(left: float, top: float, size: float) -> tuple[int, int, int, int]:
+    return (_scaled(left), _scaled(top), _scaled(left + size) - 1, _scaled(top + size) - 1)
+
+
+def _scaled(value: float) -> int:
+    return round(value * SCALE)
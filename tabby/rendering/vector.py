@@ -0,0 +1,74 @@
+import asyncio
+
+from jinja2 import Environment, FileSystemLoader
+
+from .avatars import AvatarCache
+from .bundle import RenderBundle
+from .card import RankCard, RankCardGrid
+from .native import CARD_SIZE
+from ..resources import TEMPLATE_DIRECTORY
+
+
+class SvgBackend:
+    """Renders rank cards as SVG images, which browsers can draw themselves - so no rasterizing is needed at all.
+
+    The image is the same markup and stylesheet that `rank.html` uses, wrapped in a `<foreignObject>`. Browsers don't
+    load anything an SVG links to when it's displayed with an `<img>` tag, so avatars and assets are inlined. Fonts aren't
+    (they'd make every card several times bigger) so cards use Noto Sans Display if the viewer has it installed, and fall
+    back to their sans-serif font otherwise.
+
+    Unlike the other backends, this one produces text rather than a PNG. It's only meant for web clients; cards sent to
+    Discord still need rasterizing by one of the others.
+    """
+
+    name = "svg"
+
+    _avatars: AvatarCache
+    _environment: Environment
+    _stylesheet: str | None
+    _stylesheet_lock: asyncio.Lock
+
+    def __init__(self, avatars: AvatarCache) -> None:
+        self._avatars = avatars
+        self._environment = Environment(
+            enable_async=True,
+            loader=FileSystemLoader(TEMPLATE_DIRECTORY),
+            autoescape=True,
+            trim_blocks=True,
+            lstrip_blocks=True,
+        )
+        self._stylesheet = None
+        self._stylesheet_lock = asyncio.Lock()
+
+    async def render(self, card: RankCard) -> bytes:
+        return await self.render_grid(RankCardGrid(cards=[card], columns=1))
+
+    async def render_grid(self, grid: RankCardGrid) -> bytes:
+        contexts = [card.template_context() for card in grid.cards]
+        avatars = await asyncio.gather(*(self._avatars.get_data_url(card.avatar_url) for card in grid.cards))
+
+        for context, avatar in zip(contexts, avatars):
+            context["avatar"] = avatar
+
+        width, height = CARD_SIZE
+        template = self._environment.get_template("rank.svg")
+        image = await template.render_async(
+            stylesheet=await self._get_stylesheet(),
+            cards=contexts,
+            columns=grid.columns,
+            width=width * min(grid.columns, len(grid.cards)),
+            height=height * grid.rows,
+        )
+
+        return image.encode()
+
+    async def _get_stylesheet(self) -> str:
+        # Building the bundle means re-encoding a couple of images, which isn't worth doing until somebody asks for a card.
+        async with self._stylesheet_lock:
+            if self._stylesheet is None:
+                bundle = await asyncio.to_thread(RenderBundle.load, fonts=False)
+                assert bundle.stylesheet is not None
+
+                self._stylesheet = bundle.stylesheet
+
+        return self._stylesheet
@@ -0,0 +1,483 @@
+"""Out-of-process rendering.
+
+`WorkerPool` runs rank card renders in a pool of worker processes, each of which runs `main` (via `python -m
+tabby.rendering`). The pool and its workers talk over each worker's standard input and output using a simple binary
+protocol: every message is a frame made up of a one-byte `FrameKind`, a four-byte (big-endian) body length, and then the
+body itself.
+
+A worker's lifetime looks like this:
+
+1. The pool sends a `setup` frame holding the worker's `WorkerOptions` as JSON.
+2. The worker builds its backend, and replies with a `ready` frame once it can render.
+3. The pool sends `card` or `grid` frames holding a `RankCard` or `RankCardGrid` as JSON, one at a time. The worker
+   replies to each with either an `image` frame holding the PNG-encoded image, or an `error` frame holding a message.
+4. The pool closes the worker's standard input, and the worker exits.
+"""
+
+import asyncio
+import contextlib
+import dataclasses
+import enum
+import logging
+import os
+import struct
+import sys
+from asyncio import Queue, StreamReader, Task
+from asyncio.subprocess import Process
+from pathlib import Path
+from typing import BinaryIO
+
+from aiohttp import ClientSession
+from discord.backoff import ExponentialBackoff
+from pydantic import BaseModel
+from selenium.webdriver import FirefoxOptions
+
+from .avatars import AvatarCache
+from .browser import BrowserBackend
+from .bundle import RenderBundle
+from .cache import TieredCache
+from .card import RankCard, RankCardGrid, RenderBackend
+from .documents import DocumentServer
+from .native import NativeBackend
+from ..config import RenderBackendKind
+from ..util import DriverPool
+
+
+LOGGER = logging.getLogger(__name__)
+FRAME_HEADER = struct.Struct("!BI")
+
+# Comfortably bigger than the largest leaderboard image, but small enough that a corrupted length can't take us down.
+MAX_FRAME_SIZE = 64 * 2**20
+
+# How long a worker gets to exit on its own (quitting its web driver on the way out) before it's killed.
+SHUTDOWN_TIMEOUT = 5
+
+
+class FrameKind(enum.IntEnum):
+    setup = 1
+    ready = 2
+    card = 3
+    grid = 4
+    image = 5
+    error = 6
+
+
+class WorkerError(Exception):
+    """Raised when a worker process fails to render something, or fails outright."""
+
+
+class WorkerOptions(BaseModel):
+    backend: RenderBackendKind = RenderBackendKind.native
+    """The backend that the worker renders with."""
+
+    avatar_cache_memory: int = 16 * 2**20
+    """The maximum amount of memory (in bytes) the worker uses to cache avatars."""
+
+    avatar_cache_directory: Path | None = None
+    """The directory that the worker caches avatars in. Workers can safely share a directory."""
+
+    avatar_cache_disk: int = 0
+    """The maximum amount of disk space (in bytes) the worker uses to cache avatars."""
+
+    webdriver_min: int = 0
+    """Whether the worker keeps its web driver around while idle (1) or not (0)."""
+
+    webdriver_idle_timeout: float = 300
+    """The number of seconds the worker's web driver may sit idle before it's torn down."""
+
+    webdriver_max_renders: int = 1000
+    """The number of rank cards the worker's web driver may render before it's replaced with a fresh one."""
+
+    webdriver_max_memory: int = 1024 * 2**20
+    """The amount of memory (in bytes) the worker's web driver may use before it's replaced with a fresh one."""
+
+
+@dataclasses.dataclass(slots=True)
+class _Worker:
+    process: Process
+    renders: int = 0
+    busy: bool = False
+    retiring: bool = False
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def request(self, kind: FrameKind, body: bytes) -> tuple[FrameKind, bytes]:
+        assert self.process.stdin is not None and self.process.stdout is not None
+
+        self.process.stdin.write(encode_frame(kind, body))
+        await self.process.stdin.drain()
+
+        return await read_frame(self.process.stdout)
+
+
+class WorkerState(BaseModel):
+    pid: int
+    """The worker's process ID."""
+
+    renders: int
+    """The number of renders the worker has completed."""
+
+    busy: bool
+    """Whether the worker is currently rendering."""
+
+
+class WorkerPoolState(BaseModel):
+    idle: int
+    """The number of workers waiting for something to render."""
+
+    busy: int
+    """The number of workers currently rendering."""
+
+    starting: int
+    """The number of workers currently starting up."""
+
+    restarted: int
+    """The total number of workers that were restarted since the pool was created."""
+
+    workers: list[WorkerState]
+    """The state of each running worker in the pool."""
+
+
+class WorkerPool:
+    """Renders rank cards in a pool of worker processes.
+
+    Each worker runs its own backend (and, for the browser backend, its own web driver) and renders one thing at a time,
+    so the size of the pool is the number of renders that can run at once. Since nothing runs in the bot's process, a
+    browser being killed for running out of memory (or a render that never finishes) can only ever take down its own
+    worker. Workers that crash, time out or misbehave are killed and replaced in the background, without affecting the
+    rest of the pool.
+    """
+
+    _options: WorkerOptions
+    _size: int
+    _timeout: float
+    _workers: dict[int, _Worker]
+    _available: Queue[_Worker]
+    _starting: set[Task]
+    _closed: bool
+    _restarted: int
+
+    def __init__(self, options: WorkerOptions, *, size: int, timeout: float = 30) -> None:
+        """Create a new (empty) worker pool. Workers aren't started until `start` is called.
+
+        `options` is sent to every worker, and determines how it renders.
+        `size` is the number of workers to run.
+        `timeout` is the number of seconds a worker may spend on a single render before it's assumed to be stuck.
+        """
+
+        self._options = options
+        self._size = size
+        self._timeout = timeout
+        self._workers = {}
+        self._available = Queue()
+        self._starting = set()
+        self._closed = False
+        self._restarted = 0
+
+    @property
+    def name(self) -> str:
+        return self._options.backend.value
+
+    async def start(self) -> None:
+        """Start every worker in the pool, returning once they're all ready to render."""
+
+        tasks = [self._start() for _ in range(self._size)]
+
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def close(self) -> None:
+        """Stop every worker in the pool. The pool can't be used afterwards."""
+
+        self._closed = True
+
+        for task in self._starting:
+            task.cancel()
+
+        workers = [*self._workers.values()]
+        self._workers.clear()
+
+        await asyncio.gather(*(_stop(worker.process) for worker in workers))
+
+    def restart(self, pid: int) -> None:
+        """Restart the worker with the process ID `pid`.
+
+        A busy worker finishes what it's rendering first. Raises `KeyError` if no such worker exists.
+        """
+
+        worker = self._workers[pid]
+        worker.retiring = True
+
+        if not worker.busy:
+            self._replace(worker)
+
+    def state(self) -> WorkerPoolState:
+        """Return a snapshot of the pool's current state."""
+
+        workers = [
+            WorkerState(pid=pid, renders=worker.renders, busy=worker.busy) for pid, worker in self._workers.items()
+        ]
+
+        return WorkerPoolState(
+            idle=sum(not worker.busy for worker in workers),
+            busy=sum(worker.busy for worker in workers),
+            starting=len(self._starting),
+            restarted=self._restarted,
+            workers=workers,
+        )
+
+    async def render(self, card: RankCard) -> bytes:
+        return await self._request(FrameKind.card, card.json().encode())
+
+    async def render_grid(self, grid: RankCardGrid) -> bytes:
+        return await self._request(FrameKind.grid, grid.json().encode())
+
+    async def _request(self, kind: FrameKind, body: bytes) -> bytes:
+        worker = await self._checkout()
+
+        try:
+            reply_kind, reply = await asyncio.wait_for(worker.request(kind, body), timeout=self._timeout)
+        except BaseException as error:
+            # Whatever went wrong, the worker might still be busy with (or halfway through replying to) this request,
+            # so it can't be trusted with another one.
+            self._replace(worker)
+
+            if isinstance(error, (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, WorkerError)):
+                LOGGER.warning("render worker %d failed; restarting it", worker.process.pid, exc_info=error)
+                raise WorkerError(f"render worker {worker.process.pid} failed") from error
+
+            raise
+
+        self._checkin(worker)
+
+        if reply_kind is FrameKind.error:
+            raise WorkerError(reply.decode())
+
+        if reply_kind is not FrameKind.image:
+            raise WorkerError(f"render worker {worker.process.pid} replied with an unexpected {reply_kind.name} frame")
+
+        return reply
+
+    async def _checkout(self) -> _Worker:
+        while True:
+            worker = await self._available.get()
+
+            # Workers that are being restarted are already on their way out, and their replacements on their way in.
+            if worker.retiring:
+                continue
+
+            if worker.alive:
+                worker.busy = True
+                return worker
+
+            pid, code = worker.process.pid, worker.process.returncode
+            LOGGER.warning("render worker %d exited with code %s; restarting it", pid, code)
+
+            self._replace(worker)
+
+    def _checkin(self, worker: _Worker):
+        worker.busy = False
+        worker.renders += 1
+
+        if worker.retiring:
+            self._replace(worker)
+        else:
+            self._available.put_nowait(worker)
+
+    def _replace(self, worker: _Worker):
+        if self._workers.pop(worker.process.pid, None) is None:
+            return
+
+        worker.retiring = True
+
+        self._restarted += 1
+        asyncio.create_task(_stop(worker.process, graceful=worker.alive and not worker.busy))
+
+        if not self._closed:
+            self._start()
+
+    def _start(self) -> Task:
+        task = asyncio.create_task(self._start_worker())
+        self._starting.add(task)
+        task.add_done_callback(self._starting.discard)
+
+        return task
+
+    async def _start_worker(self):
+        backoff = ExponentialBackoff()
+
+        while True:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable,
+                "-m",
+                __package__,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+            )
+
+            try:
+                # There's no timeout here, since a browser worker might not be ready until it has spawned a driver.
+                reply_kind, _ = await _Worker(process).request(FrameKind.setup, self._options.json().encode())
+
+                if reply_kind is not FrameKind.ready:
+                    raise WorkerError(f"expected a ready frame, got a {reply_kind.name} frame")
+            except (asyncio.IncompleteReadError, ConnectionError, WorkerError) as error:
+                delay = backoff.delay()
+                LOGGER.error("failed to start render worker, trying again in %d seconds", delay, exc_info=error)
+
+                await _stop(process, graceful=False)
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                await _stop(process, graceful=False)
+                raise
+            else:
+                break
+
+        if self._closed:
+            await _stop(process)
+            return
+
+        worker = self._workers[process.pid] = _Worker(process)
+        self._available.put_nowait(worker)
+
+
+def encode_frame(kind: FrameKind, body: bytes) -> bytes:
+    """Encode a single frame of the worker protocol."""
+
+    return FRAME_HEADER.pack(kind, len(body)) + body
+
+
+async def read_frame(reader: StreamReader) -> tuple[FrameKind, bytes]:
+    """Read a single frame of the worker protocol from `reader`.
+
+    Raises `asyncio.IncompleteReadError` if the stream ends first, or `WorkerError` if the frame is malformed.
+    """
+
+    header = await reader.readexactly(FRAME_HEADER.size)
+    kind, length = FRAME_HEADER.unpack(header)
+
+    if length > MAX_FRAME_SIZE:
+        raise WorkerError(f"frame of {length} bytes exceeds the maximum frame size")
+
+    try:
+        kind = FrameKind(kind)
+    except ValueError:
+        raise WorkerError(f"unknown frame kind {kind}") from None
+
+    return kind, await reader.readexactly(length)
+
+
+async def _stop(process: Process, *, graceful: bool = True):
+    if process.returncode is not None:
+        return
+
+    if graceful and process.stdin is not None:
+        # Workers exit by themselves once there's nothing left to read.
+        process.stdin.close()
+
+        try:
+            await asyncio.wait_for(process.wait(), timeout=SHUTDOWN_TIMEOUT)
+            return
+        except asyncio.TimeoutError:
+            LOGGER.warning("render worker %d didn't exit in time; killing it", process.pid)
+
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
+    await process.wait()
+
+
+async def _build_backend(
+    options: WorkerOptions,
+    session: ClientSession,
+    stack: contextlib.AsyncExitStack,
+) -> RenderBackend:
+    avatar_cache = TieredCache(
+        memory_budget=options.avatar_cache_memory,
+        directory=options.avatar_cache_directory,
+        disk_budget=options.avatar_cache_disk,
+    )
+
+    avatars = AvatarCache(session, avatar_cache)
+
+    if options.backend is not RenderBackendKind.browser:
+        return NativeBackend(avatars)
+
+    drivers = DriverPool(
+        min_size=options.webdriver_min,
+        max_size=1,
+        idle_timeout=options.webdriver_idle_timeout,
+        max_renders=options.webdriver_max_renders,
+        max_memory=options.webdriver_max_memory,
+    )
+
+    firefox_options = FirefoxOptions()
+    firefox_options.add_argument("-headless")
+
+    stack.push_async_callback(drivers.close)
+    await drivers.setup(options=firefox_options)
+
+    documents = DocumentServer()
+    stack.push_async_callback(documents.close)
+
+    return BrowserBackend(drivers, avatars, RenderBundle.load(), documents=documents)
+
+
+async def _render(backend: RenderBackend, kind: FrameKind, body: bytes) -> bytes:
+    if kind is FrameKind.card:
+        return await backend.render(RankCard.parse_raw(body))
+
+    if kind is FrameKind.grid:
+        return await backend.render_grid(RankCardGrid.parse_raw(body))
+
+    raise WorkerError(f"can't render a {kind.name} frame")
+
+
+async def _serve(output: BinaryIO):
+    loop = asyncio.get_running_loop()
+    reader = StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    def _reply(kind: FrameKind, body: bytes):
+        # There's only ever one request in flight, so there's nothing else for the event loop to be doing meanwhile.
+        output.write(encode_frame(kind, body))
+        output.flush()
+
+    kind, body = await read_frame(reader)
+
+    if kind is not FrameKind.setup:
+        raise WorkerError(f"expected a setup frame, got a {kind.name} frame")
+
+    options = WorkerOptions.parse_raw(body)
+
+    async with ClientSession() as session, contextlib.AsyncExitStack() as stack:
+        backend = await _build_backend(options, session, stack)
+        _reply(FrameKind.ready, b"")
+
+        while True:
+            try:
+                kind, body = await read_frame(reader)
+            except asyncio.IncompleteReadError:
+                break
+
+            try:
+                image = await _render(backend, kind, body)
+            except Exception as error:
+                LOGGER.exception("failed to render a %s frame", kind.name)
+                _reply(FrameKind.error, str(error).encode())
+            else:
+                _reply(FrameKind.image, image)
+
+
+def main():
+    # Anything else that writes to stdout (i.e a web driver's log output) would corrupt our replies, so replies get their
+    # own copy of it, and everything else is pointed at stderr instead.
+    output = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    logging.basicConfig(level=logging.INFO, format=f"[render worker {os.getpid()}] %(levelname)s %(name)s: %(message)s")
+    asyncio.run(_serve(output))
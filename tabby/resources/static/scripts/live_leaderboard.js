@@ -0,0 +1,103 @@
+// `document.currentScript` is only available while the script is first being executed, so we need to hold onto it.
+const LIVE_LEADERBOARD_SCRIPT = document.currentScript;
+const HUMANIZE_UNITS = ['', 'K', 'M', 'B', 'T', 'Q'];
+
+// Mirrors `tabby.util.humanize`, so that updated rows look the same as the ones rendered by the server.
+function humanize(value) {
+  let scale = value ? Math.floor(Math.log10(Math.abs(value)) / 3) : 0;
+
+  if (!scale) {
+    return String(value);
+  }
+
+  return `${(value / 10 ** (3 * scale)).toFixed(1)}${HUMANIZE_UNITS[scale]}`;
+}
+
+// Rows are ordered the same way as `tabby.leaderboard`: most XP first, with ties broken by the larger user ID.
+function compareRows(left, right) {
+  let [leftXp, rightXp] = [left, right].map(row => Number(row.dataset.xp));
+
+  if (leftXp !== rightXp) {
+    return rightXp - leftXp;
+  }
+
+  let [leftId, rightId] = [left, right].map(row => BigInt(row.dataset.userId));
+
+  return leftId === rightId ? 0 : (rightId > leftId ? 1 : -1);
+}
+
+function updateRow(row, update) {
+  row.dataset.xp = update.xp.total;
+  row.querySelector('.xp').textContent = humanize(update.xp.total);
+
+  let progress = row.querySelector('.level > .progress');
+  progress.style.setProperty('--progress', `${update.xp.progress}turn`);
+  progress.textContent = update.level;
+}
+
+function setupLiveLeaderboard() {
+  let grid = document.querySelector('.grid.leaderboard');
+
+  // The leaderboard is empty, so there's nothing for us to update in-place. Somebody will have to refresh. Sorry!
+  if (!grid) {
+    return;
+  }
+
+  let { guildId, pageSize, firstPage } = LIVE_LEADERBOARD_SCRIPT.dataset;
+  let getRows = () => [...grid.querySelectorAll(':scope > .row:not(.heading)')];
+  let firstRank = Number(getRows()[0].querySelector('.shaded').textContent);
+
+  function applyUpdates(updates) {
+    let rows = getRows();
+    let lowestXp = Math.min(...rows.map(row => Number(row.dataset.xp)));
+
+    updates.forEach(update => {
+      let row = grid.querySelector(`:scope > .row[data-user-id="${update.id}"]`);
+
+      if (row) {
+        updateRow(row, update);
+        return;
+      }
+
+      // We can only add rows for people we have enough information about, and who actually belong on this page.
+      // Anything beyond that needs a fresh page load.
+      let belongsHere = update.xp.total > lowestXp || (firstPage === 'true' && rows.length < Number(pageSize));
+
+      if (!update.name || !belongsHere) {
+        return;
+      }
+
+      row = rows[0].cloneNode(true);
+      row.classList.remove('highlighted');
+      row.dataset.userId = update.id;
+      row.querySelector('.name').textContent = update.name;
+      row.querySelector('.avatar').src = update.avatar_url;
+
+      updateRow(row, update);
+      grid.append(row);
+    });
+
+    let ordered = getRows().sort(compareRows);
+
+    ordered.forEach((row, index) => {
+      if (index >= Number(pageSize)) {
+        row.remove();
+        return;
+      }
+
+      row.querySelector('.shaded').textContent = firstRank + index;
+      grid.append(row);
+    });
+  }
+
+  let protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+  let socket = new WebSocket(`${protocol}//${window.location.host}/api/guilds/${guildId}/leaderboard/live`);
+
+  socket.addEventListener('message', event => applyUpdates(JSON.parse(event.data).updates));
+}
+
+if (document.readyState === 'loading') {
+  document.addEventListener('DOMContentLoaded', setupLiveLeaderboard);
+} else {
+  setupLiveLeaderboard();
+}
@@ -6,10 +6,11 @@ from aiohttp.web import (
     Response as Response,
 )
 
-from .core import Route as Route
+from .core import ExecutionPlan as ExecutionPlan, Route as Route
 from .error_boundary import ErrorBoundary as ErrorBoundary
 from .extract import (
     register_extractor as register_extractor,
+    compile_extractor as compile_extractor,
     run_extractor as run_extractor,
     FromRequest as FromRequest,
     Use as Use,
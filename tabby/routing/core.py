@@ -1,5 +1,6 @@
 import contextlib
 import contextvars
+import dataclasses
 import functools
 import inspect
 import re
@@ -106,6 +107,9 @@ class Route(AbstractRouteDef, Generic[ParamsT, ReturnT]):
     kwargs: dict[str, Any]
     """Additional arguments provided to the route definition."""
 
+    plan: "ExecutionPlan"
+    """The route callback's dependencies, as resolved when the route was defined. See `ExecutionPlan`."""
+
     def __init__(
         self,
         method: str,
@@ -133,17 +137,14 @@ class Route(AbstractRouteDef, Generic[ParamsT, ReturnT]):
 
         path_params = set()
 
+        # Parameters don't have to span a whole segment (i.e "/cards/{id}.svg") so every segment is searched in full.
+        # Any parameter found here that the callback doesn't accept is rejected when the callback is compiled.
         for part in path.split("/"):
-            if not part:
-                continue
-
-            match = PATH_PARAMETER_PATTERN.fullmatch(part)
-            if not match:
-                continue
+            for match in PATH_PARAMETER_PATTERN.finditer(part):
+                path_params.add(match.group("name"))
 
-            path_params.add(match.group("name"))
-
-        self.handler = get_handler(callback, path_params=path_params)
+        self.plan = compile_plan(callback, path_params=path_params)
+        self.handler = self.plan.run
         self.original_handler = callback
         self.method = method
         self.path = path
@@ -209,13 +210,55 @@ def _handler_wrapper(func: Callable[ParamsT, ReturnT]) -> Callable[ParamsT, Retu
     return _inner
 
 
-@_handler_wrapper
+@dataclasses.dataclass(frozen=True, slots=True)
+class ExecutionPlan:
+    """A callback's dependencies, resolved once ahead of time.
+
+    Every parameter of the callback is matched to an extractor when the plan is compiled (see `compile_plan`), so that
+    handling a request is only a matter of running each extractor in turn and calling the callback with the results. No
+    signatures or type hints are inspected per request, and the same is true of the dependencies' own dependencies.
+    """
+
+    callback: Callable[..., Awaitable[Any]]
+    """The callback to run, once its dependencies have been extracted."""
+
+    positional: tuple[util.Handler, ...]
+    """The extractors for each positional parameter of the callback, in order."""
+
+    keyword: tuple[tuple[str, util.Handler], ...]
+    """The extractors for each keyword-only parameter of the callback, by name."""
+
+    async def run(self, request: Request) -> Any:
+        """Extract each dependency from `request`, and call the callback with them."""
+
+        args = [await extract(request) for extract in self.positional]
+        kwargs = {name: await extract(request) for name, extract in self.keyword}
+
+        return await self.callback(*args, **kwargs)
+
+
 def get_handler(
     callback: Callable[..., Awaitable[Any]] | Type[BaseModel],
     path_params: set[str] = set(),
 ) -> util.Handler:
+    """Compile `callback` into a request handler. See `compile_plan` for details."""
+
+    return compile_plan(callback, path_params=path_params).run
+
+
+@_handler_wrapper
+def compile_plan(
+    callback: Callable[..., Awaitable[Any]] | Type[BaseModel],
+    path_params: set[str] = set(),
+) -> ExecutionPlan:
+    """Resolve every dependency of `callback` (and their dependencies, recursively) into an `ExecutionPlan`.
+
+    Dependencies are resolved here rather than when a request is handled, so an extractor for a type needs to have been
+    registered by the time something that depends on it is compiled.
+    """
+
     # Necessary to avoid a circular import
-    from .extract import Param, FromRequest, run_extractor
+    from .extract import Param, FromRequest, compile_extractor
 
     unhandled_params = path_params.copy()
     arg_dependencies: list[util.Handler] = []
@@ -281,7 +324,7 @@ def get_handler(
         if isinstance(annotation, FromRequest):
             prerequisite = annotation.from_request
         else:
-            prerequisite = functools.partial(run_extractor, annotation)
+            prerequisite = compile_extractor(annotation)
 
         if parameter.kind in POSITIONAL_PARAM_TYPES:
             arg_dependencies.append(prerequisite)
@@ -301,12 +344,8 @@ def get_handler(
             message=message,
         )
 
-    wrapped_callback = util.maybe_coro(callback)
-
-    async def request_wrapper(request: Request) -> Any:
-        args = [await dependency(request) for dependency in arg_dependencies]
-        kwargs = {name: await dependency(request) for name, dependency in kwarg_dependencies.items()}
-
-        return await wrapped_callback(*args, **kwargs)
-
-    return request_wrapper
+    return ExecutionPlan(
+        callback=util.maybe_coro(callback),
+        positional=tuple(arg_dependencies),
+        keyword=tuple(kwarg_dependencies.items()),
+    )
@@ -20,6 +20,11 @@ from .exceptions import (
 
 
 EXTRACTORS: dict[type, util.Handler] = {}
+# Types whose extractors must run every time they're used, rather than once per request.
+UNCACHED_EXTRACTORS: set[type] = set()
+
+# The key that each request's dependency cache is stored under. See `Use`.
+DEPENDENCY_CACHE = "tabby.routing.dependency_cache"
 
 
 @typing.runtime_checkable
@@ -31,11 +36,23 @@ ExtractorT = TypeVar("ExtractorT")
 
 
 class Use:
-    """The base extractor type, allowing dependency injection from a request."""
+    """The base extractor type, allowing dependency injection from a request.
+
+    Dependencies are cached for the lifetime of each request, keyed by the dependency itself. No matter how many
+    parameters (or other dependencies) ask for the same dependency, it's only extracted once per request, and each of
+    them receives the same value.
+
+    Pass `cache=False` for dependencies that need to be extracted afresh each time they're used. Extractors can opt out
+    for every use of their type when they're registered (see `register_extractor`).
+    """
 
+    _dependency: Any
     _handler: util.Handler
+    _cache: bool
 
-    def __init__(self, dependency: Any) -> None:
+    def __init__(self, dependency: Any, *, cache: bool = True) -> None:
+        self._dependency = dependency
+        self._cache = cache and not _is_uncached_type(dependency)
         type_extractor = _extractor_for_type(dependency)
 
         if type_extractor is not None:
@@ -51,7 +68,21 @@ class Use:
             )
 
     async def from_request(self, request: Request) -> Any:
-        return await self._handler(request)
+        if not self._cache:
+            return await self._handler(request)
+
+        cache: dict[Any, Any] | None = request.get(DEPENDENCY_CACHE)
+
+        if cache is None:
+            cache = request[DEPENDENCY_CACHE] = {}
+
+        if self._dependency in cache:
+            return cache[self._dependency]
+
+        # Failures aren't cached, so a dependency that failed is tried again if it's asked for again.
+        value = cache[self._dependency] = await self._handler(request)
+
+        return value
 
 
 InnerT = TypeVar("InnerT", bound=BaseModel)
@@ -155,6 +186,10 @@ class Query(Generic[InnerT]):
             )
 
 
+def _is_uncached_type(dependency: Any) -> bool:
+    return isinstance(dependency, type) and any(base in UNCACHED_EXTRACTORS for base in dependency.__mro__)
+
+
 def _extractor_for_type(dependency: Any) -> util.Handler | None:
     if not isinstance(dependency, type):
         return None
@@ -177,24 +212,48 @@ async def run_extractor(dependency: Any, request: Request) -> Any:
     `request` is the request instance to extract from.
 
     Any errors that occur during extraction will be wrapped in `ExtractionError`.
+
+    The dependency is resolved from scratch on every call. When the same dependency is extracted over and over (i.e
+    once per request), use `compile_extractor` instead.
     """
 
-    try:
-        return await Use(dependency).from_request(request)
-    except RouteError:
-        raise
-    except Exception as error:
-        raise ExtractorError(
-            extractor=dependency,
-            original=error,
-            message="running extractors failed",
-        )
+    return await compile_extractor(dependency)(request)
+
 
+def compile_extractor(dependency: Any) -> util.Handler:
+    """Resolve `dependency` ahead of time, returning a handler that extracts it from a request.
 
-def register_extractor(type_: type) -> Callable[[Callable[ParamsT, Awaitable[ReturnT]]], Callable[ParamsT, Awaitable[ReturnT]]]:
+    The handler behaves exactly like `run_extractor`, but the work of resolving the dependency (and its dependencies) is
+    only done once.
+    """
+
+    handler = Use(dependency).from_request
+
+    async def extract(request: Request) -> Any:
+        try:
+            return await handler(request)
+        except RouteError:
+            raise
+        except Exception as error:
+            raise ExtractorError(
+                extractor=dependency,
+                original=error,
+                message="running extractors failed",
+            )
+
+    return extract
+
+
+def register_extractor(
+    type_: type,
+    *,
+    cache: bool = True,
+) -> Callable[[Callable[ParamsT, Awaitable[ReturnT]]], Callable[ParamsT, Awaitable[ReturnT]]]:
     """A decorator that registers an asynchronous function as an extractor for a specific type.
 
     The wrapped function will be used to extract values annotated with the specified type or one of its subclasses.
+
+    If `cache` is false, the extractor runs every time a value of this type is asked for, rather than once per request.
     """
 
     def wrapper(func: Callable[ParamsT, Awaitable[ReturnT]]) -> Callable[ParamsT, Awaitable[ReturnT]]:
@@ -208,16 +267,20 @@ def register_extractor(type_: type) -> Callable[[Callable[ParamsT, Awaitable[Ret
 
         EXTRACTORS[base_type] = injected
 
+        if not cache:
+            UNCACHED_EXTRACTORS.add(base_type)
+
         return func  # type: ignore
 
     return wrapper
 
 
-@register_extractor(Request)
+# These are cheaper to extract than to look up.
+@register_extractor(Request, cache=False)
 async def _extract_request(request: Request) -> Request:
     return request
 
 
-@register_extractor(Application)
+@register_extractor(Application, cache=False)
 async def _extract_app(request: Request) -> Application:
     return request.app
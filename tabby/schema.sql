@@ -7,6 +7,10 @@ CREATE TABLE IF NOT EXISTS tabby.levels (
     PRIMARY KEY (guild_id, user_id)
 );
 
+-- Ranking is ordered by `(total_xp, user_id)` so that ties are broken consistently. This index lets us find a member's
+-- neighbours on the leaderboard with a range scan, instead of numbering every row in the guild.
+CREATE INDEX IF NOT EXISTS levels_ranking_idx ON tabby.levels (guild_id, total_xp, user_id);
+
 CREATE OR REPLACE VIEW tabby.leaderboard AS
 SELECT
     guild_id,
@@ -14,8 +18,37 @@ SELECT
     row_number() OVER most_xp AS leaderboard_position,
     total_xp
 FROM tabby.levels
-WINDOW most_xp AS (PARTITION BY guild_id ORDER BY total_xp DESC)
-ORDER BY guild_id, total_xp DESC;
+WINDOW most_xp AS (PARTITION BY guild_id ORDER BY total_xp DESC, user_id DESC)
+ORDER BY guild_id, total_xp DESC, user_id DESC;
+
+-- XP awarded to each member, bucketed by day (in UTC). Windowed leaderboards (weekly, monthly) are built by summing
+-- these buckets rather than scanning individual awards. Days older than the configured retention period are compacted
+-- into `tabby.monthly_xp`.
+CREATE TABLE IF NOT EXISTS tabby.daily_xp (
+    guild_id BIGINT NOT NULL,
+    day DATE NOT NULL,
+    user_id BIGINT NOT NULL,
+    xp BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, day, user_id)
+);
+
+-- `month` is always the first day of the month that the bucket covers.
+CREATE TABLE IF NOT EXISTS tabby.monthly_xp (
+    guild_id BIGINT NOT NULL,
+    month DATE NOT NULL,
+    user_id BIGINT NOT NULL,
+    xp BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, month, user_id)
+);
+
+-- A daily snapshot of each guild's leaderboard ordering. `user_ids` holds the guild's members in leaderboard order, so a
+-- member's past position is their index in the array, found with a single primary key lookup.
+CREATE TABLE IF NOT EXISTS tabby.rank_snapshots (
+    guild_id BIGINT NOT NULL,
+    taken_on DATE NOT NULL,
+    user_ids BIGINT[] NOT NULL,
+    PRIMARY KEY (guild_id, taken_on)
+);
 
 CREATE OR REPLACE VIEW tabby.user_count AS
 SELECT guild_id, COUNT(*) AS total_users
@@ -39,3 +72,42 @@ CREATE TABLE IF NOT EXISTS tabby.user_accounts (
     -- `account_info` is the encrypted JSON payload, containing an access token and refresh token.
     account_info BYTEA NOT NULL
 );
+
+-- Guild groups let a network of servers share a combined leaderboard. Guilds opt in individually.
+CREATE TABLE IF NOT EXISTS tabby.guild_groups (
+    group_id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tabby.guild_group_members (
+    guild_id BIGINT PRIMARY KEY,
+    group_id INT NOT NULL REFERENCES tabby.guild_groups ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS guild_group_members_group_idx ON tabby.guild_group_members (group_id);
+
+-- Each user's XP summed across every guild in a group. This is kept up to date incrementally from the XP write path,
+-- so that group leaderboards never need to aggregate `tabby.levels`.
+CREATE TABLE IF NOT EXISTS tabby.group_levels (
+    group_id INT NOT NULL REFERENCES tabby.guild_groups ON DELETE CASCADE,
+    user_id BIGINT NOT NULL,
+    total_xp BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (group_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS group_levels_ranking_idx ON tabby.group_levels (group_id, total_xp, user_id);
+
+CREATE OR REPLACE VIEW tabby.group_leaderboard AS
+SELECT
+    group_id,
+    user_id,
+    row_number() OVER most_xp AS leaderboard_position,
+    total_xp
+FROM tabby.group_levels
+WINDOW most_xp AS (PARTITION BY group_id ORDER BY total_xp DESC, user_id DESC)
+ORDER BY group_id, total_xp DESC, user_id DESC;
+
+CREATE OR REPLACE VIEW tabby.group_user_count AS
+SELECT group_id, COUNT(*) AS total_users
+FROM tabby.group_levels
+GROUP BY group_id;
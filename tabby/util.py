@@ -5,13 +5,17 @@ import dataclasses
 import json
 import logging
 import math
-from asyncio import Queue, Task
+import time
+from pathlib import Path
+from asyncio import LifoQueue, Task
+from concurrent.futures import Executor
 from typing import Any, Awaitable, Callable, Coroutine, Generic, Hashable, Iterable, Mapping, MutableMapping, Type, TypeVar
 from asyncpg import Record
 
 import pydantic
 from cryptography.fernet import Fernet
 from discord import Asset, DefaultAvatar, Enum, User
+from discord.backoff import ExponentialBackoff
 from discord.state import ConnectionState
 from discord.ext.commands import Context
 from pydantic import BaseModel
@@ -150,6 +154,46 @@ class _TTL(Generic[ValueT]):
         self.task = task
 
 
+class SingleFlight(Generic[KeyT, ValueT]):
+    """Coalesces concurrent calls that share a key, so that only one of them actually runs.
+
+    While a call for some key is in flight, anybody else asking for the same key waits on that call and receives its
+    result (or exception) instead of starting their own. Results aren't kept around afterwards; that's what caches are
+    for.
+    """
+
+    coalesced: int
+    """The number of calls that were served by joining a call that was already in flight."""
+
+    _in_flight: dict[KeyT, Task[ValueT]]
+
+    def __init__(self) -> None:
+        self.coalesced = 0
+        self._in_flight = {}
+
+    async def run(self, key: KeyT, function: Callable[[], Awaitable[ValueT]]) -> ValueT:
+        """Return the result of `function()`, or of the call already in flight for `key` if there is one."""
+
+        task = self._in_flight.get(key)
+
+        if task is None:
+            task = self._in_flight[key] = asyncio.ensure_future(function())
+            task.add_done_callback(lambda _: self._finish(key, task))
+        else:
+            self.coalesced += 1
+
+        # Other callers might be waiting on this call too, so it shouldn't be cancelled just because one of them was.
+        return await asyncio.shield(task)
+
+    def _finish(self, key: KeyT, task: Task[ValueT]):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+        # If every caller was cancelled, nobody is left to retrieve the exception; this keeps asyncio from complaining.
+        if not task.cancelled():
+            task.exception()
+
+
 class Codeblock:
     """A codeblock on Discord"""
 
@@ -290,34 +334,285 @@ class _State(Enum):
 
 
 class DriverPool:
-    _drivers: list[Firefox]
-    _available: Queue[Firefox]
+    """A pool of web drivers, which keeps itself healthy and sizes itself to match demand.
 
-    def __init__(self) -> None:
-        self._drivers = []
-        self._available = Queue()
+    The pool holds between `min_size` and `max_size` drivers. Drivers are spawned lazily, whenever a driver is needed
+    and none are idle, and torn down once they've been idle for `idle_timeout` seconds - so a quiet pool shrinks back
+    down to `min_size` (which may be zero). Once renders start to overlap, the pool also keeps one spare driver warming
+    up ahead of demand, so that a growing queue doesn't leave every render waiting on a spawn. Idle drivers are handed
+    out most recently used first, which lets the rest of the pool go idle (and be torn down) when demand drops.
+
+    Drivers are probed for liveness whenever they're checked out; dead drivers are thrown away rather than handed out.
+    Drivers are also recycled once they've rendered `max_renders` pages, or once their processes' combined memory usage
+    exceeds `max_memory` bytes, since Firefox has a tendency to grow over time.
+    """
+
+    _options: dict[str, Any]
+    _min_size: int
+    _max_size: int
+    _idle_timeout: float
+    _max_renders: int
+    _max_memory: int
+    _executor: Executor | None
+    _drivers: dict[Firefox, _DriverInfo]
+    _available: LifoQueue[Firefox]
+    _spawning: set[Task]
+    _waiting: int
+    _reaper: Task | None
+    _closed: bool
+    _dead: int
+    _recycled: int
+    _reaped: int
+
+    def __init__(
+        self,
+        *,
+        min_size: int = 0,
+        max_size: int = 1,
+        idle_timeout: float = 300,
+        max_renders: int = 1000,
+        max_memory: int = 1024 * 2**20,
+        executor: Executor | None = None,
+    ) -> None:
+        """Create a new (empty) driver pool. Drivers aren't spawned until `setup` is called.
+
+        `min_size` is the number of drivers that are kept around, even when idle.
+        `max_size` is the largest number of drivers that the pool will grow to.
+        `idle_timeout` is the number of seconds a driver may sit idle before it's torn down.
+        `max_renders` is the number of renders after which a driver is recycled.
+        `max_memory` is the amount of memory (in bytes) a driver and its child processes may use before it's recycled.
+        `executor` is where health checks run. If `None`, the event loop's default executor is used. Spawning and quitting
+        drivers always happens in the default executor, since it can take a while.
+        """
+
+        self._options = {}
+        self._min_size = min(min_size, max_size)
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        self._max_renders = max_renders
+        self._max_memory = max_memory
+        self._executor = executor
+        self._drivers = {}
+        self._available = LifoQueue()
+        self._spawning = set()
+        self._waiting = 0
+        self._reaper = None
+        self._closed = False
+        self._dead = 0
+        self._recycled = 0
+        self._reaped = 0
 
     def __del__(self):
         for driver in self._drivers:
             driver.quit()
 
-    async def setup(self, *, driver_count: int, **kwargs) -> None:
-        def _build_driver():
-            driver = Firefox(**kwargs)
+    async def setup(self, **kwargs) -> None:
+        """Spawn the pool's minimum number of drivers, passing `kwargs` to the `Firefox` constructor.
 
-            self._drivers.append(driver)
-            self._available.put_nowait(driver)
+        The same arguments are used for every driver spawned afterwards, whether it's spawned on demand or to replace a
+        dead or recycled driver.
+        """
 
-        loop = asyncio.get_running_loop()
-        futures = [loop.run_in_executor(None, _build_driver) for _ in range(driver_count)]
+        self._options = kwargs
+        self._reaper = asyncio.create_task(self._reap_idle_drivers())
+
+        tasks = [self._spawn() for _ in range(self._min_size)]
+
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def close(self) -> None:
+        """Quit every driver in the pool. The pool can't be used afterwards."""
+
+        self._closed = True
 
-        await asyncio.wait(futures)
+        if self._reaper is not None:
+            self._reaper.cancel()
+
+        for task in self._spawning:
+            task.cancel()
+
+        drivers = [*self._drivers]
+        self._drivers.clear()
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, _quit_driver, driver) for driver in drivers))
 
     def get(self) -> DriverGuard:
         """Retrieve a driver from the pool"""
 
         return DriverGuard(self)
 
+    def state(self) -> DriverPoolState:
+        """Return a snapshot of the pool's current state."""
+
+        drivers = [
+            DriverState(session_id=driver.session_id, renders=info.renders, busy=info.busy)
+            for driver, info in self._drivers.items()
+        ]
+
+        return DriverPoolState(
+            idle=sum(not driver.busy for driver in drivers),
+            busy=sum(driver.busy for driver in drivers),
+            spawning=len(self._spawning),
+            waiting=self._waiting,
+            dead=self._dead,
+            recycled=self._recycled,
+            reaped=self._reaped,
+            drivers=drivers,
+        )
+
+    @property
+    def _size(self) -> int:
+        return len(self._drivers) + len(self._spawning)
+
+    def _spawn(self) -> Task:
+        task = asyncio.create_task(self._spawn_driver())
+        self._spawning.add(task)
+        task.add_done_callback(self._spawning.discard)
+
+        return task
+
+    async def _spawn_driver(self):
+        loop = asyncio.get_running_loop()
+        backoff = ExponentialBackoff()
+
+        while True:
+            try:
+                driver = await loop.run_in_executor(None, lambda: Firefox(**self._options))
+            except Exception as error:
+                delay = backoff.delay()
+                LOGGER.error("failed to spawn web driver, trying again in %d seconds", delay, exc_info=error)
+
+                await asyncio.sleep(delay)
+            else:
+                break
+
+        if self._closed:
+            await loop.run_in_executor(None, _quit_driver, driver)
+            return
+
+        self._drivers[driver] = _DriverInfo(idle_since=time.monotonic())
+        self._available.put_nowait(driver)
+
+    async def _checkout(self) -> Firefox:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            # Anybody already waiting has a driver spawning for them, so we only need to spawn one for ourselves.
+            if self._available.empty() and self._size < self._max_size and len(self._spawning) <= self._waiting:
+                self._spawn()
+
+            self._waiting += 1
+
+            try:
+                driver = await self._available.get()
+            finally:
+                self._waiting -= 1
+
+            # Drivers that were torn down for being idle are left in the queue, and skipped over here.
+            if driver not in self._drivers:
+                continue
+
+            try:
+                alive = await loop.run_in_executor(self._executor, _is_alive, driver)
+            except BaseException:
+                # Whoever wanted the driver gave up on it (i.e they were cancelled), so it goes back for somebody else.
+                if driver in self._drivers:
+                    self._available.put_nowait(driver)
+
+                raise
+
+            # Probing happens in an executor, so the pool can be closed (or the driver reaped) in the meantime.
+            if driver not in self._drivers:
+                continue
+
+            if alive:
+                self._drivers[driver].busy = True
+                self._prewarm()
+
+                return driver
+
+            LOGGER.warning("web driver %s failed its liveness probe; replacing it", driver.session_id)
+
+            self._dead += 1
+            self._discard(driver)
+
+    async def _checkin(self, driver: Firefox, *, failed: bool):
+        # The pool might have been closed while the driver was on loan, in which case it has already been quit.
+        if (info := self._drivers.get(driver)) is None:
+            return
+
+        info.busy = False
+        info.renders += 1
+
+        loop = asyncio.get_running_loop()
+
+        # A driver that raised an exception might have crashed, so it's probed again before anybody else gets it.
+        alive = not failed or await loop.run_in_executor(self._executor, _is_alive, driver)
+
+        # Probing happens in an executor, so the pool can be closed in the meantime - here, and again below.
+        if driver not in self._drivers:
+            return
+
+        if not alive:
+            LOGGER.warning("web driver %s died while rendering; replacing it", driver.session_id)
+
+            self._dead += 1
+            self._discard(driver)
+            return
+
+        if info.renders >= self._max_renders:
+            LOGGER.info("recycling web driver %s after %d renders", driver.session_id, info.renders)
+        elif (memory := await loop.run_in_executor(self._executor, _driver_memory, driver)) > self._max_memory:
+            LOGGER.info("recycling web driver %s, which is using %d bytes of memory", driver.session_id, memory)
+        elif driver not in self._drivers:
+            return
+        else:
+            info.idle_since = time.monotonic()
+            self._available.put_nowait(driver)
+            return
+
+        self._recycled += 1
+        self._discard(driver)
+
+    def _prewarm(self):
+        # A lone render doesn't need a spare driver, but once renders overlap it's likely that more are on the way.
+        busy = sum(info.busy for info in self._drivers.values())
+        idle = len(self._drivers) - busy
+
+        if busy > 1 and idle == 0 and not self._spawning and self._size < self._max_size:
+            LOGGER.debug("%d web drivers busy; spawning a spare", busy)
+            self._spawn()
+
+    async def _reap_idle_drivers(self):
+        while True:
+            await asyncio.sleep(max(self._idle_timeout / 4, 1))
+
+            now = time.monotonic()
+            excess = len(self._drivers) - self._min_size
+            idle = [
+                driver
+                for driver, info in self._drivers.items()
+                if not info.busy and now - info.idle_since >= self._idle_timeout
+            ]
+
+            for driver in idle[: max(excess, 0)]:
+                LOGGER.info("tearing down web driver %s after %d idle seconds", driver.session_id, self._idle_timeout)
+
+                self._reaped += 1
+                self._discard(driver, replace=False)
+
+    def _discard(self, driver: Firefox, *, replace: bool = True):
+        del self._drivers[driver]
+
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(None, _quit_driver, driver)
+
+        # Replacements are only needed if somebody's waiting, or if the pool would drop below its minimum size.
+        if replace and not self._closed and (self._waiting > 0 or self._size < self._min_size):
+            self._spawn()
+
 
 class DriverGuard:
     _loaned: Firefox
@@ -327,12 +622,105 @@ class DriverGuard:
         self._pool = pool
 
     async def __aenter__(self) -> Firefox:
-        driver = self._loaned = await self._pool._available.get()
+        driver = self._loaned = await self._pool._checkout()
 
         return driver
 
-    async def __aexit__(self, *_):
-        self._pool._available.put_nowait(self._loaned)
+    async def __aexit__(self, exc_type, *_):
+        await self._pool._checkin(self._loaned, failed=exc_type is not None)
+
+
+@dataclasses.dataclass(slots=True)
+class _DriverInfo:
+    renders: int = 0
+    busy: bool = False
+    idle_since: float = 0
+
+
+class DriverState(BaseModel):
+    session_id: str
+    """The driver's WebDriver session ID."""
+
+    renders: int
+    """The number of renders the driver has completed."""
+
+    busy: bool
+    """Whether the driver is currently checked out."""
+
+
+class DriverPoolState(BaseModel):
+    idle: int
+    """The number of drivers waiting to be checked out."""
+
+    busy: int
+    """The number of drivers currently checked out."""
+
+    spawning: int
+    """The number of drivers currently being spawned."""
+
+    waiting: int
+    """The number of renders waiting for a driver to become available."""
+
+    dead: int
+    """The total number of drivers that were found dead (and replaced) since the pool was created."""
+
+    recycled: int
+    """The total number of drivers that were recycled since the pool was created."""
+
+    reaped: int
+    """The total number of drivers that were torn down for being idle since the pool was created."""
+
+    drivers: list[DriverState]
+    """The state of each live driver in the pool."""
+
+
+def _is_alive(driver: Firefox) -> bool:
+    try:
+        return driver.execute_script("return true") is True
+    except Exception:
+        return False
+
+
+def _quit_driver(driver: Firefox):
+    try:
+        driver.quit()
+    except Exception as error:
+        LOGGER.debug("error while quitting web driver", exc_info=error)
+
+
+def _driver_memory(driver: Firefox) -> int:
+    # geckodriver is the parent of the browser (and all of its content processes) so we count everything beneath it.
+    try:
+        pid = driver.service.process.pid  # type: ignore
+    except AttributeError:
+        return 0
+
+    return process_tree_memory(pid)
+
+
+def process_tree_memory(pid: int) -> int:
+    """Return the resident set size (in bytes) of the process with the ID `pid` and all of its descendants.
+
+    This reads from `/proc`, so it's only supported on Linux. On other platforms, this function returns 0.
+    """
+
+    total = 0
+
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                total += int(line.split()[1]) * 1024
+
+        children = [
+            int(child)
+            for task in Path(f"/proc/{pid}/task").iterdir()
+            for child in (task / "children").read_text().split()
+        ]
+    except OSError:
+        # The process went away while we were looking at it, or we're not on Linux.
+        return total
+
+    return total + sum(map(process_tree_memory, children))
 
 
 def task_exception(tasks: Iterable[Task]) -> BaseException | None:
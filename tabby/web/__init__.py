@@ -6,11 +6,12 @@ from typing import Annotated, Any
 
 import slugify
 from aiohttp import web
-from aiohttp.web import HTTPException
+from aiohttp.web import HTTPException, HTTPServiceUnavailable
 from jinja2 import Environment, FileSystemLoader
 from multidict import CIMultiDict
 from pydantic import ValidationError
 
+from .live import LeaderboardFeed
 from .session import Session, SessionStorage
 from .template import Templates
 from .. import routing
@@ -61,20 +62,33 @@ def setup_application(bot: Tabby) -> Application:
         pages.invite,
         pages.guild_dashboard,
         pages.guild_leaderboard,
+        pages.guild_group,
         pages.guild_autoroles,
         pages.guild_autoroles_edit,
         pages.guild_autoroles_delete,
         pages.guild_settings,
         pages.guild_settings_edit,
+        # This needs to come first, or the PNG route would match it too (with a member ID of "<id>.svg").
+        pages.rank_card_svg,
         pages.rank_card,
         endpoints.callback,
         endpoints.guild_leaderboard,
+        endpoints.guild_leaderboard_live,
+        endpoints.guild_leaderboard_image,
+        endpoints.group_leaderboard,
+        endpoints.guild_member_neighbors,
+        endpoints.guild_member_rank_change,
         endpoints.guild_member_profile,
         *static_files,
     ]
 
+    feed = LeaderboardFeed(bot, interval=1 / bot.config.web.live_updates_per_second)
+    bot.add_listener(feed.on_xp_update)
+
     app = Application(middlewares=middlewares)
     app["bot"] = bot
+    app["leaderboard_feed"] = feed
+    app.on_shutdown.append(lambda _: feed.close())
     bot._web = app
 
     app.add_routes(routes)
@@ -90,7 +104,8 @@ async def error_handler(error: Exception, request: Request) -> Response:
     payload: dict[str, Any] = {"error": f"Internal server error ({type(error).__name__}: {error})"}
 
     if isinstance(error, HTTPException):
-        should_log = error.status >= 400
+        # Being busy is expected during bursts of traffic, and logging every rejection would only add to the load.
+        should_log = error.status >= 400 and not isinstance(error, HTTPServiceUnavailable)
         status = error.status
         cookies = error.cookies
         headers = error.headers.copy()
@@ -156,3 +171,8 @@ def _status_phrase(status: int) -> str:
 @routing.register_extractor(Tabby)
 async def _extract_bot(app: Annotated[Application, Use(Application)]) -> Tabby:
     return app["bot"]
+
+
+@routing.register_extractor(LeaderboardFeed)
+async def _extract_leaderboard_feed(app: Annotated[Application, Use(Application)]) -> LeaderboardFeed:
+    return app["leaderboard_feed"]
@@ -1,24 +1,48 @@
-import asyncio
 import base64
+import enum
+import math
 import random
+from datetime import date, timedelta
 
-from aiohttp.web import HTTPForbidden, HTTPNotFound
-from asyncpg import Record
+from aiohttp import web
+from aiohttp.web import HTTPBadRequest, HTTPForbidden, HTTPNotAcceptable, HTTPNotFound, HTTPServiceUnavailable
+from asyncpg import Connection, Record
+import discord.utils
 from discord import Asset, DefaultAvatar, Enum, NotFound
 from pydantic import BaseModel
-from selenium.webdriver import Firefox
-from selenium.webdriver.common.by import By
 from yarl import URL
 
-from .template import Templates
 from .. import util
 from ..bot import Tabby
 from ..level import LEVELS
+from ..rendering import ImageFormat, RankCard, RankCardGrid, RenderBusy, render_source
+from ..routing import Request, Response
 from ..util import Snowflake
 
 
 CDN_URL = URL("https://cdn.discordapp.com")
 
+# Cards change whenever a member earns XP, so caches should check back often. Thanks to ETags, checking back is cheap.
+PROFILE_CACHE_CONTROL = "public, max-age=60"
+
+# Leaderboard images are drawn in one go, so these keep a single request from turning into an enormous image.
+MAX_LEADERBOARD_IMAGE_CARDS = 25
+MAX_LEADERBOARD_IMAGE_COLUMNS = 4
+
+# Sums each member's XP buckets from `$2` (a date) onwards for the guild `$1`.
+WINDOW_TOTALS_QUERY = """
+    SELECT user_id, sum(xp)::BIGINT AS window_xp
+    FROM
+       (SELECT user_id, xp
+        FROM tabby.daily_xp
+        WHERE guild_id = $1 AND day >= $2
+        UNION ALL
+        SELECT user_id, xp
+        FROM tabby.monthly_xp
+        WHERE guild_id = $1 AND month >= $2) AS buckets
+    GROUP BY user_id
+"""
+
 
 class XPBreakdown(BaseModel):
     total: int
@@ -35,11 +59,43 @@ class LeaderboardEntry(BaseModel):
     rank: int
     level: int
     xp: XPBreakdown
+    window_xp: int | None = None
+    """The XP earned within the leaderboard's time window, or `None` for the all-time leaderboard."""
+
+
+# This is a stdlib `Enum` rather than a `discord.Enum`, since pydantic doesn't know how to validate the latter.
+class LeaderboardWindow(str, enum.Enum):
+    all_time = "all"
+    week = "week"
+    month = "month"
+
+    @property
+    def label(self) -> str:
+        if self is LeaderboardWindow.week:
+            return "This week"
+        elif self is LeaderboardWindow.month:
+            return "This month"
+        else:
+            return "All time"
+
+    def start(self, today: date) -> date | None:
+        """The first day (inclusive) covered by this window, or `None` if the window covers all time.
+
+        Weeks begin on Monday, and both weeks and months are calendar periods in UTC.
+        """
+
+        if self is LeaderboardWindow.week:
+            return today - timedelta(days=today.weekday())
+        elif self is LeaderboardWindow.month:
+            return today.replace(day=1)
+        else:
+            return None
 
 
 class LeaderboardParams(BaseModel):
     page: int = 1
     limit: int = 100
+    window: LeaderboardWindow = LeaderboardWindow.all_time
 
 
 async def get_guild_leaderboard(guild_id: int, params: LeaderboardParams, bot: Tabby) -> list[LeaderboardEntry]:
@@ -48,72 +104,262 @@ async def get_guild_leaderboard(guild_id: int, params: LeaderboardParams, bot: T
     if guild is None:
         raise HTTPNotFound(text="Guild not found")
 
-    query = """
-        SELECT
-            user_id,
-            leaderboard_position,
-            total_xp
-        FROM tabby.leaderboard
-        WHERE guild_id = $1 AND leaderboard_position > $2
-        ORDER BY leaderboard_position ASC
-        LIMIT $3
-    """
-
     result_limit = max(min(params.limit, 100), 0)
     page_offset = max(params.page - 1, 0) * 100
+    window_start = params.window.start(discord.utils.utcnow().date())
+
+    if window_start is None:
+        query = """
+            SELECT
+                user_id,
+                leaderboard_position,
+                total_xp,
+                NULL::BIGINT AS window_xp
+            FROM tabby.leaderboard
+            WHERE guild_id = $1 AND leaderboard_position > $2
+            ORDER BY leaderboard_position ASC
+            LIMIT $3
+        """
+
+        arguments = (guild_id, page_offset, result_limit)
+    else:
+        # Windowed leaderboards are built from the pre-aggregated XP buckets. Any day in the window that's already been
+        # compacted lives in `tabby.monthly_xp`, so we need to include those buckets too. Levels are still derived from
+        # each member's lifetime XP.
+        query = f"""
+            WITH ranked AS
+               (SELECT
+                    user_id,
+                    row_number() OVER (ORDER BY window_xp DESC, user_id DESC) AS leaderboard_position,
+                    window_xp
+                FROM ({WINDOW_TOTALS_QUERY}) AS totals)
+            SELECT
+                ranked.user_id,
+                ranked.leaderboard_position,
+                coalesce(levels.total_xp, 0) AS total_xp,
+                ranked.window_xp
+            FROM ranked
+            LEFT JOIN tabby.levels ON levels.guild_id = $1 AND levels.user_id = ranked.user_id
+            WHERE ranked.leaderboard_position > $3
+            ORDER BY ranked.leaderboard_position ASC
+            LIMIT $4
+        """
+
+        arguments = (guild_id, window_start, page_offset, result_limit)
 
     async with bot.db() as connection:
-        records = await connection.fetch(query, guild_id, page_offset, result_limit)
+        records = await connection.fetch(query, *arguments)
+
+    return [
+        await _leaderboard_entry(
+            record["user_id"],
+            record["leaderboard_position"],
+            record["total_xp"],
+            bot,
+            window_xp=record["window_xp"],
+        )
+        for record in records
+    ]
 
-    results: list[LeaderboardEntry] = []
-    for record in records:
-        user_id: int = record["user_id"]
 
-        try:
-            user = bot.get_user(user_id) or await bot.fetch_user(user_id)
-        except NotFound:
-            user = None
+async def get_guild_user_count(guild_id: int, window: LeaderboardWindow, bot: Tabby) -> int:
+    """Return the number of members on a guild's leaderboard for the specified `window`."""
 
-        if user:
-            avatar_url = user.display_avatar.url
-            name = user.name
-            discriminator = user.discriminator
+    window_start = window.start(discord.utils.utcnow().date())
+
+    async with bot.db() as connection:
+        if window_start is None:
+            query = """
+                SELECT total_users
+                FROM tabby.user_count
+                WHERE guild_id = $1
+            """
+
+            total_users = await connection.fetchval(query, guild_id)
         else:
-            avatar_index = random.randrange(0, len(DefaultAvatar))
-            avatar_url = Asset._from_default_avatar(bot._connection, avatar_index).url
-            name = "(unknown user)"
-            discriminator = 0
-
-        level_info = LEVELS.get(record["total_xp"])
-
-        xp = XPBreakdown(
-            total=level_info.xp,
-            this_level=level_info.gained_xp,
-            next_level=level_info.gained_xp + level_info.remaining_xp,
-            progress=level_info.progress,
-        )
+            query = f"""
+                SELECT count(*)
+                FROM ({WINDOW_TOTALS_QUERY}) AS totals
+            """
 
-        entry = LeaderboardEntry(
-            id=Snowflake(user_id),
-            name=name,
-            discriminator=f"{discriminator:0>4}",
-            avatar_url=avatar_url,
-            rank=record["leaderboard_position"],
-            level=level_info.level,
-            xp=xp,
-        )
+            total_users = await connection.fetchval(query, guild_id, window_start)
 
-        results.append(entry)
+    return total_users or 0
 
-    return results
 
+class NeighborParams(BaseModel):
+    radius: int = 5
 
-async def get_guild_member_profile(
+
+async def get_guild_member_neighbors(
     guild_id: int,
     member_id: int,
-    templates: Templates,
+    params: NeighborParams,
+    bot: Tabby,
+) -> list[LeaderboardEntry]:
+    """Return the leaderboard entries surrounding a member, including the member themselves.
+
+    At most `params.radius` entries are returned on either side of the member's own entry. Rather than paging through
+    `tabby.leaderboard`, this walks the `levels_ranking_idx` index outwards from the member's position.
+    """
+
+    guild = bot.get_guild(guild_id)
+
+    if guild is None:
+        raise HTTPNotFound(text="Guild not found")
+
+    # Rows are ranked by `(total_xp, user_id)` in descending order, which matches `tabby.leaderboard` and lets the
+    # row-wise comparisons below use the index directly. The member's position is the number of rows ranked above them,
+    # plus one.
+    query = """
+        WITH target AS
+           (SELECT user_id, total_xp
+            FROM tabby.levels
+            WHERE guild_id = $1 AND user_id = $2),
+        above AS
+           (SELECT levels.user_id, levels.total_xp
+            FROM tabby.levels, target
+            WHERE guild_id = $1 AND (levels.total_xp, levels.user_id) > (target.total_xp, target.user_id)
+            ORDER BY levels.total_xp ASC, levels.user_id ASC
+            LIMIT $3),
+        below AS
+           (SELECT levels.user_id, levels.total_xp
+            FROM tabby.levels, target
+            WHERE guild_id = $1 AND (levels.total_xp, levels.user_id) < (target.total_xp, target.user_id)
+            ORDER BY levels.total_xp DESC, levels.user_id DESC
+            LIMIT $3),
+        position AS
+           (SELECT count(*) + 1 AS leaderboard_position
+            FROM tabby.levels, target
+            WHERE guild_id = $1 AND (levels.total_xp, levels.user_id) > (target.total_xp, target.user_id))
+        SELECT user_id, total_xp, (user_id = $2) AS is_target, position.leaderboard_position
+        FROM (SELECT * FROM target UNION ALL SELECT * FROM above UNION ALL SELECT * FROM below) AS neighbors, position
+        ORDER BY total_xp DESC, user_id DESC
+    """
+
+    radius = max(min(params.radius, 25), 0)
+
+    async with bot.db() as connection:
+        records = await connection.fetch(query, guild_id, member_id, radius)
+
+    target_index = next((index for index, record in enumerate(records) if record["is_target"]), None)
+
+    if target_index is None:
+        raise HTTPNotFound(text="Member has no XP in this guild")
+
+    target_position: int = records[target_index]["leaderboard_position"]
+
+    return [
+        await _leaderboard_entry(record["user_id"], target_position + index - target_index, record["total_xp"], bot)
+        for index, record in enumerate(records)
+    ]
+
+
+async def _leaderboard_entry(
+    user_id: int,
+    rank: int,
+    total_xp: int,
     bot: Tabby,
-) -> bytes:
+    *,
+    window_xp: int | None = None,
+) -> LeaderboardEntry:
+    try:
+        user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+    except NotFound:
+        user = None
+
+    if user:
+        avatar_url = user.display_avatar.url
+        name = user.name
+        discriminator = user.discriminator
+    else:
+        avatar_index = random.randrange(0, len(DefaultAvatar))
+        avatar_url = Asset._from_default_avatar(bot._connection, avatar_index).url
+        name = "(unknown user)"
+        discriminator = 0
+
+    return LeaderboardEntry(
+        id=Snowflake(user_id),
+        name=name,
+        discriminator=f"{discriminator:0>4}",
+        avatar_url=avatar_url,
+        rank=rank,
+        level=LEVELS.get(total_xp).level,
+        xp=xp_breakdown(total_xp),
+        window_xp=window_xp,
+    )
+
+
+def xp_breakdown(total_xp: int) -> XPBreakdown:
+    level_info = LEVELS.get(total_xp)
+
+    return XPBreakdown(
+        total=level_info.xp,
+        this_level=level_info.gained_xp,
+        next_level=level_info.gained_xp + level_info.remaining_xp,
+        progress=level_info.progress,
+    )
+
+
+class RankChange(BaseModel):
+    rank: int | None
+    """The member's current position on the leaderboard, or `None` if they haven't earned any XP."""
+
+    previous_rank: int | None
+    """The member's position in the most recent snapshot (including one taken earlier today), or `None` if they weren't
+    in it.
+    """
+
+    change: int | None
+    """The number of places the member has moved up since the snapshot. Negative values mean the member moved down."""
+
+    since: date | None
+    """The day the snapshot was taken, or `None` if no snapshots exist for the guild yet."""
+
+
+async def get_guild_member_rank_change(guild_id: int, member_id: int, bot: Tabby) -> RankChange:
+    if bot.get_guild(guild_id) is None:
+        raise HTTPNotFound(text="Guild not found")
+
+    # The previous position is a single primary key lookup on `tabby.rank_snapshots`; the current position walks the
+    # ranking index in the same way as `get_guild_member_neighbors`.
+    query = """
+        WITH target AS
+           (SELECT user_id, total_xp
+            FROM tabby.levels
+            WHERE guild_id = $1 AND user_id = $2),
+        position AS
+           (SELECT count(*) + 1 AS leaderboard_position, EXISTS (SELECT FROM target) AS ranked
+            FROM tabby.levels, target
+            WHERE guild_id = $1 AND (levels.total_xp, levels.user_id) > (target.total_xp, target.user_id)),
+        snapshot AS
+           (SELECT taken_on, array_position(user_ids, $2::BIGINT) AS previous_position
+            FROM tabby.rank_snapshots
+            WHERE guild_id = $1 AND taken_on <= $3
+            ORDER BY taken_on DESC
+            LIMIT 1)
+        SELECT position.*, snapshot.*
+        FROM position
+        LEFT JOIN snapshot ON TRUE
+    """
+
+    async with bot.db() as connection:
+        record = await connection.fetchrow(query, guild_id, member_id, discord.utils.utcnow().date())
+
+    assert record is not None
+
+    rank = record["leaderboard_position"] if record["ranked"] else None
+    previous_rank = record["previous_position"]
+
+    return RankChange(
+        rank=rank,
+        previous_rank=previous_rank,
+        change=None if rank is None or previous_rank is None else previous_rank - rank,
+        since=record["taken_on"],
+    )
+
+
+async def get_guild_member_card(guild_id: int, member_id: int, bot: Tabby) -> RankCard:
     query = """
         WITH missing AS
            (SELECT
@@ -136,7 +382,12 @@ async def get_guild_member_profile(
             guild_id,
             user_id,
             coalesce(result.total_xp, missing.total_xp) AS total_xp,
-            coalesce(result.leaderboard_position, missing.leaderboard_position, 1) AS leaderboard_position
+            coalesce(result.leaderboard_position, missing.leaderboard_position, 1) AS leaderboard_position,
+               (SELECT array_position(user_ids, $2::BIGINT)
+                FROM tabby.rank_snapshots
+                WHERE guild_id = $1 AND taken_on <= $3
+                ORDER BY taken_on DESC
+                LIMIT 1) AS previous_position
         FROM missing
         LEFT JOIN result USING (guild_id, user_id)
     """
@@ -147,39 +398,325 @@ async def get_guild_member_profile(
         raise HTTPNotFound(text="Member not found") from None
 
     async with bot.db() as connection:
-        record = await connection.fetchrow(query, guild_id, member_id)
+        record = await connection.fetchrow(query, guild_id, member_id, discord.utils.utcnow().date())
 
     if record is None:
         raise HTTPNotFound(text="Member/guild not found")
 
-    rank = record["leaderboard_position"]
-    level = LEVELS.get(record["total_xp"])
+    return _rank_card(
+        user.display_avatar.url,
+        user.display_name,
+        user.discriminator,
+        record["total_xp"],
+        record["leaderboard_position"],
+        record["previous_position"],
+    )
+
+
+async def get_guild_member_profile(guild_id: int, member_id: int, bot: Tabby) -> bytes:
+    card = await get_guild_member_card(guild_id, member_id, bot)
+
+    with render_source(guild_id=guild_id):
+        return await render_card(card, bot)
+
+
+async def render_card(card: RankCard, bot: Tabby) -> bytes:
+    try:
+        return await bot.renderer.render(card)
+    except RenderBusy as error:
+        raise _render_busy(error) from None
+
+
+async def get_guild_member_profile_response(
+    guild_id: int,
+    member_id: int,
+    request: Request,
+    bot: Tabby,
+    *,
+    allow_json: bool = False,
+) -> Response:
+    """Build a response containing a member's rank card, in whichever image format the client prefers.
+
+    Clients that don't express a preference (no `Accept` header, or just `*/*`) get a PNG, or - if `allow_json` is true -
+    that same PNG encoded in base64 under the `data` key of a JSON object, which is what older clients expect. WebP (and
+    a raw PNG, where JSON is the default) is only sent to clients that ask for it in their `Accept` header.
+
+    Responses carry an ETag derived from everything visible on the card, so clients (and proxies) that already have the
+    card can skip the transfer - and, because the ETag is known before rendering, the render too.
+    """
+
+    offers = [ImageFormat.webp.content_type, ImageFormat.png.content_type]
+
+    if allow_json:
+        offers.append("application/json")
+
+    content_type = negotiate(request.headers.get("Accept"), offers, default=offers[-1])
+
+    if content_type is None:
+        raise HTTPNotAcceptable(text=f"Rank cards are only available as {', '.join(offers)}")
+
+    format = ImageFormat.webp if content_type == ImageFormat.webp.content_type else ImageFormat.png
+    card = await get_guild_member_card(guild_id, member_id, bot)
+    etag = bot.renderer.key(card, format)
+
+    # Responses differ by `Accept`, so JSON needs an ETag of its own.
+    if content_type == "application/json":
+        etag = f"{etag}-json"
+
+    headers = {"Cache-Control": PROFILE_CACHE_CONTROL, "Vary": "Accept"}
+
+    if (response := _not_modified(request, etag, headers)) is not None:
+        return response
+
+    try:
+        with render_source(guild_id=guild_id):
+            image = await bot.renderer.render_as(card, format)
+    except RenderBusy as error:
+        raise _render_busy(error) from None
+
+    if content_type == "application/json":
+        response = web.json_response({"data": base64.b64encode(image).decode()}, headers=headers)
+    else:
+        response = Response(body=image, content_type=content_type, headers=headers)
+
+    response.etag = etag
+
+    return response
+
+
+async def get_guild_member_profile_svg_response(
+    guild_id: int,
+    member_id: int,
+    request: Request,
+    bot: Tabby,
+) -> Response:
+    """Build a response containing a member's rank card as an SVG image, which skips rasterizing entirely.
+
+    As with `get_guild_member_profile_response`, responses carry an ETag derived from everything visible on the card.
+    """
+
+    card = await get_guild_member_card(guild_id, member_id, bot)
+    etag = bot.vector_renderer.key(card)
+    headers = {"Cache-Control": PROFILE_CACHE_CONTROL}
+
+    if (response := _not_modified(request, etag, headers)) is not None:
+        return response
+
+    image = await bot.vector_renderer.render(card)
+    response = Response(body=image, content_type="image/svg+xml", charset="utf-8", headers=headers)
+    response.etag = etag
+
+    return response
+
+
+def _not_modified(request: Request, etag: str, headers: dict[str, str]) -> Response | None:
+    # `If-None-Match` uses the weak comparison, so weak ETags count as a match too.
+    if any(match.value in (etag, "*") for match in request.if_none_match or ()):
+        response = Response(status=304, headers=headers)
+        response.etag = etag
+
+        return response
+
+    return None
+
+
+def negotiate(accept: str | None, offers: list[str], *, default: str) -> str | None:
+    """Pick the best of `offers` (a list of media types, in order of preference) for the `Accept` header `accept`.
+
+    `default` (one of `offers`) is what clients that don't express a preference get. Any other offer is only picked if
+    the client names it, or at least its type (i.e `image/*`) - a bare `*/*` never selects it. Returns `None` if the
+    client won't accept any of them.
+    """
+
+    if not accept:
+        return default
+
+    ranges: list[tuple[str, float]] = []
+
+    for part in accept.split(","):
+        media_range, *parameters = (piece.strip() for piece in part.split(";"))
+        quality = 1.0
+
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        ranges.append((media_range.lower(), quality))
+
+    def _match(offer: str) -> tuple[float, int]:
+        # The most specific range that matches an offer is the one that decides its quality. More specific matches also
+        # win ties, so that "image/webp, */*" picks WebP over a default that only matched the wildcard.
+        kind = offer.split("/")[0]
+        candidates = [offer, f"{kind}/*", "*/*"] if offer == default else [offer, f"{kind}/*"]
+
+        for specificity, candidate in enumerate(candidates):
+            qualities = [quality for media_range, quality in ranges if media_range == candidate]
+
+            if qualities:
+                return max(qualities), -specificity
+
+        return 0.0, 0
+
+    # Ties that are left over go to the default, then to whichever offer comes first.
+    best = max(offers, key=lambda offer: (*_match(offer), offer == default, -offers.index(offer)))
+
+    return best if _match(best)[0] > 0 else None
+
+
+class LeaderboardImageParams(BaseModel):
+    limit: int = 10
+    columns: int = 2
+
+
+async def get_guild_leaderboard_cards(guild_id: int, limit: int, bot: Tabby) -> list[RankCard]:
+    if bot.get_guild(guild_id) is None:
+        raise HTTPNotFound(text="Guild not found")
+
+    # The top of the leaderboard is a short scan of the ranking index, so there's no need to number the whole guild.
+    query = """
+        WITH snapshot AS
+           (SELECT user_ids
+            FROM tabby.rank_snapshots
+            WHERE guild_id = $1 AND taken_on <= $3
+            ORDER BY taken_on DESC
+            LIMIT 1)
+        SELECT
+            user_id,
+            total_xp,
+            array_position((SELECT user_ids FROM snapshot), levels.user_id) AS previous_position
+        FROM tabby.levels
+        WHERE guild_id = $1
+        ORDER BY total_xp DESC, user_id DESC
+        LIMIT $2
+    """
+
+    async with bot.db() as connection:
+        records = await connection.fetch(query, guild_id, limit, discord.utils.utcnow().date())
+
+    return [
+        _rank_card(*await _card_user(record["user_id"], bot), record["total_xp"], rank, record["previous_position"])
+        for rank, record in enumerate(records, start=1)
+    ]
+
+
+async def get_guild_member_cards(guild_id: int, member_ids: list[int], bot: Tabby) -> list[RankCard]:
+    """Return the rank cards of several members at once, in the order they were given.
+
+    Members without any XP in the guild are left out.
+    """
+
+    if bot.get_guild(guild_id) is None:
+        raise HTTPNotFound(text="Guild not found")
+
+    # Each member's position is counted from the ranking index in the same way as `get_guild_member_neighbors`, so the
+    # cost grows with the number of members asked for rather than with the size of the guild.
+    query = """
+        WITH snapshot AS
+           (SELECT user_ids
+            FROM tabby.rank_snapshots
+            WHERE guild_id = $1 AND taken_on <= $3
+            ORDER BY taken_on DESC
+            LIMIT 1),
+        target AS
+           (SELECT user_id, total_xp
+            FROM tabby.levels
+            WHERE guild_id = $1 AND user_id = ANY($2::BIGINT[]))
+        SELECT
+            target.user_id,
+            target.total_xp,
+            position.leaderboard_position,
+            array_position((SELECT user_ids FROM snapshot), target.user_id) AS previous_position
+        FROM target
+        CROSS JOIN LATERAL
+           (SELECT count(*) + 1 AS leaderboard_position
+            FROM tabby.levels
+            WHERE guild_id = $1 AND (levels.total_xp, levels.user_id) > (target.total_xp, target.user_id)) AS position
+        ORDER BY array_position($2::BIGINT[], target.user_id)
+    """
+
+    async with bot.db() as connection:
+        records = await connection.fetch(query, guild_id, member_ids, discord.utils.utcnow().date())
+
+    return [
+        _rank_card(
+            *await _card_user(record["user_id"], bot),
+            record["total_xp"],
+            record["leaderboard_position"],
+            record["previous_position"],
+        )
+        for record in records
+    ]
+
+
+async def _card_user(user_id: int, bot: Tabby) -> tuple[str, str, str | int]:
+    """Return the avatar URL, name and discriminator to show on a user's rank card."""
+
+    try:
+        user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+    except NotFound:
+        user = None
+
+    if user is None:
+        # The avatar is part of the card's cache key (and ETag), so it has to be the same every time for a given user.
+        avatar_index = (user_id >> 22) % len(DefaultAvatar)
+        return Asset._from_default_avatar(bot._connection, avatar_index).url, "(unknown user)", 0
+
+    return user.display_avatar.url, user.display_name, user.discriminator
+
+
+async def get_guild_leaderboard_image(guild_id: int, params: LeaderboardImageParams, bot: Tabby) -> bytes:
+    limit = max(min(params.limit, MAX_LEADERBOARD_IMAGE_CARDS), 1)
+    columns = max(min(params.columns, MAX_LEADERBOARD_IMAGE_COLUMNS), 1)
+    cards = await get_guild_leaderboard_cards(guild_id, limit, bot)
+
+    if not cards:
+        raise HTTPNotFound(text="Nobody has earned any XP here yet")
+
+    try:
+        with render_source(guild_id=guild_id):
+            return await bot.renderer.render_grid(RankCardGrid(cards=cards, columns=columns))
+    except RenderBusy as error:
+        raise _render_busy(error) from None
+
+
+def _rank_card(
+    avatar_url: str,
+    name: str,
+    discriminator: str | int,
+    total_xp: int,
+    rank: int,
+    previous_rank: int | None,
+) -> RankCard:
+    level = LEVELS.get(total_xp)
 
     if level.level_ceiling:
         required_xp = util.humanize(level.level_ceiling - level.level_floor)
     else:
         required_xp = "???"
 
-    rank_template = templates.environment.get_template("rank.html")
-    raw_page_data = await rank_template.render_async(
-        internal_url=bot.web_url,
-        avatar=user.display_avatar.url,
-        name=user.display_name,
-        tag=f"#{user.discriminator:0>4}",
-        progress=f"{level.progress * 100:2f}%",
+    return RankCard(
+        avatar_url=avatar_url,
+        name=name,
+        tag=f"#{discriminator:0>4}",
+        progress=level.progress,
         current_xp=util.humanize(level.gained_xp),
         required_xp=required_xp,
         level=level.level,
-        rank=f"#{rank:,}",
+        rank=rank,
+        rank_change=None if previous_rank is None else previous_rank - rank,
     )
 
-    page_data = _data_url(raw_page_data, content_type="text/html")
 
-    async with bot.webdrivers.get() as driver:
-        loop = asyncio.get_running_loop()
-        image = await loop.run_in_executor(None, lambda: _render_rank_card(driver, page_data))
-
-    return image
+def _render_busy(error: RenderBusy) -> HTTPServiceUnavailable:
+    return HTTPServiceUnavailable(
+        text="Too many rank cards are being drawn right now. Try again in a few seconds!",
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
 
 
 class Autorole(BaseModel):
@@ -259,6 +796,202 @@ async def remove_guild_autorole(guild_id: int, role_id: int, bot: Tabby):
         await connection.execute(query, guild_id, role_id)
 
 
+class GuildGroup(BaseModel):
+    id: int
+    name: str
+    guild_ids: list[Snowflake]
+
+
+async def get_guild_group(guild_id: int, bot: Tabby) -> GuildGroup | None:
+    """Return the group that the guild with the ID `guild_id` belongs to, or `None` if it isn't part of a group."""
+
+    query = """
+        SELECT group_id
+        FROM tabby.guild_group_members
+        WHERE guild_id = $1
+    """
+
+    async with bot.db() as connection:
+        group_id = await connection.fetchval(query, guild_id)
+
+    return None if group_id is None else await get_group(group_id, bot)
+
+
+async def get_group(group_id: int, bot: Tabby) -> GuildGroup | None:
+    """Return the group with the ID `group_id`, or `None` if no such group exists."""
+
+    query = """
+        SELECT group_id, name, array_agg(guild_id) AS guild_ids
+        FROM tabby.guild_groups
+        INNER JOIN tabby.guild_group_members USING (group_id)
+        WHERE group_id = $1
+        GROUP BY group_id, name
+    """
+
+    async with bot.db() as connection:
+        record = await connection.fetchrow(query, group_id)
+
+    if record is None:
+        return None
+
+    return GuildGroup(
+        id=record["group_id"],
+        name=record["name"],
+        guild_ids=[Snowflake(guild_id) for guild_id in record["guild_ids"]],
+    )
+
+
+async def create_guild_group(guild_id: int, name: str, bot: Tabby) -> int:
+    """Create a new group containing only the guild with the ID `guild_id`, and return the ID of the new group."""
+
+    query = """
+        INSERT INTO tabby.guild_groups(name)
+        VALUES ($1)
+        RETURNING group_id
+    """
+
+    async with bot.db() as connection:
+        async with connection.transaction():
+            group_id: int = await connection.fetchval(query, name)
+            await _add_to_guild_group(connection, guild_id, group_id)
+
+    return group_id
+
+
+async def join_guild_group(guild_id: int, group_id: int, bot: Tabby):
+    """Add the guild with the ID `guild_id` to an existing group, folding its members' XP into the group's totals."""
+
+    async with bot.db() as connection:
+        async with connection.transaction():
+            await _add_to_guild_group(connection, guild_id, group_id)
+
+
+async def leave_guild_group(guild_id: int, bot: Tabby):
+    """Remove the guild with the ID `guild_id` from its group, taking its members' XP out of the group's totals.
+
+    If the guild was the last member of its group, the group is deleted.
+    """
+
+    leave_query = """
+        DELETE FROM tabby.guild_group_members
+        WHERE guild_id = $1
+        RETURNING group_id
+    """
+
+    subtract_query = """
+        UPDATE tabby.group_levels
+        SET total_xp = group_levels.total_xp - levels.total_xp
+        FROM tabby.levels
+        WHERE levels.guild_id = $1 AND group_levels.group_id = $2 AND group_levels.user_id = levels.user_id
+    """
+
+    cleanup_query = """
+        DELETE FROM tabby.group_levels
+        WHERE group_id = $1 AND total_xp <= 0
+    """
+
+    # Deleting the group cascades to whatever's left in `tabby.group_levels`.
+    delete_empty_query = """
+        DELETE FROM tabby.guild_groups
+        WHERE group_id = $1 AND NOT EXISTS (SELECT FROM tabby.guild_group_members WHERE group_id = $1)
+    """
+
+    async with bot.db() as connection:
+        async with connection.transaction():
+            group_id = await connection.fetchval(leave_query, guild_id)
+
+            if group_id is None:
+                return
+
+            await connection.execute(subtract_query, guild_id, group_id)
+            await connection.execute(cleanup_query, group_id)
+            await connection.execute(delete_empty_query, group_id)
+
+
+async def rebuild_guild_group(connection: Connection, guild_id: int):
+    """Recompute the XP totals of the group that the guild with the ID `guild_id` belongs to, if any.
+
+    This is a full aggregation over every guild in the group, so it should only be used after bulk changes to
+    `tabby.levels` (such as imports) that bypass the incremental updates.
+    """
+
+    clear_query = """
+        DELETE FROM tabby.group_levels
+        WHERE group_id = (SELECT group_id FROM tabby.guild_group_members WHERE guild_id = $1)
+    """
+
+    fill_query = """
+        INSERT INTO tabby.group_levels(group_id, user_id, total_xp)
+        SELECT group_id, user_id, sum(levels.total_xp)
+        FROM tabby.guild_group_members
+        INNER JOIN tabby.levels USING (guild_id)
+        WHERE group_id = (SELECT group_id FROM tabby.guild_group_members WHERE guild_id = $1)
+        GROUP BY group_id, user_id
+    """
+
+    await connection.execute(clear_query, guild_id)
+    await connection.execute(fill_query, guild_id)
+
+
+async def _add_to_guild_group(connection: Connection, guild_id: int, group_id: int):
+    join_query = """
+        INSERT INTO tabby.guild_group_members(guild_id, group_id)
+        VALUES ($1, $2)
+    """
+
+    add_query = """
+        INSERT INTO tabby.group_levels(group_id, user_id, total_xp)
+        SELECT $2, user_id, total_xp
+        FROM tabby.levels
+        WHERE guild_id = $1
+        ON CONFLICT ON CONSTRAINT group_levels_pkey
+        DO UPDATE SET total_xp = tabby.group_levels.total_xp + EXCLUDED.total_xp
+    """
+
+    await connection.execute(join_query, guild_id, group_id)
+    await connection.execute(add_query, guild_id, group_id)
+
+
+async def get_group_leaderboard(group_id: int, params: LeaderboardParams, bot: Tabby) -> list[LeaderboardEntry]:
+    if params.window is not LeaderboardWindow.all_time:
+        raise HTTPBadRequest(text="Group leaderboards only support the all-time window")
+
+    query = """
+        SELECT
+            user_id,
+            leaderboard_position,
+            total_xp
+        FROM tabby.group_leaderboard
+        WHERE group_id = $1 AND leaderboard_position > $2
+        ORDER BY leaderboard_position ASC
+        LIMIT $3
+    """
+
+    result_limit = max(min(params.limit, 100), 0)
+    page_offset = max(params.page - 1, 0) * 100
+
+    async with bot.db() as connection:
+        records = await connection.fetch(query, group_id, page_offset, result_limit)
+
+    return [
+        await _leaderboard_entry(record["user_id"], record["leaderboard_position"], record["total_xp"], bot)
+        for record in records
+    ]
+
+
+async def get_group_user_count(group_id: int, bot: Tabby) -> int:
+    query = """
+        SELECT total_users
+        FROM tabby.group_user_count
+        WHERE group_id = $1
+    """
+
+    async with bot.db() as connection:
+        total_users = await connection.fetchval(query, group_id)
+
+    return total_users or 0
+
+
 class Settings(BaseModel):
     stack_autoroles: bool = False
 
@@ -289,16 +1022,3 @@ async def edit_guild_settings(guild_id: int, settings: Settings, bot: Tabby):
 
     async with bot.db() as connection:
         await connection.execute(query, guild_id, settings.stack_autoroles)
-
-
-def _render_rank_card(driver: Firefox, url: URL | str) -> bytes:
-    driver.get(str(url))
-    element = driver.find_element(By.CLASS_NAME, value="container")
-
-    return element.screenshot_as_png
-
-
-def _data_url(content: str, *, content_type: str) -> str:
-    content = base64.b64encode(content.encode()).decode()
-
-    return f"data:{content_type};base64,{content}"
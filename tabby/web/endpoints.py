@@ -1,18 +1,18 @@
-import base64
+import functools
+import json
 import re
-from typing import Annotated
+from typing import Annotated, Any
 
 from aiohttp import web
-from aiohttp.web import HTTPFound
+from aiohttp.web import HTTPFound, HTTPNotFound, WebSocketResponse
 from pydantic import BaseModel
-from selenium.webdriver import Firefox
-from selenium.webdriver.common.by import By
+from pydantic.json import pydantic_encoder
 from yarl import URL
 
 from . import common
-from .common import LeaderboardParams
+from .common import LeaderboardImageParams, LeaderboardParams, NeighborParams
+from .live import LeaderboardFeed
 from .session import AuthorizedSession
-from .template import Templates
 from .. import routing
 from ..bot import Tabby
 from ..routing import Response, Request
@@ -46,29 +46,87 @@ async def guild_leaderboard(
 ) -> Response:
     results = await common.get_guild_leaderboard(guild_id, params, bot)
 
-    return web.json_response(results)
+    return _json_response(results)
 
 
-@routing.get("/api/guilds/{guild_id}/members/{member_id}/profile", name="profile")
-async def guild_member_profile(
+@routing.get("/api/groups/{group_id}/leaderboard")
+async def group_leaderboard(
+    group_id: int,
+    params: Annotated[LeaderboardParams, Query(LeaderboardParams)],
+    bot: Annotated[Tabby, Use(Tabby)],
+) -> Response:
+    results = await common.get_group_leaderboard(group_id, params, bot)
+
+    return _json_response(results)
+
+
+@routing.get("/api/guilds/{guild_id}/leaderboard/live")
+async def guild_leaderboard_live(
+    guild_id: int,
+    request: Annotated[Request, Use(Request)],
+    feed: Annotated[LeaderboardFeed, Use(LeaderboardFeed)],
+    bot: Annotated[Tabby, Use(Tabby)],
+) -> WebSocketResponse:
+    if bot.get_guild(guild_id) is None:
+        raise HTTPNotFound(text="Guild not found")
+
+    socket = WebSocketResponse(heartbeat=30)
+    await socket.prepare(request)
+
+    # Subscribers only ever listen; anything the client sends is ignored.
+    async with feed.subscribe(guild_id, socket):
+        async for _ in socket:
+            pass
+
+    return socket
+
+
+@routing.get("/api/guilds/{guild_id}/leaderboard/image")
+async def guild_leaderboard_image(
+    guild_id: int,
+    params: Annotated[LeaderboardImageParams, Query(LeaderboardImageParams)],
+    bot: Annotated[Tabby, Use(Tabby)],
+) -> Response:
+    image = await common.get_guild_leaderboard_image(guild_id, params, bot)
+
+    return Response(body=image, content_type="image/png")
+
+
+@routing.get("/api/guilds/{guild_id}/members/{member_id}/neighbors")
+async def guild_member_neighbors(
     guild_id: int,
     member_id: int,
-    templates: Annotated[Templates, Use(Templates)],
+    params: Annotated[NeighborParams, Query(NeighborParams)],
     bot: Annotated[Tabby, Use(Tabby)],
 ) -> Response:
-    image = await common.get_guild_member_profile(guild_id, member_id, templates, bot)
+    results = await common.get_guild_member_neighbors(guild_id, member_id, params, bot)
 
-    return web.json_response({"data": base64.b64encode(image).decode()})
+    return _json_response(results)
+
+
+@routing.get("/api/guilds/{guild_id}/members/{member_id}/rank-change")
+async def guild_member_rank_change(
+    guild_id: int,
+    member_id: int,
+    bot: Annotated[Tabby, Use(Tabby)],
+) -> Response:
+    result = await common.get_guild_member_rank_change(guild_id, member_id, bot)
 
+    return _json_response(result)
 
-def _render_rank_card(driver: Firefox, url: URL | str) -> bytes:
-    driver.get(str(url))
-    element = driver.find_element(By.CLASS_NAME, value="container")
 
-    return element.screenshot_as_png
+@routing.get("/api/guilds/{guild_id}/members/{member_id}/profile", name="profile")
+async def guild_member_profile(
+    guild_id: int,
+    member_id: int,
+    request: Annotated[Request, Use(Request)],
+    bot: Annotated[Tabby, Use(Tabby)],
+) -> Response:
+    # Older clients expect the card to be wrapped up in JSON, so they can still ask for that explicitly.
+    return await common.get_guild_member_profile_response(guild_id, member_id, request, bot, allow_json=True)
 
 
-def _data_url(content: str, *, content_type: str) -> str:
-    content = base64.b64encode(content.encode()).decode()
+def _json_response(data: Any) -> Response:
+    # `web.json_response` uses the stdlib JSON encoder by default, which doesn't know what to do with pydantic models.
+    return web.json_response(data, dumps=functools.partial(json.dumps, default=pydantic_encoder))
 
-    return f"data:{content_type};base64,{content}"
@@ -0,0 +1,121 @@
+import asyncio
+import contextlib
+import logging
+from asyncio import Task
+from typing import AsyncIterator
+
+from aiohttp import WSCloseCode
+from aiohttp.web import WebSocketResponse
+from pydantic import BaseModel
+
+from . import common
+from .common import XPBreakdown
+from ..bot import Tabby
+from ..level import LEVELS
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class LiveUpdate(BaseModel):
+    # Snowflakes are sent as strings, since they can't be represented precisely as numbers in JavaScript.
+    id: str
+    name: str | None
+    avatar_url: str | None
+    level: int
+    xp: XPBreakdown
+
+
+class LeaderboardFeed:
+    """Pushes XP changes to WebSocket subscribers, grouped by guild.
+
+    The feed is fed directly from the XP write path (via the `xp_update` event) so that watching a leaderboard never
+    touches the database. Updates are coalesced per guild; a guild's subscribers receive at most one batch of updates
+    every `interval` seconds, and each batch only contains the latest state of each member that changed.
+    """
+
+    _bot: Tabby
+    _interval: float
+    _subscribers: dict[int, set[WebSocketResponse]]
+    _pending: dict[int, dict[int, int]]
+    _flushers: dict[int, Task]
+
+    def __init__(self, bot: Tabby, *, interval: float) -> None:
+        self._bot = bot
+        self._interval = interval
+        self._subscribers = {}
+        self._pending = {}
+        self._flushers = {}
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, guild_id: int, socket: WebSocketResponse) -> AsyncIterator[None]:
+        """Subscribe `socket` to updates for the guild with the ID `guild_id` for the duration of the context manager."""
+
+        self._subscribers.setdefault(guild_id, set()).add(socket)
+
+        try:
+            yield
+        finally:
+            subscribers = self._subscribers[guild_id]
+            subscribers.discard(socket)
+
+            if not subscribers:
+                del self._subscribers[guild_id]
+
+    async def on_xp_update(self, guild_id: int, user_id: int, total_xp: int) -> None:
+        # Nobody's watching, so there's nothing to do.
+        if guild_id not in self._subscribers:
+            return
+
+        self._pending.setdefault(guild_id, {})[user_id] = total_xp
+
+        if guild_id not in self._flushers:
+            self._flushers[guild_id] = asyncio.create_task(self._flush_later(guild_id))
+
+    async def close(self) -> None:
+        """Close every subscribed socket. This should be called when the web application shuts down."""
+
+        for task in self._flushers.values():
+            task.cancel()
+
+        sockets = [socket for subscribers in self._subscribers.values() for socket in subscribers]
+
+        for socket in sockets:
+            await socket.close(code=WSCloseCode.GOING_AWAY, message=b"Server shutdown")
+
+    async def _flush_later(self, guild_id: int) -> None:
+        try:
+            await asyncio.sleep(self._interval)
+        finally:
+            del self._flushers[guild_id]
+
+        pending = self._pending.pop(guild_id, {})
+        subscribers = [*self._subscribers.get(guild_id, ())]
+
+        if not pending or not subscribers:
+            return
+
+        updates = [self._build_update(user_id, total_xp) for user_id, total_xp in pending.items()]
+        payload = {"updates": [update.dict() for update in updates]}
+
+        results = await asyncio.gather(
+            *(socket.send_json(payload) for socket in subscribers),
+            return_exceptions=True,
+        )
+
+        # A subscriber going away mid-send isn't worth making a fuss over; its handler will clean up after it.
+        for error in filter(None, results):
+            LOGGER.debug("failed to push leaderboard update to a subscriber", exc_info=error)
+
+    def _build_update(self, user_id: int, total_xp: int) -> LiveUpdate:
+        # We only use the user cache here. Fetching users would make every update as expensive as a page load, which
+        # defeats the point; the client can fill in the gaps for anybody it doesn't know about.
+        user = self._bot.get_user(user_id)
+
+        return LiveUpdate(
+            id=str(user_id),
+            name=user.name if user else None,
+            avatar_url=user.display_avatar.url if user else None,
+            level=LEVELS.get(total_xp).level,
+            xp=common.xp_breakdown(total_xp),
+        )
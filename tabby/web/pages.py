@@ -8,12 +8,12 @@ from pydantic import BaseModel
 from yarl import URL
 
 from . import common
-from .common import LeaderboardParams, Settings
+from .common import LeaderboardParams, LeaderboardWindow, NeighborParams, Settings
 from .session import AuthorizedSession, Session
 from .template import Templates
 from .. import routing
 from ..bot import Tabby
-from ..routing import Form, Query, Response, Use
+from ..routing import Form, Query, Request, Response, Use
 
 
 DISCORD_OAUTH2_URL = URL("https://discord.com/api/oauth2/authorize")
@@ -22,6 +22,7 @@ DISCORD_OAUTH2_URL = URL("https://discord.com/api/oauth2/authorize")
 class DashboardPage(Enum):
     home = "Home"
     leaderboard = "Leaderboard"
+    group = "Group"
     autoroles = "Autoroles"
     settings = "Settings"
 
@@ -187,12 +188,28 @@ async def guild_dashboard(guild_id: int, ctx: Annotated[WebContext, Use(WebConte
         autorole_count: int = await connection.fetchval(query, guild_id)
 
     leaderboard_preview = await common.get_guild_leaderboard(guild.id, params, ctx.bot)
+    rank_neighbors = []
+
+    if ctx.session.authorized:
+        assert isinstance(ctx.session, AuthorizedSession)
+
+        try:
+            rank_neighbors = await common.get_guild_member_neighbors(
+                guild.id,
+                ctx.session.user.id,
+                NeighborParams(radius=2),
+                ctx.bot,
+            )
+        except HTTPNotFound:
+            # The user hasn't earned any XP in this guild yet, so they don't have a position on the leaderboard.
+            pass
 
     return await ctx.render_dashboard_page(
         "guild_dashboard.html",
         current_guild=guild,
         current_page=DashboardPage.home,
         leaderboard_preview=leaderboard_preview,
+        rank_neighbors=rank_neighbors,
         autorole_count=autorole_count,
     )
 
@@ -204,16 +221,7 @@ async def guild_leaderboard(
     ctx: Annotated[WebContext, Use(WebContext)]
 ) -> Response:
     guild = ctx.check_guild(guild_id)
-
-    query = """
-        SELECT total_users
-        FROM tabby.user_count
-        WHERE guild_id = $1
-    """
-
-    async with ctx.bot.db() as connection:
-        total_users: int = await connection.fetchval(query, guild.id)
-
+    total_users = await common.get_guild_user_count(guild.id, params.window, ctx.bot)
     entries = await common.get_guild_leaderboard(guild.id, params, ctx.bot)
 
     return await ctx.render_dashboard_page(
@@ -223,6 +231,34 @@ async def guild_leaderboard(
         leaderboard_entries=entries,
         leaderboard_page=max(params.page, 1),
         leaderboard_total_pages=math.ceil(total_users / 100),
+        leaderboard_window=params.window,
+        leaderboard_windows=LeaderboardWindow,
+    )
+
+
+@routing.get("/dashboard/{guild_id}/group")
+async def guild_group(
+    guild_id: int,
+    params: Annotated[LeaderboardParams, Query(LeaderboardParams)],
+    ctx: Annotated[WebContext, Use(WebContext)]
+) -> Response:
+    guild = ctx.check_guild(guild_id)
+    group = await common.get_guild_group(guild.id, ctx.bot)
+    entries = []
+    total_users = 0
+
+    if group:
+        total_users = await common.get_group_user_count(group.id, ctx.bot)
+        entries = await common.get_group_leaderboard(group.id, params, ctx.bot)
+
+    return await ctx.render_dashboard_page(
+        "guild_group.html",
+        current_guild=guild,
+        current_page=DashboardPage.group,
+        group=group,
+        leaderboard_entries=entries,
+        leaderboard_page=max(params.page, 1),
+        leaderboard_total_pages=math.ceil(total_users / 100),
     )
 
 
@@ -311,15 +347,21 @@ async def guild_settings_edit(
     raise HTTPFound(f"/dashboard/{guild.id}/settings")
 
 
+@routing.get("/card/{guild_id}/{member_id}.svg")
+async def rank_card_svg(
+    guild_id: int,
+    member_id: int,
+    request: Annotated[Request, Use(Request)],
+    ctx: Annotated[WebContext, Use(WebContext)]
+) -> Response:
+    return await common.get_guild_member_profile_svg_response(guild_id, member_id, request, ctx.bot)
+
+
 @routing.get("/card/{guild_id}/{member_id}")
 async def rank_card(
     guild_id: int,
     member_id: int,
+    request: Annotated[Request, Use(Request)],
     ctx: Annotated[WebContext, Use(WebContext)]
 ) -> Response:
-    image = await common.get_guild_member_profile(guild_id, member_id, ctx.templates, ctx.bot)
-
-    return Response(
-        body=image,
-        content_type="image/png",
-    )
+    return await common.get_guild_member_profile_response(guild_id, member_id, request, ctx.bot)